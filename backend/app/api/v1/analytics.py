@@ -5,22 +5,31 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import List, Optional
-from datetime import date
-from app.db.session import get_db
+from datetime import date, datetime
+from app.db.session import get_analytics_db
 from app.api.deps import get_current_user, require_owner
 from app.models.user import User
 from app.services.alert_service import AlertService, AlertType, AlertSeverity
 from app.services.kpi_calculator import KPICalculator
+from app.services.kpi_rollup_service import KpiRollupService
+from app.services.owner_report_service import OwnerReportService
+from app.services.result_cache import result_cache, SALES, RECIPES, MATRIX
 
 router = APIRouter()
 
+# Scopes of endpoints that do not read variable expenses
+SALES_SCOPES = (SALES, RECIPES, MATRIX)
+
+# Alert types listed in the owner report issues
+OWNER_ISSUE_TYPES = (AlertType.LOW_STOCK.value, AlertType.LOW_MARGIN.value, AlertType.SYNC_ERROR.value)
+
 
 @router.get("/overview")
 def get_overview(
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
     location_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -28,7 +37,11 @@ def get_overview(
     Returns aggregated metrics for the specified period.
     """
     calculator = KPICalculator(db)
-    return calculator.calculate_overview_kpis(from_date, to_date, location_id)
+    return result_cache.get_or_compute(
+        "overview",
+        {"from_date": from_date, "to_date": to_date, "location_id": location_id},
+        lambda: calculator.calculate_overview_kpis(from_date, to_date, location_id)
+    )
 
 
 @router.get("/sales/daily")
@@ -36,7 +49,7 @@ def get_daily_sales(
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
     location_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get daily sales KPIs."""
@@ -65,7 +78,12 @@ def get_daily_sales(
         params['location_id'] = location_id
     
     calculator = KPICalculator(db)
-    return calculator.calculate_daily_kpis(from_date, to_date, location_id)
+    return result_cache.get_or_compute(
+        "sales/daily",
+        {"from_date": from_date, "to_date": to_date, "location_id": location_id},
+        lambda: calculator.calculate_daily_kpis(from_date, to_date, location_id),
+        scopes=SALES_SCOPES
+    )
 
 
 @router.get("/sales/by-product")
@@ -73,7 +91,7 @@ def get_sales_by_product(
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
     location_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get sales grouped by product."""
@@ -128,10 +146,12 @@ def get_sales_by_product(
 @router.get("/inventory/balance")
 def get_inventory_balance(
     location_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get current inventory balance."""
+    # Расход берётся из ingredient_usage_daily: пересобираем изменившиеся дни
+    KpiRollupService(db).ensure_fresh()
     query = """
         SELECT
             ingredient_code,
@@ -182,7 +202,7 @@ def get_owner_report(
     period_start: Optional[date] = None,
     period_end: Optional[date] = None,
     location_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(require_owner)
 ):
     """
@@ -212,165 +232,16 @@ def get_owner_report(
             detail="period_end must be >= period_start"
         )
     
-    # Агрегированный запрос из view vw_owner_report_daily
-    query = """
-        SELECT
-            COALESCE(SUM(sales_count), 0) as transactions_count,
-            COALESCE(SUM(revenue), 0) as revenue_gross,
-            COALESCE(SUM(cogs), 0) as cogs_total,
-            COALESCE(SUM(variable_expenses), 0) as expenses_total,
-            COALESCE(SUM(net_profit), 0) as net_profit
-        FROM vw_owner_report_daily
-        WHERE tx_date >= :from_date AND tx_date <= :to_date
-    """
-    
-    params = {'from_date': period_start, 'to_date': period_end}
-    if location_id:
-        query += " AND location_id = :location_id"
-        params['location_id'] = location_id
-    
-    result = db.execute(text(query), params).fetchone()
-    
-    # Агрегированные значения
-    transactions_count = int(result[0]) if result[0] else 0
-    revenue_gross = float(result[1]) if result[1] else 0.0
-    cogs_total = float(result[2]) if result[2] else 0.0
-    expenses_total = float(result[3]) if result[3] else 0.0
-    net_profit = float(result[4]) if result[4] else 0.0
-    
-    # FALLBACK: если vw_owner_report_daily пустая, используем vw_kpi_daily
-    if transactions_count == 0 and revenue_gross == 0.0:
-        fallback_query = """
-            SELECT
-                COALESCE(SUM(sales_count), 0) as transactions_count,
-                COALESCE(SUM(revenue), 0) as revenue_gross,
-                COALESCE(SUM(cogs), 0) as cogs_total
-            FROM vw_kpi_daily
-            WHERE tx_date >= :from_date AND tx_date <= :to_date
-        """
-        if location_id:
-            fallback_query += " AND location_id = :location_id"
-        
-        fallback_result = db.execute(text(fallback_query), params).fetchone()
-        
-        if fallback_result and fallback_result[0] and fallback_result[0] > 0:
-            transactions_count = int(fallback_result[0])
-            revenue_gross = float(fallback_result[1]) if fallback_result[1] else 0.0
-            cogs_total = float(fallback_result[2]) if fallback_result[2] else 0.0
-            
-            # Расходы из variable_expenses (через vendista_term_id, location_id может быть NULL)
-            expense_query = """
-                SELECT COALESCE(SUM(ve.amount_rub), 0)
-                FROM variable_expenses ve
-                LEFT JOIN vendista_terminals vt ON vt.id = ve.vendista_term_id
-                WHERE ve.expense_date >= :from_date AND ve.expense_date <= :to_date
-            """
-            if location_id:
-                expense_query += " AND COALESCE(vt.location_id, -1) = :location_id"
-            
-            exp_result = db.execute(text(expense_query), params).fetchone()
-            expenses_total = float(exp_result[0]) if exp_result else 0.0
-        else:
-            # Если и vw_kpi_daily пустая, пробуем vw_tx_cogs
-            tx_cogs_query = """
-                SELECT
-                    COUNT(*) as transactions_count,
-                    COALESCE(SUM(revenue), 0) as revenue_gross,
-                    COALESCE(SUM(cogs), 0) as cogs_total
-                FROM vw_tx_cogs
-                WHERE tx_date >= :from_date AND tx_date <= :to_date
-            """
-            if location_id:
-                tx_cogs_query += " AND location_id = :location_id"
-            
-            tx_cogs_result = db.execute(text(tx_cogs_query), params).fetchone()
-            
-            if tx_cogs_result and tx_cogs_result[0] > 0:
-                transactions_count = int(tx_cogs_result[0])
-                revenue_gross = float(tx_cogs_result[1]) if tx_cogs_result[1] else 0.0
-                cogs_total = float(tx_cogs_result[2]) if tx_cogs_result[2] else 0.0
-                
-                # Расходы из variable_expenses (через vendista_term_id, location_id может быть NULL)
-                if expenses_total == 0.0:
-                    expense_query = """
-                        SELECT COALESCE(SUM(ve.amount_rub), 0)
-                        FROM variable_expenses ve
-                        LEFT JOIN vendista_terminals vt ON vt.id = ve.vendista_term_id
-                        WHERE ve.expense_date >= :from_date AND ve.expense_date <= :to_date
-                    """
-                    if location_id:
-                        expense_query += " AND COALESCE(vt.location_id, -1) = :location_id"
-                    
-                    exp_result = db.execute(text(expense_query), params).fetchone()
-                    expenses_total = float(exp_result[0]) if exp_result else 0.0
-    
-    # Комиссии: 8.95% от выручки
-    fees_total = round(revenue_gross * 0.0895, 2)
-    
-    # Чистая прибыль: выручка - COGS - комиссии - переменные расходы
-    # Если net_profit уже рассчитан из view (с учетом переменных расходов), используем его
-    # Иначе считаем: gross_profit - комиссии - переменные расходы
-    if net_profit != 0.0 or (transactions_count > 0 and revenue_gross > 0):
-        # Если есть данные из view, используем их, но вычитаем комиссии
-        gross_profit = revenue_gross - cogs_total
-        final_net_profit = gross_profit - fees_total - expenses_total
-    else:
-        # Если данных нет, возвращаем 0
-        final_net_profit = 0.0
-    
-    # Дополнительные метрики
-    avg_check = revenue_gross / transactions_count if transactions_count > 0 else 0.0
-    gross_profit = revenue_gross - cogs_total
-    gross_margin_pct = (gross_profit / revenue_gross * 100) if revenue_gross > 0 else 0.0
-    net_margin_pct = (final_net_profit / revenue_gross * 100) if revenue_gross > 0 else 0.0
-    
-    # Топ продукты за период
-    top_products_query = """
-        SELECT
-            drink_id,
-            drink_name,
-            COUNT(*) as sales_count,
-            SUM(revenue) as revenue,
-            SUM(cogs) as cogs,
-            SUM(gross_profit) as gross_profit
-        FROM vw_tx_cogs
-        WHERE tx_date >= :from_date AND tx_date <= :to_date
-    """
-    if location_id:
-        top_products_query += " AND location_id = :location_id"
-    top_products_query += """
-        GROUP BY drink_id, drink_name
-        ORDER BY SUM(revenue) DESC
-        LIMIT 10
-    """
-    top_products_result = db.execute(text(top_products_query), params).fetchall()
-    top_products = [
-        {
-            "drink_id": row[0],
-            "drink_name": row[1],
-            "sales_count": int(row[2]),
-            "revenue": float(row[3]),
-            "cogs": float(row[4]),
-            "gross_profit": float(row[5])
-        }
-        for row in top_products_result
-    ]
+    def compute():
+        # Пересобираем rollup за изменившиеся дни перед чтением
+        KpiRollupService(db).ensure_fresh()
+        return OwnerReportService(db).build(period_start, period_end, location_id)
     
-    return {
-        "period_start": period_start.isoformat(),
-        "period_end": period_end.isoformat(),
-        "revenue_gross": revenue_gross,
-        "fees_total": fees_total,
-        "expenses_total": expenses_total,
-        "net_profit": final_net_profit,
-        "transactions_count": transactions_count,
-        "avg_check": round(avg_check, 2),
-        "gross_profit": round(gross_profit, 2),
-        "gross_margin_pct": round(gross_margin_pct, 2),
-        "net_margin_pct": round(net_margin_pct, 2),
-        "cogs_total": round(cogs_total, 2),
-        "top_products": top_products
-    }
+    return result_cache.get_or_compute(
+        "owner-report",
+        {"period_start": period_start, "period_end": period_end, "location_id": location_id},
+        compute
+    )
 
 
 @router.get("/sales/summary")
@@ -378,14 +249,19 @@ def get_sales_summary(
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
     location_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get sales summary with aggregated metrics.
     """
     calculator = KPICalculator(db)
-    return calculator.calculate_sales_summary(from_date, to_date, location_id)
+    return result_cache.get_or_compute(
+        "sales/summary",
+        {"from_date": from_date, "to_date": to_date, "location_id": location_id},
+        lambda: calculator.calculate_sales_summary(from_date, to_date, location_id),
+        scopes=SALES_SCOPES
+    )
 
 
 @router.get("/sales/summary-old")
@@ -393,7 +269,7 @@ def get_sales_summary(
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
     location_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -451,14 +327,19 @@ def get_sales_margin(
     to_date: Optional[date] = None,
     location_id: Optional[int] = None,
     min_margin: Optional[float] = Query(None, description="Minimum margin threshold"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get detailed margin analysis by products.
     """
     calculator = KPICalculator(db)
-    return calculator.calculate_margin_analysis(from_date, to_date, location_id, min_margin)
+    return result_cache.get_or_compute(
+        "sales/margin",
+        {"from_date": from_date, "to_date": to_date, "location_id": location_id, "min_margin": min_margin},
+        lambda: calculator.calculate_margin_analysis(from_date, to_date, location_id, min_margin),
+        scopes=SALES_SCOPES
+    )
 
 
 @router.get("/sales/margin-old")
@@ -468,7 +349,7 @@ def get_sales_margin(
     location_id: Optional[int] = None,
     compare_from_date: Optional[date] = None,
     compare_to_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -573,7 +454,7 @@ def get_owner_report_daily(
     period_start: Optional[date] = None,
     period_end: Optional[date] = None,
     location_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(require_owner)
 ):
     """
@@ -592,6 +473,21 @@ def get_owner_report_daily(
     if period_end < period_start:
         raise HTTPException(status_code=422, detail="period_end must be >= period_start")
     
+    return result_cache.get_or_compute(
+        "owner-report/daily",
+        {"period_start": period_start, "period_end": period_end, "location_id": location_id},
+        lambda: _compute_owner_report_daily(db, period_start, period_end, location_id)
+    )
+
+
+def _compute_owner_report_daily(
+    db: Session,
+    period_start: date,
+    period_end: date,
+    location_id: Optional[int]
+) -> dict:
+    KpiRollupService(db).ensure_fresh()
+    
     # Query daily data from vw_owner_report_daily
     query = """
         SELECT
@@ -672,7 +568,7 @@ def get_owner_report_daily(
 @router.get("/owner-report/issues")
 def get_owner_report_issues(
     location_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(require_owner)
 ):
     """
@@ -680,102 +576,12 @@ def get_owner_report_issues(
     Returns:
     - Critical stock levels (low inventory)
     - Low margin products (< 30%)
-    - Sync errors (from sync_runs)
-    """
-    issues = []
-    
-    # 1. Critical stock levels
-    stock_query = """
-        SELECT
-            ingredient_code,
-            display_name_ru,
-            location_id,
-            location_name,
-            balance,
-            alert_threshold,
-            unit
-        FROM vw_inventory_balance
-        WHERE alert_threshold IS NOT NULL 
-          AND balance <= alert_threshold
-    """
-    params = {}
-    if location_id:
-        stock_query += " AND location_id = :location_id"
-        params['location_id'] = location_id
-    
-    stock_results = db.execute(text(stock_query), params).fetchall()
-    for row in stock_results:
-        issues.append({
-            "type": "low_stock",
-            "severity": "critical",
-            "ingredient_code": row[0],
-            "ingredient_name": row[1],
-            "location_id": row[2],
-            "location_name": row[3],
-            "balance": float(row[4]),
-            "threshold": float(row[5]) if row[5] else None,
-            "unit": row[6],
-            "message": f"Low stock: {row[1]} at {row[3]} ({row[4]} {row[6]} <= {row[5]} {row[6]})"
-        })
-    
-    # 2. Low margin products (< 30%)
-    margin_query = """
-        SELECT
-            drink_id,
-            drink_name,
-            location_id,
-            gross_margin_pct,
-            revenue,
-            sales_count
-        FROM vw_kpi_product
-        WHERE gross_margin_pct < 30 AND revenue > 0
-    """
-    if location_id:
-        margin_query += " AND location_id = :location_id"
-    margin_query += " ORDER BY revenue DESC LIMIT 20"
-    
-    margin_results = db.execute(text(margin_query), params).fetchall()
-    for row in margin_results:
-        issues.append({
-            "type": "low_margin",
-            "severity": "warning",
-            "drink_id": row[0],
-            "drink_name": row[1],
-            "location_id": row[2],
-            "margin_pct": float(row[3]),
-            "revenue": float(row[4]),
-            "sales_count": int(row[5]),
-            "message": f"Low margin: {row[1]} ({row[3]:.1f}% margin)"
-        })
-    
-    # 3. Sync errors (from sync_runs)
-    sync_query = """
-        SELECT
-            id,
-            started_at,
-            completed_at,
-            period_start,
-            period_end,
-            message,
-            ok
-        FROM sync_runs
-        WHERE ok = false
-        ORDER BY started_at DESC
-        LIMIT 10
+    - Sync errors (from sync_runs, last 7 days)
+
+    Read from the alerts table maintained by AlertService.
     """
-    sync_results = db.execute(text(sync_query)).fetchall()
-    for row in sync_results:
-        issues.append({
-            "type": "sync_error",
-            "severity": "error",
-            "sync_run_id": row[0],
-            "started_at": row[1].isoformat() if row[1] else None,
-            "completed_at": row[2].isoformat() if row[2] else None,
-            "period_start": row[3].isoformat() if row[3] else None,
-            "period_end": row[4].isoformat() if row[4] else None,
-            "message": row[5] or "Sync failed",
-            "ok": row[6]
-        })
+    alerts = AlertService(db).get_all_alerts(location_id=location_id)
+    issues = [_owner_issue(alert) for alert in alerts if alert["type"] in OWNER_ISSUE_TYPES]
     
     return {
         "total_issues": len(issues),
@@ -788,12 +594,59 @@ def get_owner_report_issues(
     }
 
 
+def _owner_issue(alert: dict) -> dict:
+    """Owner report issue in its original shape from an alert."""
+    common = {
+        "location_id": alert.get("location_id"),
+        "first_seen_at": alert.get("first_seen_at"),
+    }
+    if alert["type"] == AlertType.LOW_STOCK.value:
+        return {
+            "type": "low_stock",
+            "severity": "critical",
+            "ingredient_code": alert["ingredient_code"],
+            "ingredient_name": alert["ingredient_name"],
+            "location_name": alert["location_name"],
+            "balance": alert["balance"],
+            "threshold": alert["threshold"],
+            "unit": alert["unit"],
+            "message": f"Low stock: {alert['ingredient_name']} at {alert['location_name']} "
+                       f"({alert['balance']} {alert['unit']} <= {alert['threshold']} {alert['unit']})",
+            **common,
+        }
+    if alert["type"] == AlertType.LOW_MARGIN.value:
+        return {
+            "type": "low_margin",
+            "severity": "warning",
+            "drink_id": alert["drink_id"],
+            "drink_name": alert["drink_name"],
+            "margin_pct": alert["margin_pct"],
+            "revenue": alert["revenue"],
+            "sales_count": alert["sales_count"],
+            "message": f"Low margin: {alert['drink_name']} ({alert['margin_pct']:.1f}% margin)",
+            **common,
+        }
+    return {
+        "type": "sync_error",
+        "severity": "error",
+        "sync_run_id": alert["sync_run_id"],
+        "started_at": alert.get("run_at"),
+        "completed_at": alert.get("completed_at"),
+        "period_start": alert.get("period_start"),
+        "period_end": alert.get("period_end"),
+        "message": alert.get("error_message") or "Sync failed",
+        "ok": False,
+        **common,
+    }
+
+
 @router.get("/alerts")
 def get_alerts(
     location_id: Optional[int] = Query(None, description="Filter by location ID"),
     alert_type: Optional[str] = Query(None, description="Filter by alert type (low_stock, low_margin, sync_error, expiring_stock)"),
     severity: Optional[str] = Query(None, description="Filter by severity (critical, warning, info)"),
-    db: Session = Depends(get_db),
+    since: Optional[datetime] = Query(None, description="Mark alerts first seen after this time as new (e.g. last visit)"),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -809,6 +662,9 @@ def get_alerts(
     - location_id: Filter alerts by location
     - alert_type: Filter by type (low_stock, low_margin, sync_error, expiring_stock)
     - severity: Filter by severity (critical, warning, info)
+    
+    Alerts are read from the alerts table; each has first_seen_at,
+    last_seen_at and is_new (first seen after `since`).
     """
     service = AlertService(db)
     
@@ -827,15 +683,11 @@ def get_alerts(
         except ValueError:
             raise HTTPException(status_code=400, detail=f"Invalid severity: {severity}")
     
-    alerts = service.get_all_alerts(
-        location_id=location_id,
-        alert_type=alert_type_enum,
-        severity=severity_enum
-    )
-    
-    summary = service.get_alert_summary(location_id=location_id)
+    # Один проход: сводка по всем алертам локации, список - с фильтрами
+    alerts = service.get_all_alerts(location_id=location_id, since=since)
+    summary = service.summarize(alerts)
     
     return {
-        "alerts": alerts,
+        "alerts": service.filter_alerts(alerts, alert_type=alert_type_enum, severity=severity_enum),
         "summary": summary
     }
@@ -7,9 +7,10 @@ from sqlalchemy import text
 from datetime import datetime, date, timedelta
 from typing import List, Optional
 from pydantic import BaseModel, Field
-from app.db.session import get_db
+from app.db.session import get_db, get_analytics_db
 from app.api.deps import get_current_user
 from app.models.user import User
+from app.services import result_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -169,6 +170,7 @@ async def create_expense(
         "comment": expense.comment,
         "created_by_user_id": current_user.id
     })
+    result_cache.invalidate_on_commit(db, result_cache.EXPENSES)
     db.commit()
     
     row = result.fetchone()
@@ -256,6 +258,7 @@ async def update_expense(
     """)
     
     result = db.execute(query, params)
+    result_cache.invalidate_on_commit(db, result_cache.EXPENSES)
     db.commit()
     
     row = result.fetchone()
@@ -297,6 +300,7 @@ async def delete_expense(
     
     query = text("DELETE FROM variable_expenses WHERE id = :expense_id")
     result = db.execute(query, {"expense_id": expense_id})
+    result_cache.invalidate_on_commit(db, result_cache.EXPENSES)
     db.commit()
     
     if result.rowcount == 0:
@@ -313,7 +317,7 @@ async def get_expenses_analytics(
     from_date: Optional[date] = Query(None),
     to_date: Optional[date] = Query(None),
     location_id: Optional[int] = Query(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_analytics_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -3,10 +3,11 @@ API endpoints for Mapping (drinks + machine_matrix).
 """
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from typing import List, Optional
 from pydantic import BaseModel, Field
-from app.db.session import get_db
+from app.db.session import get_db, get_async_db
 from app.api.deps import get_current_user
 from app.models.user import User
 from app.schemas.business import (
@@ -18,9 +19,11 @@ from app.schemas.business import (
     ButtonMatrixCloneRequest, UnmappedItemResponse
 )
 from app.crud import business as crud
+from app.services.tx_fact_service import TxFactService
 import logging
 import csv
 import io
+import json
 
 logger = logging.getLogger(__name__)
 
@@ -77,47 +80,40 @@ class ImportApplyResponse(BaseModel):
 
 @router.get("/drinks", response_model=List[DrinkResponse])
 async def get_drinks(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get list of all drinks with their recipe items (ingredients) and COGS calculation.
     """
-    # Get all drinks with COGS calculation
+    # COGS берётся из текущей версии drink_cost_snapshot (DrinkCostService)
     drinks_query = text("""
         SELECT 
             d.id,
             d.name,
             d.is_active,
             d.created_at,
-            COALESCE((
-                SELECT SUM(
-                    CASE 
-                        -- Если единицы совпадают, просто умножаем
-                        WHEN di.unit = i.unit THEN di.qty_per_unit * i.cost_per_unit_rub
-                        -- Конвертация: рецепт в граммах, ингредиент в килограммах
-                        WHEN di.unit = 'g' AND i.unit = 'kg' THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
-                        -- Конвертация: рецепт в миллилитрах, ингредиент в литрах
-                        WHEN di.unit = 'ml' AND i.unit = 'l' THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
-                        -- Конвертация: рецепт в граммах, ингредиент в граммах (но цена за кг)
-                        WHEN di.unit = 'g' AND i.unit = 'g' AND i.cost_per_unit_rub > 100 THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
-                        -- Остальные случаи - просто умножаем (предполагаем одинаковые единицы)
-                        ELSE di.qty_per_unit * i.cost_per_unit_rub
-                    END
-                )
-                FROM drink_items di
-                JOIN ingredients i ON i.ingredient_code = di.ingredient_code
-                WHERE di.drink_id = d.id
-                  AND i.expense_kind = 'stock_tracked'
-                  AND i.cost_per_unit_rub IS NOT NULL
-            ), 0) as cogs_rub
+            COALESCE(s.cogs_rub, 0) as cogs_rub,
+            s.items as cost_items
         FROM drinks d
+        LEFT JOIN drink_cost_snapshot s
+            ON s.drink_id = d.id
+            AND s.effective_to IS NULL
         ORDER BY d.name
     """)
     
-    result = db.execute(drinks_query)
+    result = await db.execute(drinks_query)
     drinks_rows = result.fetchall()
     
+    # Item costs of the current snapshot: (drink_id, ingredient_code) -> cost
+    item_costs = {}
+    for row in drinks_rows:
+        cost_items = row[5] or []
+        if isinstance(cost_items, str):
+            cost_items = json.loads(cost_items)
+        for cost_item in cost_items:
+            item_costs[(row[0], cost_item["ingredient_code"])] = cost_item["item_cost_rub"]
+    
     # Get all drink items with ingredient info
     items_query = text("""
         SELECT 
@@ -126,57 +122,30 @@ async def get_drinks(
             di.qty_per_unit,
             di.unit,
             i.display_name_ru,
-            i.cost_per_unit_rub,
-            i.unit as ingredient_unit,
-            i.expense_kind
+            i.cost_per_unit_rub
         FROM drink_items di
         JOIN ingredients i ON i.ingredient_code = di.ingredient_code
         ORDER BY di.drink_id, di.ingredient_code
     """)
     
-    items_result = db.execute(items_query)
+    items_result = await db.execute(items_query)
     items_rows = items_result.fetchall()
     
-    # Group items by drink_id and calculate item costs
+    # Group items by drink_id
     items_by_drink = {}
     for item_row in items_rows:
         drink_id = item_row[0]
         ingredient_code = item_row[1]
-        qty_per_unit = float(item_row[2]) if item_row[2] else 0
-        recipe_unit = item_row[3]
-        display_name_ru = item_row[4]
-        cost_per_unit_rub = float(item_row[5]) if item_row[5] else None
-        ingredient_unit = item_row[6]
-        expense_kind = item_row[7]
-        
-        # Calculate cost for this item
-        item_cost = None
-        if cost_per_unit_rub is not None and expense_kind == 'stock_tracked':
-            if recipe_unit == ingredient_unit:
-                # Same units
-                item_cost = qty_per_unit * cost_per_unit_rub
-            elif recipe_unit == 'g' and ingredient_unit == 'kg':
-                # Recipe in grams, ingredient price per kg
-                item_cost = qty_per_unit * (cost_per_unit_rub / 1000.0)
-            elif recipe_unit == 'ml' and ingredient_unit == 'l':
-                # Recipe in ml, ingredient price per liter
-                item_cost = qty_per_unit * (cost_per_unit_rub / 1000.0)
-            elif recipe_unit == 'g' and ingredient_unit == 'g' and cost_per_unit_rub > 100:
-                # Likely price per kg but unit is 'g'
-                item_cost = qty_per_unit * (cost_per_unit_rub / 1000.0)
-            else:
-                # Default: assume same units
-                item_cost = qty_per_unit * cost_per_unit_rub
         
         if drink_id not in items_by_drink:
             items_by_drink[drink_id] = []
         items_by_drink[drink_id].append({
             "ingredient_code": ingredient_code,
-            "qty_per_unit": qty_per_unit,
-            "unit": recipe_unit,
-            "display_name_ru": display_name_ru,
-            "cost_per_unit_rub": cost_per_unit_rub,
-            "item_cost_rub": item_cost
+            "qty_per_unit": float(item_row[2]) if item_row[2] else 0,
+            "unit": item_row[3],
+            "display_name_ru": item_row[4],
+            "cost_per_unit_rub": float(item_row[5]) if item_row[5] else None,
+            "item_cost_rub": item_costs.get((drink_id, ingredient_code))
         })
     
     # Build response
@@ -313,6 +282,7 @@ async def delete_drink(
     
     query = text("DELETE FROM drinks WHERE id = :drink_id")
     result = db.execute(query, {"drink_id": drink_id})
+    TxFactService(db).refresh_drinks([drink_id])
     db.commit()
     
     if result.rowcount == 0:
@@ -1172,6 +1142,7 @@ async def batch_update_button_matrix_items(
                 errors=errors
             )
         
+        TxFactService(db).refresh_matrix(matrix_id)
         db.commit()
         logger.info(f"Batch update matrix {matrix_id}: inserted={inserted}, updated={updated}")
         
@@ -9,7 +9,7 @@ from typing import Optional, List
 from app.db.session import get_db
 from app.api.deps import get_current_user
 from app.models.user import User
-from app.services.vendista_sync import sync_service
+from app.services.sync_jobs import SyncJob, SyncAlreadyRunningError, sync_job_runner
 from app.services.vendista_client import vendista_client
 from app.crud import vendista as crud_vendista
 from app.schemas.vendista import VendistaTerminalResponse
@@ -61,19 +61,23 @@ async def check_sync_health(
         }
 
 
-@router.post("/sync")
+@router.post("/sync", status_code=status.HTTP_202_ACCEPTED)
 async def trigger_sync(
     period_start: Optional[date] = None,
     period_end: Optional[date] = None,
     items_per_page: int = 50,
     order_desc: bool = True,
-    db: Session = Depends(get_db),
+    start_page: int = Query(1, ge=1, description="Page to start from (resume a failed sync)"),
+    mode: str = Query("full", description="full|incremental"),
+    term_ids: Optional[List[int]] = Query(None, description="Terminals for incremental mode (default: all)"),
     current_user: User = Depends(get_current_user)
 ):
     """
     Trigger synchronization of transactions from Vendista DEFEN API.
     
-    This fetches all transactions and inserts them into vendista_tx_raw table.
+    The sync runs in the background: the response returns immediately with
+    run_id, and progress is polled via GET /sync/runs/{run_id}.
+    Only one sync runs at a time (409 if another one is in progress).
     Only users with owner role can trigger sync.
     
     Query parameters:
@@ -81,6 +85,10 @@ async def trigger_sync(
     - period_end: Optional end date (YYYY-MM-DD), default = today (UTC)
     - items_per_page: Page size for Vendista API (default 50)
     - order_desc: OrderDesc flag for Vendista API (default True)
+    - start_page: First page to fetch; use last_page + 1 of a failed run to resume
+    - mode: 'full' syncs the period; 'incremental' syncs from the stored sync_state
+      watermark (minus a small overlap) up to now and ignores the period parameters
+    - term_ids: Optional terminal filter for incremental mode
     """
     # Check if user has permission (only owners can sync)
     if current_user.role != "owner":
@@ -89,6 +97,12 @@ async def trigger_sync(
             detail="Only owners can trigger sync operations"
         )
 
+    if mode not in ("full", "incremental"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="mode must be 'full' or 'incremental'"
+        )
+
     # Defaults for period
     today = datetime.utcnow().date()
     if period_end is None:
@@ -102,109 +116,55 @@ async def trigger_sync(
             detail="period_end must be greater than or equal to period_start"
         )
 
-    started_at = datetime.utcnow()
     logger.info(
-        "User %s triggered full sync (period_start=%s, period_end=%s, items_per_page=%s, order_desc=%s)",
+        "User %s triggered %s sync (period_start=%s, period_end=%s, items_per_page=%s, order_desc=%s)",
         current_user.telegram_user_id,
+        mode,
         period_start,
         period_end,
         items_per_page,
         order_desc,
     )
 
-    try:
-        result = await sync_service.sync_all_from_vendista(
-            db=db,
-            period_start=period_start,
-            period_end=period_end,
-            items_per_page=items_per_page,
-            order_desc=order_desc,
-        )
-
-        completed_at = datetime.utcnow()
-        duration = (completed_at - started_at).total_seconds()
-
-        # Record sync run in database
-        try:
-            record_query = text("""
-                INSERT INTO sync_runs (
-                    started_at, completed_at, period_start, period_end,
-                    fetched, inserted, skipped_duplicates, expected_total,
-                    pages_fetched, items_per_page, last_page, ok, message
-                ) VALUES (
-                    :started_at, :completed_at, :period_start, :period_end,
-                    :fetched, :inserted, :skipped_duplicates, :expected_total,
-                    :pages_fetched, :items_per_page, :last_page, :ok, :message
-                )
-            """)
-            db.execute(record_query, {
-                "started_at": started_at,
-                "completed_at": completed_at,
-                "period_start": period_start,
-                "period_end": period_end,
-                "fetched": result.fetched,
-                "inserted": result.inserted,
-                "skipped_duplicates": result.skipped_duplicates,
-                "expected_total": result.expected_total,
-                "pages_fetched": result.pages_fetched,
-                "items_per_page": result.items_per_page,
-                "last_page": result.last_page,
-                "ok": result.success,
-                "message": result.error_message or "Sync completed successfully"
-            })
-            db.commit()
-        except Exception as record_error:
-            logger.warning(f"Failed to record sync run: {record_error}")
-            # Don't fail the whole request if recording fails
+    job = SyncJob(
+        mode=mode,
+        trigger="manual",
+        period_start=period_start if mode == "full" else None,
+        period_end=period_end if mode == "full" else None,
+        items_per_page=items_per_page,
+        order_desc=order_desc,
+        start_page=start_page,
+        term_ids=term_ids,
+    )
+    return await _submit_sync_job(job)
 
-        return {
-            "ok": result.success,
-            "started_at": started_at,
-            "completed_at": completed_at,
-            "duration_seconds": duration,
-            "fetched": result.fetched,
-            "inserted": result.inserted,
-            "skipped_duplicates": result.skipped_duplicates,
-            "expected_total": result.expected_total,
-            "items_per_page": result.items_per_page,
-            "pages_fetched": result.pages_fetched,
-            "last_page": result.last_page,
-            "transactions_synced": result.transactions_synced,
-            "message": result.error_message or "Sync completed successfully"
-        }
 
+async def _submit_sync_job(job: SyncJob) -> dict:
+    """Start a background sync job and build the 202 response."""
+    try:
+        run_id = await sync_job_runner.submit(job)
+    except SyncAlreadyRunningError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except Exception as e:
-        logger.error(f"Sync failed: {e}")
-        
-        # Try to record failed run
-        try:
-            completed_at = datetime.utcnow()
-            record_query = text("""
-                INSERT INTO sync_runs (
-                    started_at, completed_at, period_start, period_end,
-                    ok, message
-                ) VALUES (
-                    :started_at, :completed_at, :period_start, :period_end,
-                    :ok, :message
-                )
-            """)
-            db.execute(record_query, {
-                "started_at": started_at,
-                "completed_at": completed_at,
-                "period_start": period_start,
-                "period_end": period_end,
-                "ok": False,
-                "message": str(e)
-            })
-            db.commit()
-        except:
-            pass
-        
+        logger.error(f"Failed to start sync: {e}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Sync failed: {str(e)}"
+            detail=f"Sync failed to start: {str(e)}"
         )
 
+    return {
+        "ok": True,
+        "run_id": run_id,
+        "status": "running",
+        "mode": job.mode,
+        "period_start": job.period_start,
+        "period_end": job.period_end,
+        "message": "Sync started"
+    }
+
 
 @router.get("/runs")
 async def get_sync_runs(
@@ -262,9 +222,7 @@ async def get_sync_runs(
     
     query = text(f"""
         SELECT
-            id, started_at, completed_at, period_start, period_end,
-            fetched, inserted, skipped_duplicates, expected_total,
-            pages_fetched, items_per_page, last_page, ok, message
+            {_SYNC_RUN_COLUMNS}
         FROM sync_runs
         {where_clause}
         ORDER BY started_at DESC
@@ -274,28 +232,79 @@ async def get_sync_runs(
     result = db.execute(query, params)
     rows = result.fetchall()
     
-    runs = []
-    for row in rows:
-        runs.append({
-            "id": row[0],
-            "started_at": row[1].isoformat() if row[1] else None,
-            "completed_at": row[2].isoformat() if row[2] else None,
-            "period_start": row[3].isoformat() if row[3] else None,
-            "period_end": row[4].isoformat() if row[4] else None,
-            "fetched": row[5],
-            "inserted": row[6],
-            "skipped_duplicates": row[7],
-            "expected_total": row[8],
-            "pages_fetched": row[9],
-            "items_per_page": row[10],
-            "last_page": row[11],
-            "ok": row[12],
-            "message": row[13]
-        })
+    runs = [_sync_run_to_dict(row) for row in rows]
     
     return runs
 
 
+@router.get("/runs/{run_id}")
+async def get_sync_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a single sync run (used to poll a background sync started via POST /sync).
+    
+    status is 'running' until the job finishes, then 'success' or 'error'.
+    """
+    query = text(f"""
+        SELECT
+            {_SYNC_RUN_COLUMNS}
+        FROM sync_runs
+        WHERE id = :run_id
+    """)
+    row = db.execute(query, {"run_id": run_id}).fetchone()
+    
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sync run with id {run_id} not found"
+        )
+    
+    return _sync_run_to_dict(row)
+
+
+_SYNC_RUN_COLUMNS = """id, started_at, completed_at, period_start, period_end,
+            fetched, inserted, skipped_duplicates, expected_total,
+            pages_fetched, items_per_page, last_page, ok, message,
+            status, mode, trigger"""
+
+
+def _rerun_start_page(mode: Optional[str], ok: Optional[bool], last_page: Optional[int]) -> int:
+    """
+    First page of a rerun. Only a failed full run can continue after its
+    last committed page: the rerun repeats its window and stored order_desc.
+    Incremental runs read a different window oldest-first, so their page
+    numbers do not apply to a full rerun.
+    """
+    if mode == "full" and ok is False and last_page:
+        return last_page + 1
+    return 1
+
+
+def _sync_run_to_dict(row) -> dict:
+    return {
+        "id": row[0],
+        "started_at": row[1].isoformat() if row[1] else None,
+        "completed_at": row[2].isoformat() if row[2] else None,
+        "period_start": row[3].isoformat() if row[3] else None,
+        "period_end": row[4].isoformat() if row[4] else None,
+        "fetched": row[5],
+        "inserted": row[6],
+        "skipped_duplicates": row[7],
+        "expected_total": row[8],
+        "pages_fetched": row[9],
+        "items_per_page": row[10],
+        "last_page": row[11],
+        "ok": row[12],
+        "message": row[13],
+        "status": row[14],
+        "mode": row[15],
+        "trigger": row[16]
+    }
+
+
 @router.get("/terminals", response_model=List[VendistaTerminalResponse])
 async def get_vendista_terminals(
     is_active: Optional[bool] = Query(None, description="Filter by active status"),
@@ -347,9 +356,10 @@ async def sync_terminals_from_transactions(
         )
 
 
-@router.post("/runs/{run_id}/rerun")
+@router.post("/runs/{run_id}/rerun", status_code=status.HTTP_202_ACCEPTED)
 async def rerun_sync(
     run_id: int,
+    resume: bool = Query(True, description="Continue a failed run after its last committed page"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -357,7 +367,9 @@ async def rerun_sync(
     Re-run a previous sync operation using the same parameters.
     
     Fetches the original run's parameters (period_start, period_end, items_per_page, order_desc)
-    and re-executes the sync.
+    and starts the sync in the background. Returns the new run_id for polling.
+    A failed full run is resumed from last_page + 1 unless resume=false;
+    other runs start at page 1.
     
     Owner-only access.
     """
@@ -369,7 +381,7 @@ async def rerun_sync(
     
     # Get original sync run parameters
     fetch_query = text("""
-        SELECT period_start, period_end, items_per_page
+        SELECT period_start, period_end, items_per_page, order_desc, ok, last_page, mode
         FROM sync_runs
         WHERE id = :run_id
     """)
@@ -386,6 +398,8 @@ async def rerun_sync(
     period_start = row[0]
     period_end = row[1]
     items_per_page = row[2] or 50
+    order_desc = row[3] if row[3] is not None else True
+    start_page = _rerun_start_page(mode=row[6], ok=row[4], last_page=row[5]) if resume else 1
     
     if not period_start or not period_end:
         raise HTTPException(
@@ -393,105 +407,23 @@ async def rerun_sync(
             detail="Original sync run missing period_start or period_end"
         )
     
-    # Re-run sync with original parameters
     logger.info(
-        "User %s triggered rerun of sync run %d (period_start=%s, period_end=%s, items_per_page=%d)",
+        "User %s triggered rerun of sync run %d (period_start=%s, period_end=%s, items_per_page=%d, start_page=%d)",
         current_user.telegram_user_id,
         run_id,
         period_start,
         period_end,
-        items_per_page
+        items_per_page,
+        start_page
     )
     
-    started_at = datetime.utcnow()
-    
-    try:
-        result = await sync_service.sync_all_from_vendista(
-            db=db,
-            period_start=period_start,
-            period_end=period_end,
-            items_per_page=items_per_page,
-            order_desc=True
-        )
-        
-        completed_at = datetime.utcnow()
-        duration = (completed_at - started_at).total_seconds()
-        
-        # Record rerun in database
-        try:
-            record_query = text("""
-                INSERT INTO sync_runs (
-                    started_at, completed_at, period_start, period_end,
-                    fetched, inserted, skipped_duplicates, expected_total,
-                    pages_fetched, items_per_page, last_page, ok, message
-                ) VALUES (
-                    :started_at, :completed_at, :period_start, :period_end,
-                    :fetched, :inserted, :skipped_duplicates, :expected_total,
-                    :pages_fetched, :items_per_page, :last_page, :ok, :message
-                )
-            """)
-            db.execute(record_query, {
-                "started_at": started_at,
-                "completed_at": completed_at,
-                "period_start": period_start,
-                "period_end": period_end,
-                "fetched": result.fetched,
-                "inserted": result.inserted,
-                "skipped_duplicates": result.skipped_duplicates,
-                "expected_total": result.expected_total,
-                "pages_fetched": result.pages_fetched,
-                "items_per_page": result.items_per_page,
-                "last_page": result.last_page,
-                "ok": result.success,
-                "message": result.error_message or "Rerun completed successfully"
-            })
-            db.commit()
-        except Exception as record_error:
-            logger.warning(f"Failed to record rerun: {record_error}")
-        
-        return {
-            "ok": result.success,
-            "started_at": started_at,
-            "completed_at": completed_at,
-            "duration_seconds": duration,
-            "fetched": result.fetched,
-            "inserted": result.inserted,
-            "skipped_duplicates": result.skipped_duplicates,
-            "expected_total": result.expected_total,
-            "items_per_page": items_per_page,
-            "pages_fetched": result.pages_fetched,
-            "last_page": result.last_page,
-            "message": result.error_message or "Rerun completed successfully"
-        }
-    
-    except Exception as e:
-        logger.error(f"Rerun failed: {e}")
-        
-        # Try to record failed rerun
-        try:
-            completed_at = datetime.utcnow()
-            record_query = text("""
-                INSERT INTO sync_runs (
-                    started_at, completed_at, period_start, period_end,
-                    ok, message
-                ) VALUES (
-                    :started_at, :completed_at, :period_start, :period_end,
-                    :ok, :message
-                )
-            """)
-            db.execute(record_query, {
-                "started_at": started_at,
-                "completed_at": completed_at,
-                "period_start": period_start,
-                "period_end": period_end,
-                "ok": False,
-                "message": f"Rerun failed: {str(e)}"
-            })
-            db.commit()
-        except:
-            pass
-        
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Rerun failed: {str(e)}"
-        )
+    job = SyncJob(
+        mode="full",
+        trigger="rerun",
+        period_start=period_start,
+        period_end=period_end,
+        items_per_page=items_per_page,
+        order_desc=order_desc,
+        start_page=start_page,
+    )
+    return await _submit_sync_job(job)
@@ -2,11 +2,11 @@
 API endpoints for Terminals (aggregated stats from vendista_tx_raw).
 """
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from datetime import datetime, date
 from typing import List, Optional
-from app.db.session import get_db
+from app.db.session import get_async_db
 from app.api.deps import get_current_user
 from app.models.user import User
 import logging
@@ -20,7 +20,7 @@ router = APIRouter()
 async def get_terminals(
     period_start: Optional[date] = Query(None, description="Start date (YYYY-MM-DD), default: first day of month"),
     period_end: Optional[date] = Query(None, description="End date (YYYY-MM-DD), default: today"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -37,22 +37,23 @@ async def get_terminals(
         period_start = today.replace(day=1)
     
     # Build SQL query
-    # We parse JSON payload to extract sum and count only positive transactions
+    # Only positive transactions are counted; the sum_kopecks > 0 predicate
+    # matches the partial index ix_vendista_tx_raw_sales_time
     query = text("""
         SELECT
             term_id,
-            COUNT(*) FILTER (WHERE (payload->>'sum')::numeric > 0) as tx_count,
-            COALESCE(SUM((payload->>'sum')::numeric) FILTER (WHERE (payload->>'sum')::numeric > 0), 0) / 100.0 as revenue_gross,
-            MAX(tx_time) FILTER (WHERE (payload->>'sum')::numeric > 0) as last_tx_time
+            COUNT(*) as tx_count,
+            COALESCE(SUM(sum_kopecks), 0) / 100.0 as revenue_gross,
+            MAX(tx_time) as last_tx_time
         FROM vendista_tx_raw
-        WHERE tx_time >= :period_start
-          AND tx_time < :period_end + interval '1 day'
+        WHERE tx_time >= CAST(:period_start AS date)
+          AND tx_time < CAST(:period_end AS date) + interval '1 day'
+          AND sum_kopecks > 0
         GROUP BY term_id
-        HAVING COUNT(*) FILTER (WHERE (payload->>'sum')::numeric > 0) > 0
         ORDER BY revenue_gross DESC
     """)
     
-    result = db.execute(
+    result = await db.execute(
         query,
         {"period_start": period_start, "period_end": period_end}
     )
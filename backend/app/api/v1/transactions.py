@@ -2,20 +2,72 @@
 API endpoints for Transactions (detailed list from vendista_tx_raw).
 """
 from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text, func
 from datetime import datetime, date, timedelta
-from typing import List, Optional
-from app.db.session import get_db
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from io import StringIO
+from app.db.session import get_async_db, analytics_engine, AnalyticsSessionLocal
 from app.api.deps import get_current_user
 from app.models.user import User
+from app.config import settings
+import base64
+import csv
 import logging
 import json
+import queue
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Cached COUNT(*) per filter set for cursor mode: key -> (expires_at, total)
+_TOTAL_CACHE: Dict[tuple, Tuple[float, int]] = {}
+_TOTAL_CACHE_MAX_ENTRIES = 256
+
+
+def _encode_cursor(tx_time: datetime, tx_id: int, order_desc: bool) -> str:
+    """Opaque continuation token for the (tx_time, id) keyset."""
+    raw = json.dumps({"t": tx_time.isoformat(), "i": tx_id, "d": order_desc}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, order_desc: bool) -> Tuple[datetime, int]:
+    """Parse a continuation token; raises 400 on a malformed or foreign token."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        tx_time = datetime.fromisoformat(data["t"])
+        tx_id = int(data["i"])
+        cursor_desc = bool(data["d"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_desc != order_desc:
+        raise HTTPException(status_code=400, detail="Cursor was issued for a different sort order")
+    return tx_time, tx_id
+
+
+async def _cached_total(db: AsyncSession, count_query, params: dict, cache_key: tuple) -> int:
+    """COUNT(*) for the filter set, reused for TRANSACTIONS_TOTAL_CACHE_SECONDS."""
+    now = time.monotonic()
+    cached = _TOTAL_CACHE.get(cache_key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    total = (await db.execute(count_query, params)).scalar_one()
+    if len(_TOTAL_CACHE) >= _TOTAL_CACHE_MAX_ENTRIES:
+        # Drop expired entries first, then the oldest ones
+        for key in [k for k, v in _TOTAL_CACHE.items() if v[0] <= now]:
+            del _TOTAL_CACHE[key]
+        while len(_TOTAL_CACHE) >= _TOTAL_CACHE_MAX_ENTRIES:
+            del _TOTAL_CACHE[next(iter(_TOTAL_CACHE))]
+    _TOTAL_CACHE[cache_key] = (now + settings.TRANSACTIONS_TOTAL_CACHE_SECONDS, total)
+    return total
+
 
 @router.get("/")
 async def get_transactions(
@@ -23,10 +75,13 @@ async def get_transactions(
     date_to: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
     term_id: Optional[int] = Query(None, description="Filter by terminal ID"),
     sum_type: str = Query("positive", description="all|positive|non_positive"),
-    page: int = Query(1, ge=1, description="Page number (1-based)"),
+    page: int = Query(1, ge=1, description="Page number (1-based, offset mode only)"),
     page_size: int = Query(50, ge=1, le=200, description="Items per page (max 200)"),
     order_desc: bool = Query(True, description="Order by tx_time DESC"),
-    db: Session = Depends(get_db),
+    pagination: str = Query("offset", description="offset|cursor"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page (cursor mode)"),
+    include_total: bool = Query(False, description="Return a cached total in cursor mode"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -38,6 +93,12 @@ async def get_transactions(
       - sum_type: 'positive' (sum>0), 'non_positive' (sum<=0), 'all'
       - order_desc: Sort by tx_time DESC (default=true)
     
+    Pagination:
+      - offset: page/total/total_pages with an exact COUNT(*) (default)
+      - cursor: keyset on (tx_time, id); pass next_cursor back as cursor.
+        Every page costs the same; total is only returned with
+        include_total=true and may be up to TRANSACTIONS_TOTAL_CACHE_SECONDS old.
+    
     Returns items with extracted fields from JSON payload.
     """
     # Parse dates
@@ -61,63 +122,83 @@ async def get_transactions(
     if sum_type not in ("all", "positive", "non_positive"):
         raise HTTPException(status_code=400, detail="sum_type must be 'all', 'positive', or 'non_positive'")
     
+    if pagination not in ("offset", "cursor"):
+        raise HTTPException(status_code=400, detail="pagination must be 'offset' or 'cursor'")
+    cursor_mode = pagination == "cursor"
+    
     # Build WHERE clause
     where_clauses = [
-        "tx_time >= :period_start",
-        "tx_time < :period_end + interval '1 day'"
+        "tx_time >= CAST(:period_start AS date)",
+        "tx_time < CAST(:period_end AS date) + interval '1 day'"
     ]
     params = {
         "period_start": period_start,
         "period_end": period_end,
-        "limit": page_size,
-        "offset": (page - 1) * page_size
+        # One extra row tells whether another page exists
+        "limit": page_size + 1,
+        "offset": 0 if cursor_mode else (page - 1) * page_size
     }
     
     if term_id is not None:
-        where_clauses.append("(payload->>'term_id')::int = :term_id")
+        where_clauses.append("term_id = :term_id")
         params["term_id"] = term_id
     
     # Apply sum_type filter
     if sum_type == "positive":
-        where_clauses.append("(payload->>'sum')::numeric > 0")
+        where_clauses.append("sum_kopecks > 0")
     elif sum_type == "non_positive":
-        where_clauses.append("(payload->>'sum')::numeric <= 0")
+        where_clauses.append("sum_kopecks <= 0")
     # 'all' => no sum filter
     
     where_sql = " AND ".join(where_clauses)
-    order_clause = "ORDER BY tx_time DESC" if order_desc else "ORDER BY tx_time ASC"
     
-    # Count query
+    # Count query (filters only, without the keyset predicate)
     count_query = text(f"""
         SELECT COUNT(*) FROM vendista_tx_raw
         WHERE {where_sql}
     """)
     
-    total = db.execute(count_query, params).scalar_one()
-    total_pages = (total + page_size - 1) // page_size if total > 0 else 0
+    total = None
+    total_pages = None
+    if not cursor_mode:
+        total = (await db.execute(count_query, params)).scalar_one()
+        total_pages = (total + page_size - 1) // page_size if total > 0 else 0
+    elif include_total:
+        total = await _cached_total(db, count_query, params, (period_start, period_end, term_id, sum_type))
+        total_pages = (total + page_size - 1) // page_size if total > 0 else 0
+    
+    # Keyset: continue strictly after the last row of the previous page.
+    # id breaks ties between transactions with the same tx_time.
+    if cursor_mode and cursor:
+        params["cursor_time"], params["cursor_id"] = _decode_cursor(cursor, order_desc)
+        where_sql += (
+            " AND (v.tx_time, v.id) < (:cursor_time, :cursor_id)" if order_desc
+            else " AND (v.tx_time, v.id) > (:cursor_time, :cursor_id)"
+        )
+    order_clause = "ORDER BY v.tx_time DESC, v.id DESC" if order_desc else "ORDER BY v.tx_time ASC, v.id ASC"
     
     # Data query with pagination and drink name from button_matrix system
     # Uses: terminal_matrix_map -> button_matrix_items -> drinks
     data_query = text(f"""
         SELECT
             v.id,
-            (v.payload->>'term_id')::int as term_id,
+            v.term_id,
             v.vendista_tx_id,
             v.tx_time,
-            (v.payload->>'sum')::numeric as sum_kopecks,
-            (v.payload->>'sum')::numeric / 100.0 as sum_rub,
-            (v.payload->'machine_item'->0->>'machine_item_id')::int as machine_item_id,
-            v.payload->>'terminal_comment' as terminal_comment,
-            (v.payload->>'status')::text as status,
+            v.sum_kopecks,
+            v.sum_kopecks / 100.0 as sum_rub,
+            v.machine_item_id,
+            v.terminal_comment,
+            v.status,
             d.name as drink_name,
             v.payload
         FROM vendista_tx_raw v
         LEFT JOIN terminal_matrix_map tmm ON 
-            tmm.vendista_term_id = (v.payload->>'term_id')::int 
+            tmm.vendista_term_id = v.term_id
             AND tmm.is_active = true
         LEFT JOIN button_matrix_items bmi ON 
             bmi.matrix_id = tmm.matrix_id 
-            AND bmi.machine_item_id = (v.payload->'machine_item'->0->>'machine_item_id')::int
+            AND bmi.machine_item_id = v.machine_item_id
             AND bmi.is_active = true
         LEFT JOIN drinks d ON d.id = bmi.drink_id
         WHERE {where_sql}
@@ -125,8 +206,11 @@ async def get_transactions(
         LIMIT :limit OFFSET :offset
     """)
     
-    result = db.execute(data_query, params)
+    result = await db.execute(data_query, params)
     rows = result.fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = _encode_cursor(rows[-1][3], rows[-1][0], order_desc) if has_more else None
     
     items = []
     for row in rows:
@@ -152,34 +236,181 @@ async def get_transactions(
             "raw_payload": row[10]
         })
     
-    logger.info(f"Transactions: period={period_start}..{period_end}, sum_type={sum_type}, term_id={term_id}, total={total}")
+    logger.info(f"Transactions: period={period_start}..{period_end}, sum_type={sum_type}, term_id={term_id}, pagination={pagination}, total={total}")
     
     return {
         "items": items,
-        "page": page,
+        "page": None if cursor_mode else page,
         "page_size": page_size,
         "total": total,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "has_more": has_more,
+        "next_cursor": next_cursor
     }
 
 
+# Rows per server-side cursor fetch / CSV chunk in exports
+EXPORT_CHUNK_ROWS = 1000
+
+EXPORT_FIELDNAMES = ["tx_time", "term_id", "vendista_tx_id", "sum_rub", "sum_kopecks", "machine_item_id", "drink_name", "terminal_comment", "status"]
+RAW_EXPORT_FIELDNAMES = ["id", "term_id", "vendista_tx_id", "tx_time", "sum_kopecks", "machine_item_id", "terminal_comment", "status"]
+
+
+def _export_row(row) -> dict:
+    # Convert UTC to Moscow timezone (UTC+3) to match Vendista display
+    tx_time_display = None
+    if row[0]:
+        tx_time_display = (row[0] - timedelta(hours=3)).isoformat()
+
+    return {
+        "tx_time": tx_time_display if tx_time_display else "",
+        "term_id": row[1] or "",
+        "vendista_tx_id": row[2] or "",
+        "sum_rub": f"{row[3]:.2f}" if row[3] else "",
+        "sum_kopecks": int(row[4]) if row[4] else "",
+        "machine_item_id": row[5] or "",
+        "drink_name": row[8] or "",  # Drink name
+        "terminal_comment": row[6] or "",
+        "status": row[7] or ""
+    }
+
+
+def _set_export_timeout(db: Session) -> None:
+    """Exports may outlive the analytics statement_timeout (transaction-local override)."""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            text("SELECT set_config('statement_timeout', :timeout, true)"),
+            {"timeout": str(settings.DB_EXPORT_STATEMENT_TIMEOUT_MS)}
+        )
+
+
+def _stream_csv(
+    query,
+    params: dict,
+    fieldnames: List[str],
+    to_row: Callable,
+    log_context: str,
+    session_factory: Callable[[], Session] = AnalyticsSessionLocal,
+) -> Iterator[bytes]:
+    """
+    Yield CSV chunks while rows arrive from a server-side cursor.
+
+    Uses its own session from the analytics pool: the request session is
+    closed before a streamed body is sent. Memory stays at one chunk of
+    EXPORT_CHUNK_ROWS rows.
+    """
+    db = session_factory()
+    exported = 0
+    try:
+        _set_export_timeout(db)
+        result = db.execute(
+            query.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS),
+            params
+        )
+        buffer = StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+        writer.writeheader()
+        for rows in result.partitions(EXPORT_CHUNK_ROWS):
+            for row in rows:
+                writer.writerow(to_row(row))
+            exported += len(rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+        if buffer.tell():
+            # Header of an empty export
+            yield buffer.getvalue().encode("utf-8")
+        logger.info(f"CSV Export: {log_context}, rows={exported}")
+    finally:
+        db.close()
+
+
+def _stream_copy(
+    query,
+    params: dict,
+    log_context: str,
+    session_factory: Callable[[], Session] = AnalyticsSessionLocal,
+) -> Iterator[bytes]:
+    """
+    Yield the output of PostgreSQL COPY (query) TO STDOUT as it is produced.
+
+    copy_expert writes into a file object synchronously, so it runs in a
+    worker thread feeding a bounded queue; closing the generator (client
+    disconnect) aborts the COPY on the next write.
+    """
+    chunks: "queue.Queue" = queue.Queue(maxsize=16)
+    cancelled = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        # После отключения клиента очередь никто не читает: не блокируемся на полной очереди
+        while not cancelled.is_set():
+            try:
+                chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    class _QueueWriter:
+        def write(self, data):
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            if not put(data):
+                raise RuntimeError("CSV export cancelled")
+            return len(data)
+
+    def run_copy():
+        db = session_factory()
+        try:
+            _set_export_timeout(db)
+            compiled = query.compile(dialect=db.get_bind().dialect)
+            dbapi_conn = db.connection().connection
+            with dbapi_conn.cursor() as cur:
+                select_sql = cur.mogrify(str(compiled), params).decode("utf-8")
+                cur.copy_expert(f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER)", _QueueWriter())
+        except Exception as e:
+            if not cancelled.is_set():
+                logger.error(f"CSV Export (COPY) failed: {log_context}: {e}")
+                put(e)
+        finally:
+            db.close()
+            put(done)
+
+    worker = threading.Thread(target=run_copy, name="csv-copy-export", daemon=True)
+    worker.start()
+    exported_bytes = 0
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            exported_bytes += len(chunk)
+            yield chunk
+        logger.info(f"CSV Export (COPY): {log_context}, bytes={exported_bytes}")
+    finally:
+        cancelled.set()
+
+
 @router.get("/export")
 async def export_transactions(
     date_from: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
     term_id: Optional[int] = Query(None, description="Filter by terminal ID"),
     sum_type: str = Query("positive", description="all|positive|non_positive"),
-    db: Session = Depends(get_db),
+    raw: bool = Query(False, description="Stored columns only (UTC time, no drink names), via COPY on PostgreSQL"),
     current_user: User = Depends(get_current_user)
 ):
     """
     Export transactions as CSV (text/csv attachment).
     Same filters as GET /transactions endpoint.
+
+    The file is streamed in chunks as rows are read from a server-side
+    cursor, so memory does not grow with the period. raw=true exports the
+    stored vendista_tx_raw columns and uses COPY ... TO STDOUT on PostgreSQL.
     """
-    from io import StringIO
-    import csv
-    from fastapi.responses import StreamingResponse
-    
     # Parse dates
     if date_to is None:
         period_end = datetime.utcnow().date()
@@ -212,82 +443,72 @@ async def export_transactions(
     }
     
     if term_id is not None:
-        where_clauses.append("(payload->>'term_id')::int = :term_id")
+        where_clauses.append("term_id = :term_id")
         params["term_id"] = term_id
     
     if sum_type == "positive":
-        where_clauses.append("(payload->>'sum')::numeric > 0")
+        where_clauses.append("sum_kopecks > 0")
     elif sum_type == "non_positive":
-        where_clauses.append("(payload->>'sum')::numeric <= 0")
+        where_clauses.append("sum_kopecks <= 0")
     
     where_sql = " AND ".join(where_clauses)
+    log_context = f"period={period_start}..{period_end}, sum_type={sum_type}, term_id={term_id}, raw={raw}"
     
-    # Fetch all data (no pagination for export) with drink name from button_matrix system
-    # Uses: terminal_matrix_map -> button_matrix_items -> drinks
-    data_query = text(f"""
-        SELECT
-            v.tx_time,
-            (v.payload->>'term_id')::int as term_id,
-            v.vendista_tx_id,
-            (v.payload->>'sum')::numeric / 100.0 as sum_rub,
-            (v.payload->>'sum')::numeric as sum_kopecks,
-            (v.payload->'machine_item'->0->>'machine_item_id')::int as machine_item_id,
-            v.payload->>'terminal_comment' as terminal_comment,
-            (v.payload->>'status')::text as status,
-            d.name as drink_name
-        FROM vendista_tx_raw v
-        LEFT JOIN terminal_matrix_map tmm ON 
-            tmm.vendista_term_id = (v.payload->>'term_id')::int 
-            AND tmm.is_active = true
-        LEFT JOIN button_matrix_items bmi ON 
-            bmi.matrix_id = tmm.matrix_id 
-            AND bmi.machine_item_id = (v.payload->'machine_item'->0->>'machine_item_id')::int
-            AND bmi.is_active = true
-        LEFT JOIN drinks d ON d.id = bmi.drink_id
-        WHERE {where_sql}
-        ORDER BY v.tx_time DESC
-    """)
-    
-    result = db.execute(data_query, params)
-    rows = result.fetchall()
-    
-    # Create CSV
-    output = StringIO()
-    writer = csv.DictWriter(
-        output,
-        fieldnames=["tx_time", "term_id", "vendista_tx_id", "sum_rub", "sum_kopecks", "machine_item_id", "drink_name", "terminal_comment", "status"]
-    )
-    writer.writeheader()
-    
-    for row in rows:
-        # Convert UTC to Moscow timezone (UTC+3) to match Vendista display
-        tx_time_display = None
-        if row[0]:
-            tx_time_display = (row[0] - timedelta(hours=3)).isoformat()
-        
-        writer.writerow({
-            "tx_time": tx_time_display if tx_time_display else "",
-            "term_id": row[1] or "",
-            "vendista_tx_id": row[2] or "",
-            "sum_rub": f"{row[3]:.2f}" if row[3] else "",
-            "sum_kopecks": int(row[4]) if row[4] else "",
-            "machine_item_id": row[5] or "",
-            "drink_name": row[8] or "",  # Drink name
-            "terminal_comment": row[6] or "",
-            "status": row[7] or ""
-        })
-    
-    csv_content = output.getvalue()
-    csv_bytes = csv_content.encode('utf-8')
-    
-    # Log export
-    export_count = len(rows)
-    logger.info(f"CSV Export: period={period_start}..{period_end}, sum_type={sum_type}, term_id={term_id}, rows={export_count}")
+    if raw:
+        data_query = text(f"""
+            SELECT
+                v.id,
+                v.term_id,
+                v.vendista_tx_id,
+                v.tx_time,
+                v.sum_kopecks,
+                v.machine_item_id,
+                v.terminal_comment,
+                v.status
+            FROM vendista_tx_raw v
+            WHERE {where_sql}
+            ORDER BY v.tx_time DESC, v.id DESC
+        """)
+        if analytics_engine.dialect.name == "postgresql":
+            body = _stream_copy(data_query, params, log_context)
+        else:
+            body = _stream_csv(
+                data_query, params, RAW_EXPORT_FIELDNAMES,
+                lambda row: dict(zip(RAW_EXPORT_FIELDNAMES, row)), log_context
+            )
+    else:
+        # Drink name from button_matrix system
+        # Uses: terminal_matrix_map -> button_matrix_items -> drinks
+        data_query = text(f"""
+            SELECT
+                v.tx_time,
+                v.term_id,
+                v.vendista_tx_id,
+                v.sum_kopecks / 100.0 as sum_rub,
+                v.sum_kopecks,
+                v.machine_item_id,
+                v.terminal_comment,
+                v.status,
+                d.name as drink_name
+            FROM vendista_tx_raw v
+            LEFT JOIN terminal_matrix_map tmm ON 
+                tmm.vendista_term_id = v.term_id
+                AND tmm.is_active = true
+            LEFT JOIN button_matrix_items bmi ON 
+                bmi.matrix_id = tmm.matrix_id 
+                AND bmi.machine_item_id = v.machine_item_id
+                AND bmi.is_active = true
+            LEFT JOIN drinks d ON d.id = bmi.drink_id
+            WHERE {where_sql}
+            ORDER BY v.tx_time DESC, v.id DESC
+        """)
+        body = _stream_csv(data_query, params, EXPORT_FIELDNAMES, _export_row, log_context)
     
     # Return as attachment
-    filename = f"transactions_{period_start.strftime('%Y%m%d')}_{period_end.strftime('%Y%m%d')}.csv"
+    suffix = "_raw" if raw else ""
+    filename = f"transactions_{period_start.strftime('%Y%m%d')}_{period_end.strftime('%Y%m%d')}{suffix}.csv"
     return StreamingResponse(
-        iter([csv_bytes]),
+        body,
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=\"{filename}\""}
     )
@@ -6,6 +6,18 @@ from typing import List
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "postgresql://vending:vending_pass@db:5432/vending"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: int = 30  # Wait for a free connection before failing
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 30000  # OLTP requests and sync; 0 disables
+    DB_LOCK_TIMEOUT_MS: int = 5000
+    # Separate pool for analytics and exports
+    DB_ANALYTICS_POOL_SIZE: int = 4
+    DB_ANALYTICS_MAX_OVERFLOW: int = 2
+    DB_ANALYTICS_STATEMENT_TIMEOUT_MS: int = 120000
+    DB_EXPORT_STATEMENT_TIMEOUT_MS: int = 0  # CSV exports stream for as long as needed
     
     # JWT
     SECRET_KEY: str = "your-super-secret-key-change-me-in-production"
@@ -19,14 +31,52 @@ class Settings(BaseSettings):
     # Server
     HOST: str = "0.0.0.0"
     PORT: int = 8000
+    WEB_CONCURRENCY: int = 1  # API worker processes; uvicorn uses it as the --workers default
     DEBUG: bool = True
     
     # CORS
     CORS_ORIGINS: str = "*"
     
+    # Background sync schedule
+    SYNC_SCHEDULER_ENABLED: bool = False
+    SYNC_INCREMENTAL_INTERVAL_MINUTES: int = 5
+    SYNC_RECONCILE_HOUR_UTC: int = 3  # Nightly full reconcile hour
+    SYNC_RECONCILE_DAYS: int = 3  # Days covered by the nightly reconcile
+    
+    # Analytics result cache
+    RESULT_CACHE_BACKEND: str = "memory"  # memory | redis | none; memory shares generations via PostgreSQL with WEB_CONCURRENCY > 1
+    RESULT_CACHE_TTL_SECONDS: int = 120
+    RESULT_CACHE_MAX_ENTRIES: int = 512  # memory backend only
+    REDIS_URL: str = ""  # e.g. redis://localhost:6379/0
+    
+    # Alerts
+    ALERTS_TTL_SECONDS: int = 900  # Full re-evaluation fallback; sync and load writes refresh their alert types
+    ALERTS_RESOLVED_RETENTION_DAYS: int = 30  # Resolved alerts kept for history
+    ALERTS_EVALUATION_LOG_DAYS: int = 1  # alert_evaluations rows kept
+    
+    # Transactions list
+    TRANSACTIONS_TOTAL_CACHE_SECONDS: int = 60  # Lifetime of cached totals in cursor mode
+    
     # Vendista API
     vendista_api_base_url: str = "https://api.vendista.ru"
     vendista_api_token: str = ""  # Must be set in .env
+    vendista_sync_commit_pages: int = 20  # Pages per upsert/commit checkpoint during sync
+    vendista_max_concurrent_pages: int = 4  # Transaction pages fetched in parallel
+    vendista_page_retries: int = 4  # Extra attempts per request (transport errors, 429, 5xx)
+    vendista_page_retry_delay_seconds: float = 1.0  # Base of the exponential backoff
+    vendista_retry_max_delay_seconds: float = 60.0  # Cap for backoff and Retry-After
+    vendista_rate_limit_per_second: float = 10.0  # Client-side token bucket, 0 disables
+    vendista_rate_limit_burst: int = 10
+    vendista_resume_attempts: int = 3  # Sync resumes after the last received page when a page still fails after retries
+    vendista_terminals_endpoint: str = ""  # e.g. "/terminals"; empty = discover and cache
+    vendista_endpoint_cache_ttl_seconds: int = 3600  # Lifetime of the discovered terminals endpoint
+    vendista_endpoint_negative_cache_ttl_seconds: int = 300  # Lifetime of a failed discovery (probes don't retry)
+    vendista_probe_timeout_seconds: float = 10.0  # Per-probe timeout during discovery
+    vendista_incremental_overlap_minutes: int = 10  # Re-read window before the sync watermark
+    vendista_http_max_connections: int = 20  # Shared httpx client pool
+    vendista_http_max_keepalive_connections: int = 10
+    vendista_http_keepalive_expiry_seconds: float = 30.0
+    vendista_http2: bool = True  # Used only if the h2 package is installed
     
     @property
     def cors_origins_list(self) -> List[str]:
@@ -11,8 +11,15 @@ from app.models.business import (
 from app.models.vendista import VendistaTxRaw
 from app.models.inventory import IngredientLoad, VariableExpense
 from app.schemas.business import *
+from app.services.tx_fact_service import TxFactService
+from app.services.drink_cost_service import DrinkCostService
+from app.services.alert_service import refresh_alerts, LOAD_ALERT_TYPES
+from app.services import result_cache
 from sqlalchemy import text
 
+# Ingredient fields that affect recipe cost (tx_fact.cogs)
+COST_FIELDS = ("cost_per_unit_rub", "unit", "expense_kind")
+
 
 # ============================================================================
 # Location CRUD
@@ -80,6 +87,8 @@ def get_ingredients(db: Session, skip: int = 0, limit: int = 100) -> List[Ingred
 def create_ingredient(db: Session, ingredient: IngredientCreate) -> Ingredient:
     db_ingredient = Ingredient(**ingredient.model_dump())
     db.add(db_ingredient)
+    db.flush()
+    DrinkCostService(db).record_ingredient_costs([db_ingredient.ingredient_code])
     db.commit()
     db.refresh(db_ingredient)
     return db_ingredient
@@ -93,6 +102,8 @@ def update_ingredient(db: Session, ingredient_code: str, ingredient_update: Ingr
     update_dict = ingredient_update.model_dump(exclude_unset=True, exclude_none=True)
     for field, value in update_dict.items():
         setattr(db_ingredient, field, value)
+    if any(field in update_dict for field in COST_FIELDS):
+        TxFactService(db).refresh_ingredient_costs([ingredient_code])
     db.commit()
     db.refresh(db_ingredient)
     return db_ingredient
@@ -141,6 +152,8 @@ def create_drink(db: Session, drink: DrinkCreate) -> Drink:
             **item.model_dump()
         )
         db.add(db_item)
+    db.flush()
+    DrinkCostService(db).snapshot([db_drink.id])
     db.commit()
     db.refresh(db_drink)
     return db_drink
@@ -154,6 +167,8 @@ def update_drink(db: Session, drink_id: int, drink_update: DrinkUpdate) -> Optio
     # Update basic fields
     if drink_update.name is not None:
         db_drink.name = drink_update.name
+        # Название напитка отображается в отчётах (top products)
+        result_cache.invalidate_on_commit(db, result_cache.RECIPES)
     if drink_update.is_active is not None:
         db_drink.is_active = drink_update.is_active
     
@@ -165,6 +180,7 @@ def update_drink(db: Session, drink_id: int, drink_update: DrinkUpdate) -> Optio
         for item in drink_update.items:
             db_item = DrinkItem(drink_id=drink_id, **item.model_dump())
             db.add(db_item)
+        TxFactService(db).refresh_drink_recipes([drink_id])
     
     db.commit()
     db.refresh(db_drink)
@@ -226,7 +242,9 @@ def delete_button_matrix(db: Session, matrix_id: int) -> bool:
     if db_matrix is None:
         return False
     
+    term_ids = [m.vendista_term_id for m in get_terminal_matrix_maps(db, matrix_id=matrix_id)]
     db.delete(db_matrix)
+    TxFactService(db).refresh_terminals(term_ids)
     db.commit()
     return True
 
@@ -247,6 +265,7 @@ def create_button_matrix_item(
 ) -> ButtonMatrixItem:
     db_item = ButtonMatrixItem(matrix_id=matrix_id, **item.model_dump())
     db.add(db_item)
+    TxFactService(db).refresh_matrix(matrix_id)
     db.commit()
     db.refresh(db_item)
     return db_item
@@ -270,6 +289,7 @@ def update_button_matrix_item(
     for field, value in update_data.items():
         setattr(db_item, field, value)
     
+    TxFactService(db).refresh_matrix(matrix_id)
     db.commit()
     db.refresh(db_item)
     return db_item
@@ -289,6 +309,7 @@ def delete_button_matrix_item(
         return False
     
     db.delete(db_item)
+    TxFactService(db).refresh_matrix(matrix_id)
     db.commit()
     return True
 
@@ -311,6 +332,8 @@ def assign_terminals_to_matrix(
     matrix_id: int,
     term_ids: List[int]
 ) -> List[TerminalMatrixMap]:
+    previous_term_ids = [m.vendista_term_id for m in get_terminal_matrix_maps(db, matrix_id=matrix_id)]
+    
     # Remove existing assignments for this matrix
     db.query(TerminalMatrixMap).filter(
         TerminalMatrixMap.matrix_id == matrix_id
@@ -327,6 +350,7 @@ def assign_terminals_to_matrix(
         db.add(assignment)
         assignments.append(assignment)
     
+    TxFactService(db).refresh_terminals(previous_term_ids + list(term_ids))
     db.commit()
     for assignment in assignments:
         db.refresh(assignment)
@@ -348,6 +372,7 @@ def remove_terminal_from_matrix(
         return False
     
     db.delete(assignment)
+    TxFactService(db).refresh_terminals([term_id])
     db.commit()
     return True
 
@@ -360,7 +385,7 @@ def get_unmapped_transactions(db: Session) -> List[dict]:
     query = text("""
         SELECT DISTINCT
             t.term_id,
-            (t.payload->'machine_item'->0->>'machine_item_id')::int as machine_item_id,
+            t.machine_item_id,
             vt.comment as term_name,
             tmm.matrix_id
         FROM vendista_tx_raw t
@@ -370,9 +395,9 @@ def get_unmapped_transactions(db: Session) -> List[dict]:
             AND tmm.is_active = true
         LEFT JOIN button_matrix_items bmi 
             ON bmi.matrix_id = tmm.matrix_id 
-            AND bmi.machine_item_id = (t.payload->'machine_item'->0->>'machine_item_id')::int
+            AND bmi.machine_item_id = t.machine_item_id
         WHERE 
-            (t.payload->'machine_item'->0->>'machine_item_id') IS NOT NULL
+            t.machine_item_id IS NOT NULL
             AND bmi.id IS NULL
         ORDER BY t.term_id, machine_item_id
     """)
@@ -425,6 +450,7 @@ def create_ingredient_load(db: Session, load: IngredientLoadCreate, user_id: Opt
     db.add(db_load)
     db.commit()
     db.refresh(db_load)
+    refresh_alerts(db, LOAD_ALERT_TYPES)
     return db_load
 
 
@@ -460,6 +486,7 @@ def get_variable_expenses(
 def create_variable_expense(db: Session, expense: VariableExpenseCreate, user_id: Optional[int] = None) -> VariableExpense:
     db_expense = VariableExpense(**expense.model_dump(), created_by_user_id=user_id)
     db.add(db_expense)
+    result_cache.invalidate_on_commit(db, result_cache.EXPENSES)
     db.commit()
     db.refresh(db_expense)
     return db_expense
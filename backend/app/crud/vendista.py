@@ -2,9 +2,12 @@
 CRUD operations for Vendista models.
 """
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import case, func, literal_column, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from app.models.vendista import VendistaTerminal, VendistaTxRaw, SyncState
+from app.services.tx_fact_service import TxFactService
 from app.schemas.vendista import (
     VendistaTerminalCreate,
     VendistaTerminalUpdate,
@@ -64,11 +67,60 @@ def update_terminal(
     for field, value in update_data.items():
         setattr(db_terminal, field, value)
 
+    if "location_id" in update_data:
+        TxFactService(db).refresh_terminals([term_id])
     db.commit()
     db.refresh(db_terminal)
     return db_terminal
 
 
+def get_terminals_by_ids(db: Session, term_ids: List[int]) -> Dict[int, VendistaTerminal]:
+    """Get terminals by ID in one query, keyed by ID."""
+    if not term_ids:
+        return {}
+    terminals = db.query(VendistaTerminal).filter(VendistaTerminal.id.in_(set(term_ids))).all()
+    return {terminal.id: terminal for terminal in terminals}
+
+
+def upsert_terminals(db: Session, rows: List[dict]) -> Tuple[int, int]:
+    """
+    Insert or update terminals in one statement.
+
+    Rows that would not change anything are left untouched (and not
+    returned). Does not commit.
+
+    Args:
+        rows: Dicts with id, title, comment, comment_tx_time, is_active (one per id)
+
+    Returns:
+        (created, updated) counts
+    """
+    if not rows:
+        return 0, 0
+
+    stmt = pg_insert(VendistaTerminal).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[VendistaTerminal.id],
+        set_={
+            "title": stmt.excluded.title,
+            "comment": stmt.excluded.comment,
+            "comment_tx_time": stmt.excluded.comment_tx_time,
+            "is_active": stmt.excluded.is_active,
+            "updated_at": func.now(),
+        },
+        where=or_(
+            VendistaTerminal.title.is_distinct_from(stmt.excluded.title),
+            VendistaTerminal.comment.is_distinct_from(stmt.excluded.comment),
+            VendistaTerminal.comment_tx_time.is_distinct_from(stmt.excluded.comment_tx_time),
+            VendistaTerminal.is_active.is_distinct_from(stmt.excluded.is_active),
+        )
+    ).returning(VendistaTerminal.id, literal_column("xmax = 0").label("inserted"))
+
+    results = db.execute(stmt).all()
+    created = sum(1 for row in results if row.inserted)
+    return created, len(results) - created
+
+
 def delete_terminal(db: Session, term_id: int) -> bool:
     """Delete terminal."""
     db_terminal = get_terminal(db, term_id)
@@ -76,6 +128,7 @@ def delete_terminal(db: Session, term_id: int) -> bool:
         return False
 
     db.delete(db_terminal)
+    TxFactService(db).refresh_terminals([term_id])
     db.commit()
     return True
 
@@ -138,6 +191,10 @@ def count_transactions(
 # Sync State CRUD
 # ============================================================================
 
+# sync_state row that holds the fleet-wide high-water mark (not a real terminal)
+GLOBAL_SYNC_STATE_TERM_ID = 0
+
+
 def get_sync_state(db: Session, term_id: int) -> Optional[SyncState]:
     """Get sync state for terminal."""
     return db.query(SyncState).filter(SyncState.term_id == term_id).first()
@@ -174,3 +231,86 @@ def update_sync_state(
     db.commit()
     db.refresh(db_sync_state)
     return db_sync_state
+
+
+def get_sync_watermark(db: Session, term_ids: Optional[List[int]] = None) -> Optional[datetime]:
+    """
+    Get the high-water mark incremental sync should start from.
+
+    With term_ids, returns the oldest watermark among those terminals
+    (None if any of them has never been synced). Without term_ids,
+    returns the fleet-wide watermark.
+    """
+    if term_ids:
+        unique_ids = set(term_ids)
+        states = db.query(SyncState).filter(SyncState.term_id.in_(unique_ids)).all()
+        if len(states) < len(unique_ids):
+            return None
+        return min(state.last_sync_time for state in states)
+
+    state = get_sync_state(db, GLOBAL_SYNC_STATE_TERM_ID)
+    return state.last_sync_time if state else None
+
+
+def advance_sync_states(
+    db: Session,
+    watermarks: Dict[int, Tuple[datetime, Optional[int]]],
+    advance_global: bool = True
+) -> None:
+    """
+    Move sync_state high-water marks forward (never backward).
+
+    Does not commit: the caller commits together with the synced rows,
+    so watermarks only advance when the data they cover is persisted.
+
+    Args:
+        watermarks: term_id -> (max tx_time, vendista_tx_id at that time)
+        advance_global: Also advance the fleet-wide watermark
+    """
+    if not watermarks:
+        return
+
+    rows = [
+        {
+            "term_id": term_id,
+            "last_sync_time": tx_time,
+            "last_tx_id": tx_id,
+            "sync_status": "idle",
+            "error_message": None,
+        }
+        for term_id, (tx_time, tx_id) in watermarks.items()
+    ]
+    if advance_global:
+        global_time, global_tx_id = max(watermarks.values(), key=lambda mark: mark[0])
+        rows.append({
+            "term_id": GLOBAL_SYNC_STATE_TERM_ID,
+            "last_sync_time": global_time,
+            "last_tx_id": global_tx_id,
+            "sync_status": "idle",
+            "error_message": None,
+        })
+
+    stmt = pg_insert(SyncState).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SyncState.term_id],
+        set_={
+            "last_sync_time": func.greatest(SyncState.last_sync_time, stmt.excluded.last_sync_time),
+            "last_tx_id": case(
+                (stmt.excluded.last_sync_time >= SyncState.last_sync_time, stmt.excluded.last_tx_id),
+                else_=SyncState.last_tx_id
+            ),
+            "sync_status": stmt.excluded.sync_status,
+            "error_message": None,
+            "updated_at": func.now(),
+        }
+    )
+    db.execute(stmt)
+
+
+def mark_sync_error(db: Session, error_message: str) -> None:
+    """Record a failed incremental sync on the fleet-wide sync_state row."""
+    db.query(SyncState).filter(SyncState.term_id == GLOBAL_SYNC_STATE_TERM_ID).update(
+        {"sync_status": "error", "error_message": error_message},
+        synchronize_session=False
+    )
+    db.commit()
@@ -1,10 +1,88 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from app.config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+
+def _engine_options(pool_size: int, max_overflow: int, statement_timeout_ms: int) -> dict:
+    """Pool and timeout options for create_engine (PostgreSQL-specific ones only on PostgreSQL)."""
+    options = {
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    }
+    if make_url(settings.DATABASE_URL).get_backend_name() == "postgresql":
+        options.update(
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            # Таймауты на уровне сессии PostgreSQL (0 = без ограничения)
+            connect_args={
+                "options": f"-c statement_timeout={statement_timeout_ms} -c lock_timeout={settings.DB_LOCK_TIMEOUT_MS}"
+            },
+        )
+    return options
+
+
+# Short OLTP requests (CRUD, auth, sync)
+engine = create_engine(
+    settings.DATABASE_URL,
+    **_engine_options(settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW, settings.DB_STATEMENT_TIMEOUT_MS)
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Long analytics / export queries: own pool, so they cannot starve CRUD
+analytics_engine = create_engine(
+    settings.DATABASE_URL,
+    **_engine_options(
+        settings.DB_ANALYTICS_POOL_SIZE,
+        settings.DB_ANALYTICS_MAX_OVERFLOW,
+        settings.DB_ANALYTICS_STATEMENT_TIMEOUT_MS,
+    )
+)
+AnalyticsSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=analytics_engine)
+
+
+# Async engine for hot read endpoints (asyncpg), created on first use so
+# that importing the app does not require asyncpg
+_async_engine = None
+_async_sessionmaker = None
+
+
+def _async_database_url() -> str:
+    url = make_url(settings.DATABASE_URL)
+    return url.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+def get_async_sessionmaker():
+    global _async_engine, _async_sessionmaker
+    if _async_sessionmaker is None:
+        _async_engine = create_async_engine(
+            _async_database_url(),
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            connect_args={
+                "server_settings": {
+                    "statement_timeout": str(settings.DB_ANALYTICS_STATEMENT_TIMEOUT_MS),
+                    "lock_timeout": str(settings.DB_LOCK_TIMEOUT_MS),
+                }
+            },
+        )
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+    return _async_sessionmaker
+
+
+async def dispose_async_engine() -> None:
+    """Close pooled asyncpg connections (application shutdown)."""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_sessionmaker = None
+
 
 def get_db():
     """Dependency для получения сессии БД"""
@@ -13,3 +91,18 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_analytics_db():
+    """Dependency для тяжёлых аналитических запросов (отдельный пул)"""
+    db = AnalyticsSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """Dependency для асинхронной сессии (asyncpg) — не блокирует event loop"""
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -3,6 +3,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.api.v1 import auth, sync, business, analytics, users, terminals, transactions, expenses, mapping
 from app.api.middleware.error_handlers import register_error_handlers, BusinessLogicError
+from app.services.sync_jobs import sync_job_runner
+from app.services.vendista_client import vendista_client
+from app.db.session import dispose_async_engine
 
 app = FastAPI(
     title="Vending Admin v2 API",
@@ -35,6 +38,38 @@ app.include_router(expenses.router, prefix="/api/v1/expenses", tags=["Expenses"]
 app.include_router(mapping.router, prefix="/api/v1/mapping", tags=["Mapping"])
 
 
+@app.on_event("startup")
+async def fail_interrupted_sync_runs():
+    """Синхронизации, прерванные остановкой процесса, помечаются как ошибочные"""
+    sync_job_runner.fail_interrupted_runs()
+
+
+@app.on_event("startup")
+async def start_sync_scheduler():
+    """Запуск периодической синхронизации Vendista (если включена)"""
+    if settings.SYNC_SCHEDULER_ENABLED:
+        sync_job_runner.start_scheduler()
+
+
+@app.on_event("startup")
+async def open_vendista_client():
+    """Общий HTTP-клиент Vendista (пул соединений с keep-alive)"""
+    await vendista_client.start()
+
+
+@app.on_event("shutdown")
+async def stop_sync_jobs():
+    """Остановка планировщика и фоновых синхронизаций"""
+    await sync_job_runner.stop()
+
+
+@app.on_event("shutdown")
+async def close_connections():
+    """Закрытие HTTP-клиента Vendista и async-пула БД"""
+    await vendista_client.aclose()
+    await dispose_async_engine()
+
+
 @app.get("/")
 def root():
     """Health check endpoint"""
@@ -1,25 +1,37 @@
 # Models module
 from app.models.user import User
-from app.models.vendista import VendistaTerminal, VendistaTxRaw, SyncState
+from app.models.vendista import VendistaTerminal, VendistaTxRaw, TxFact, SyncState
 from app.models.business import (
-    Location, Product, Ingredient, Drink, DrinkItem,
+    Location, Product, Ingredient, IngredientCostHistory, Drink, DrinkItem, DrinkCostSnapshot,
     ButtonMatrix, ButtonMatrixItem, TerminalMatrixMap
 )
 from app.models.inventory import IngredientLoad, VariableExpense
+from app.models.analytics import KpiDailyRollup, IngredientUsageDaily, KpiDirtyDay
+from app.models.alerts import Alert, AlertEvaluation
+from app.models.result_cache import ResultCacheGeneration
 
 __all__ = [
     "User",
     "VendistaTerminal", 
     "VendistaTxRaw", 
+    "TxFact",
     "SyncState",
     "Location",
     "Product",
     "Ingredient",
+    "IngredientCostHistory",
     "Drink",
     "DrinkItem",
+    "DrinkCostSnapshot",
     "ButtonMatrix",
     "ButtonMatrixItem",
     "TerminalMatrixMap",
     "IngredientLoad",
-    "VariableExpense"
+    "VariableExpense",
+    "KpiDailyRollup",
+    "IngredientUsageDaily",
+    "KpiDirtyDay",
+    "Alert",
+    "AlertEvaluation",
+    "ResultCacheGeneration"
 ]
@@ -0,0 +1,55 @@
+"""
+Evaluated alerts persisted by AlertService.
+"""
+from sqlalchemy import Column, Integer, Text, TIMESTAMP, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func, text
+from app.db.base import Base
+
+
+class Alert(Base):
+    """
+    Alert occurrence with its lifecycle. An alert is active while
+    resolved_at IS NULL; re-evaluations update last_seen_at and the payload,
+    and resolve alerts that are no longer found. A resolved alert that comes
+    back starts a new row.
+    """
+    __tablename__ = "alerts"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    alert_key = Column(Text, nullable=False)  # e.g. 'low_stock:MILK:3'
+    alert_type = Column(Text, nullable=False)
+    severity = Column(Text, nullable=False)
+    location_id = Column(Integer, nullable=True)
+    payload = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)  # Alert dict as returned by the API
+    first_seen_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    last_seen_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    resolved_at = Column(TIMESTAMP(timezone=True), nullable=True)  # NULL = active
+
+    __table_args__ = (
+        Index('ix_alerts_type_severity', 'alert_type', 'severity'),
+        Index('ix_alerts_first_seen_at', 'first_seen_at'),
+        # At most one active occurrence per alert
+        Index(
+            'uq_alerts_active_key', 'alert_key', unique=True,
+            postgresql_where=text('resolved_at IS NULL'),
+            sqlite_where=text('resolved_at IS NULL'),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<Alert(key={self.alert_key}, severity={self.severity})>"
+
+
+class AlertEvaluation(Base):
+    """Log of alert evaluations; the latest one tells readers whether alerts are fresh."""
+    __tablename__ = "alert_evaluations"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    evaluated_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    alerts_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<AlertEvaluation(evaluated_at={self.evaluated_at}, alerts={self.alerts_count})>"
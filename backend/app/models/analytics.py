@@ -0,0 +1,66 @@
+"""
+Pre-aggregated analytics tables maintained from tx_fact.
+"""
+from sqlalchemy import Column, Integer, BigInteger, TIMESTAMP, Numeric, Date, Text, Index
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class KpiDailyRollup(Base):
+    """
+    Daily sales rollup per (tx_date, location_id, term_id, drink_id).
+    Rows of a day are rebuilt together when the day is taken from kpi_dirty_days.
+    """
+    __tablename__ = "kpi_daily_rollup"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tx_date = Column(Date, nullable=False)
+    location_id = Column(Integer, nullable=True)
+    term_id = Column(BigInteger, nullable=False)
+    drink_id = Column(Integer, nullable=True)
+    sales_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric, nullable=False, default=0)  # Rubles
+    cogs = Column(Numeric, nullable=False, default=0)
+    gross_profit = Column(Numeric, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_kpi_daily_rollup_key', 'tx_date', 'location_id', 'term_id', 'drink_id'),
+    )
+
+    def __repr__(self):
+        return f"<KpiDailyRollup(tx_date={self.tx_date}, term_id={self.term_id}, drink_id={self.drink_id})>"
+
+
+class IngredientUsageDaily(Base):
+    """
+    Ingredient consumption ledger per (tx_date, location_id, ingredient_code):
+    sales of the day times recipe quantities. Rebuilt with the rollup of the
+    day; vw_inventory_balance subtracts it from ingredient_loads.
+    """
+    __tablename__ = "ingredient_usage_daily"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tx_date = Column(Date, nullable=False, index=True)
+    location_id = Column(Integer, nullable=True)
+    ingredient_code = Column(Text, nullable=False)
+    qty_used = Column(Numeric, nullable=False, default=0)  # In recipe units (drink_items.unit)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_ingredient_usage_daily_ingredient_location', 'ingredient_code', 'location_id'),
+    )
+
+    def __repr__(self):
+        return f"<IngredientUsageDaily(tx_date={self.tx_date}, ingredient={self.ingredient_code}, qty={self.qty_used})>"
+
+
+class KpiDirtyDay(Base):
+    """Queue of days whose tx_fact rows changed and whose rollup must be rebuilt."""
+    __tablename__ = "kpi_dirty_days"
+
+    tx_date = Column(Date, primary_key=True)
+    queued_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<KpiDirtyDay(tx_date={self.tx_date})>"
@@ -1,8 +1,9 @@
 """
 Business models for locations, products, ingredients, drinks, and recipes.
 """
-from sqlalchemy import Column, Integer, BigInteger, Text, Boolean, TIMESTAMP, Numeric, ForeignKey, UniqueConstraint
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, BigInteger, Text, Boolean, TIMESTAMP, Numeric, ForeignKey, UniqueConstraint, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func, text
 from sqlalchemy.orm import relationship
 from app.db.base import Base
 
@@ -58,6 +59,31 @@ class Ingredient(Base):
         return f"<Ingredient(code={self.ingredient_code}, name={self.display_name_ru})>"
 
 
+class IngredientCostHistory(Base):
+    """
+    Effective-dated cost of an ingredient (price, unit, expense kind).
+    The current row has effective_to IS NULL; drink costs are computed as
+    of a point in time from these rows.
+    """
+    __tablename__ = "ingredient_cost_history"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    ingredient_code = Column(Text, ForeignKey('ingredients.ingredient_code', ondelete='CASCADE'), nullable=False)
+    effective_from = Column(TIMESTAMP(timezone=True), nullable=False)
+    effective_to = Column(TIMESTAMP(timezone=True), nullable=True)  # NULL = current price
+    cost_per_unit_rub = Column(Numeric(10, 2), nullable=True)
+    unit = Column(Text, nullable=False)
+    expense_kind = Column(Text, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_ingredient_cost_history_code_effective', 'ingredient_code', 'effective_from'),
+    )
+
+    def __repr__(self):
+        return f"<IngredientCostHistory(ingredient={self.ingredient_code}, cost={self.cost_per_unit_rub}, from={self.effective_from})>"
+
+
 class Drink(Base):
     """Global catalog of drinks (recipes)."""
     __tablename__ = "drinks"
@@ -84,6 +110,36 @@ class DrinkItem(Base):
         return f"<DrinkItem(drink_id={self.drink_id}, ingredient={self.ingredient_code}, qty={self.qty_per_unit})>"
 
 
+class DrinkCostSnapshot(Base):
+    """
+    Recipe cost of a drink, versioned by effective date.
+    Written by DrinkCostService whenever the recipe or ingredient costs
+    change; the current version has effective_to IS NULL.
+    """
+    __tablename__ = "drink_cost_snapshot"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    drink_id = Column(Integer, ForeignKey('drinks.id', ondelete='CASCADE'), nullable=False)
+    effective_from = Column(TIMESTAMP(timezone=True), nullable=False)
+    effective_to = Column(TIMESTAMP(timezone=True), nullable=True)  # NULL = current version
+    cogs_rub = Column(Numeric, nullable=False, default=0)  # Cost of one serving
+    items = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)  # [{ingredient_code, item_cost_rub}]
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_drink_cost_snapshot_drink_effective', 'drink_id', 'effective_from'),
+        # At most one current version per drink
+        Index(
+            'uq_drink_cost_snapshot_current', 'drink_id', unique=True,
+            postgresql_where=text('effective_to IS NULL'),
+            sqlite_where=text('effective_to IS NULL'),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<DrinkCostSnapshot(drink_id={self.drink_id}, cogs={self.cogs_rub}, from={self.effective_from})>"
+
+
 class ButtonMatrix(Base):
     """Template for button-to-drink mappings (matrix template)."""
     __tablename__ = "button_matrices"
@@ -0,0 +1,19 @@
+"""
+Shared generation counters of the analytics result cache.
+"""
+from sqlalchemy import Column, BigInteger, Text
+from app.db.base import Base
+
+
+class ResultCacheGeneration(Base):
+    """
+    Current generation of a result cache data scope. Commits bump it; every
+    worker keys its in-process cache entries by the generations read here.
+    """
+    __tablename__ = "result_cache_generations"
+
+    scope = Column(Text, primary_key=True)  # e.g. 'sales'
+    generation = Column(BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ResultCacheGeneration(scope={self.scope}, generation={self.generation})>"
@@ -1,7 +1,8 @@
 """
 Vendista models for storing terminal and transaction data.
 """
-from sqlalchemy import Column, BigInteger, Text, Boolean, TIMESTAMP, JSON, Integer, UniqueConstraint, ForeignKey
+from sqlalchemy import Column, BigInteger, Text, Boolean, TIMESTAMP, JSON, Integer, Date, Numeric, UniqueConstraint, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from app.db.base import Base
 
@@ -17,6 +18,7 @@ class VendistaTerminal(Base):
     id = Column(BigInteger, primary_key=True, index=True)  # Vendista terminal ID
     title = Column(Text, nullable=True)  # Terminal title from Vendista
     comment = Column(Text, nullable=True)  # Human-readable comment (e.g., "Островского Терм#1")
+    comment_tx_time = Column(TIMESTAMP(timezone=True), nullable=True)  # tx_time the comment was taken from (API: sync time)
     location_id = Column(Integer, ForeignKey('locations.id', ondelete='SET NULL'), nullable=True)  # Terminal location
     is_active = Column(Boolean, nullable=False, default=True)  # Is terminal active
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
@@ -30,6 +32,7 @@ class VendistaTxRaw(Base):
     """
     Raw transactions from Vendista API.
     Stores all transaction data in JSONB format.
+    Hot payload fields are also stored in typed columns at ingest.
     """
     __tablename__ = "vendista_tx_raw"
 
@@ -37,7 +40,11 @@ class VendistaTxRaw(Base):
     term_id = Column(BigInteger, nullable=False, index=True)  # Terminal ID
     vendista_tx_id = Column(BigInteger, nullable=False, index=True)  # Transaction ID from Vendista
     tx_time = Column(TIMESTAMP(timezone=True), nullable=False, index=True)  # Transaction timestamp
-    payload = Column(JSON, nullable=False)  # Full JSON payload from Vendista
+    sum_kopecks = Column(BigInteger, nullable=True)  # payload.sum
+    machine_item_id = Column(Integer, nullable=True)  # payload.machine_item[0].machine_item_id
+    status = Column(Text, nullable=True)  # payload.status
+    terminal_comment = Column(Text, nullable=True)  # payload.terminal_comment
+    payload = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)  # Full JSON payload from Vendista
     inserted_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
 
     __table_args__ = (
@@ -48,6 +55,35 @@ class VendistaTxRaw(Base):
         return f"<VendistaTxRaw(id={self.id}, term_id={self.term_id}, vendista_tx_id={self.vendista_tx_id})>"
 
 
+class TxFact(Base):
+    """
+    Per-transaction facts derived from vendista_tx_raw.
+    Typed columns are parsed once at ingest; location/drink/COGS are re-derived
+    when terminal locations, button matrices, recipes or ingredient prices change.
+    """
+    __tablename__ = "tx_fact"
+
+    tx_id = Column(BigInteger, ForeignKey('vendista_tx_raw.id', ondelete='CASCADE'), primary_key=True)
+    term_id = Column(BigInteger, nullable=False, index=True)
+    vendista_tx_id = Column(BigInteger, nullable=False)
+    tx_time = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    tx_date = Column(Date, nullable=False)
+    sum_kopecks = Column(BigInteger, nullable=False, default=0)  # payload.sum (kopecks)
+    machine_item_id = Column(Integer, nullable=True)  # payload.machine_item[0].machine_item_id
+    location_id = Column(Integer, nullable=True)  # From vendista_terminals
+    drink_id = Column(Integer, nullable=True)  # From active button matrix
+    cogs = Column(Numeric, nullable=False, default=0)  # Recipe cost in rubles
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_tx_fact_date_location', 'tx_date', 'location_id'),
+        Index('ix_tx_fact_drink', 'drink_id'),
+    )
+
+    def __repr__(self):
+        return f"<TxFact(tx_id={self.tx_id}, drink_id={self.drink_id}, cogs={self.cogs})>"
+
+
 class SyncState(Base):
     """
     Synchronization state for each terminal.
@@ -167,6 +167,8 @@ class SyncResult(BaseModel):
     items_per_page: int = 0  # Page size used when fetching
     last_page: int = 0  # Last page number fetched
     transactions_synced: int  # Total synced (inserted + updated)
+    window_start: Optional[datetime] = None  # DateFrom actually requested
+    window_end: Optional[datetime] = None  # DateTo actually requested
     error_message: Optional[str] = None
 
 
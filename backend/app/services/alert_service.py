@@ -1,15 +1,36 @@
 """
 Service for generating and managing alerts.
+
+Alerts are evaluated and persisted to the alerts table with their
+lifecycle (first_seen_at / last_seen_at / resolved_at). Writers refresh the
+alert types their data feeds once they commit (refresh_alerts): a sync
+refreshes stock, margin and sync errors, an ingredient load refreshes
+stock. Readers (/analytics/alerts, /owner-report/issues) read active rows;
+a full re-evaluation runs only when the last one is older than
+ALERTS_TTL_SECONDS. Evaluations are serialized across workers with an
+advisory lock; reader-triggered ones are also single-flight in-process.
 """
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import List, Dict, Any, Optional
-from datetime import date, datetime
+from typing import Callable, List, Dict, Any, Optional, Sequence
+from datetime import date, datetime, timedelta, timezone
 from enum import Enum
+from app.config import settings
+from app.models.alerts import Alert, AlertEvaluation
+from app.services.kpi_rollup_service import KpiRollupService
+from app.services.single_flight import SingleFlight, single_flight_method
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Key for pg_advisory_xact_lock taken while alerts are re-evaluated
+ALERTS_ADVISORY_LOCK_KEY = 774_201_002
+
+# Low margin alerts returned per request (top by revenue)
+LOW_MARGIN_ALERTS_LIMIT = 20
+
+_alert_flights = SingleFlight()
+
 
 class AlertType(str, Enum):
     """Types of alerts."""
@@ -26,6 +47,11 @@ class AlertSeverity(str, Enum):
     INFO = "info"
 
 
+# Alert types fed by each kind of write (see refresh_alerts)
+SYNC_ALERT_TYPES = (AlertType.LOW_STOCK, AlertType.LOW_MARGIN, AlertType.SYNC_ERROR)
+LOAD_ALERT_TYPES = (AlertType.LOW_STOCK,)
+
+
 class AlertService:
     """Service for generating and managing alerts."""
 
@@ -36,45 +62,191 @@ class AlertService:
         self,
         location_id: Optional[int] = None,
         alert_type: Optional[AlertType] = None,
-        severity: Optional[AlertSeverity] = None
+        severity: Optional[AlertSeverity] = None,
+        since: Optional[datetime] = None
     ) -> List[Dict[str, Any]]:
         """
-        Get all active alerts.
+        Get active alerts from the alerts table (fully re-evaluated when expired).
 
         Args:
             location_id: Filter by location ID
             alert_type: Filter by alert type
             severity: Filter by severity level
+            since: Mark alerts first seen after this moment as new (e.g. last visit)
 
         Returns:
-            List of alert dictionaries
+            List of alert dictionaries with first_seen_at, last_seen_at and is_new
         """
-        alerts = []
-
-        # Get low stock alerts
-        if alert_type is None or alert_type == AlertType.LOW_STOCK:
-            alerts.extend(self._get_low_stock_alerts(location_id))
-
-        # Get low margin alerts
-        if alert_type is None or alert_type == AlertType.LOW_MARGIN:
-            alerts.extend(self._get_low_margin_alerts(location_id))
+        if self._is_expired(self._latest_evaluation()):
+            self._refresh_expired()
 
-        # Get sync error alerts
-        if alert_type is None or alert_type == AlertType.SYNC_ERROR:
-            alerts.extend(self._get_sync_error_alerts(location_id))
-
-        # Get expiring stock alerts
-        if alert_type is None or alert_type == AlertType.EXPIRING_STOCK:
-            alerts.extend(self._get_expiring_stock_alerts(location_id))
+        query = self.db.query(Alert).filter(Alert.resolved_at.is_(None))
+        if location_id:
+            query = query.filter(Alert.location_id == location_id)
+        if alert_type:
+            query = query.filter(Alert.alert_type == alert_type.value)
+        if severity:
+            query = query.filter(Alert.severity == severity.value)
+        since = _as_utc(since) if since else None
 
-        # Filter by severity if specified
+        alerts = []
+        for row in query.all():
+            first_seen_at = _as_utc(row.first_seen_at)
+            alerts.append({
+                **row.payload,
+                "first_seen_at": first_seen_at.isoformat(),
+                "last_seen_at": _as_utc(row.last_seen_at).isoformat(),
+                "is_new": since is not None and first_seen_at > since,
+            })
+        return self.filter_alerts(alerts)
+
+    def filter_alerts(
+        self,
+        alerts: List[Dict[str, Any]],
+        alert_type: Optional[AlertType] = None,
+        severity: Optional[AlertSeverity] = None
+    ) -> List[Dict[str, Any]]:
+        """Filter alerts by type and severity, keep the top low margin alerts and sort."""
+        if alert_type:
+            alerts = [a for a in alerts if a.get("type") == alert_type.value]
         if severity:
             alerts = [a for a in alerts if a.get("severity") == severity.value]
 
+        # Низкая маржа: только самые крупные по выручке позиции
+        low_margin = [a for a in alerts if a.get("type") == AlertType.LOW_MARGIN.value]
+        if len(low_margin) > LOW_MARGIN_ALERTS_LIMIT:
+            low_margin.sort(key=lambda x: x.get("revenue", 0), reverse=True)
+            dropped = {id(a) for a in low_margin[LOW_MARGIN_ALERTS_LIMIT:]}
+            alerts = [a for a in alerts if id(a) not in dropped]
+
         # Sort by severity (critical first) and then by timestamp
         severity_order = {"critical": 0, "warning": 1, "info": 2}
-        alerts.sort(key=lambda x: (severity_order.get(x.get("severity", "info"), 2), x.get("timestamp", "")))
+        return sorted(alerts, key=lambda x: (severity_order.get(x.get("severity", "info"), 2), x.get("timestamp", "")))
 
+    def evaluate(self, alert_types: Optional[Sequence[AlertType]] = None) -> List[Dict[str, Any]]:
+        """
+        Compute alerts of the given types (all by default) for all locations in one pass.
+
+        Each type runs in its own savepoint, so a failing query does not
+        abort the transaction for the others. Does not commit: refresh()
+        holds the advisory lock until its own commit.
+        """
+        alert_types = set(alert_types or AlertType)
+        if AlertType.LOW_STOCK in alert_types:
+            # Расход ингредиентов (ingredient_usage_daily) пересобирается вместе с rollup;
+            # без commit, иначе освободится блокировка refresh()
+            KpiRollupService(self.db).process_dirty_days()
+
+        alerts = []
+        for alert_type, get_alerts in (
+            (AlertType.LOW_STOCK, self._get_low_stock_alerts),
+            (AlertType.LOW_MARGIN, self._get_low_margin_alerts),
+            (AlertType.SYNC_ERROR, self._get_sync_error_alerts),
+            (AlertType.EXPIRING_STOCK, self._get_expiring_stock_alerts),
+        ):
+            if alert_type in alert_types:
+                alerts.extend(self._evaluate_isolated(alert_type, get_alerts))
+        return alerts
+
+    def refresh(self, alert_types: Optional[Sequence[AlertType]] = None) -> int:
+        """
+        Evaluate alerts and reconcile the alerts table (commits).
+
+        New alerts are inserted with first_seen_at, alerts still found get
+        last_seen_at and the latest payload, active alerts of the evaluated
+        types that are gone are resolved. Only the given types are evaluated;
+        a full evaluation (None) is also recorded in alert_evaluations.
+
+        Returns:
+            Number of active alerts of the evaluated types
+        """
+        full = alert_types is None
+        alert_types = list(alert_types or AlertType)
+        if self.db.get_bind().dialect.name == "postgresql":
+            self.db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ALERTS_ADVISORY_LOCK_KEY})
+
+        now = datetime.now(timezone.utc)
+        evaluated = {_alert_key(alert): alert for alert in self.evaluate(alert_types)}
+        active = {
+            row.alert_key: row
+            for row in self.db.query(Alert).filter(
+                Alert.resolved_at.is_(None),
+                Alert.alert_type.in_([t.value for t in alert_types])
+            ).all()
+        }
+
+        created = 0
+        for key, alert in evaluated.items():
+            row = active.pop(key, None)
+            if row is None:
+                self.db.add(Alert(
+                    alert_key=key,
+                    alert_type=alert["type"],
+                    severity=alert["severity"],
+                    location_id=alert.get("location_id"),
+                    payload=alert,
+                    first_seen_at=now,
+                    last_seen_at=now,
+                ))
+                created += 1
+            else:
+                row.severity = alert["severity"]
+                row.location_id = alert.get("location_id")
+                row.payload = alert
+                row.last_seen_at = now
+        for row in active.values():
+            row.resolved_at = now
+
+        self.db.query(Alert).filter(
+            Alert.resolved_at < now - timedelta(days=settings.ALERTS_RESOLVED_RETENTION_DAYS)
+        ).delete(synchronize_session=False)
+        if full:
+            self.db.add(AlertEvaluation(
+                evaluated_at=now,
+                expires_at=now + timedelta(seconds=settings.ALERTS_TTL_SECONDS),
+                alerts_count=len(evaluated),
+            ))
+            self.db.query(AlertEvaluation).filter(
+                AlertEvaluation.evaluated_at < now - timedelta(days=settings.ALERTS_EVALUATION_LOG_DAYS)
+            ).delete(synchronize_session=False)
+        self.db.commit()
+        logger.info(
+            f"Alerts refreshed ({', '.join(t.value for t in alert_types)}): "
+            f"{len(evaluated)} active, {created} new, {len(active)} resolved"
+        )
+        return len(evaluated)
+
+    @single_flight_method(_alert_flights)
+    def _refresh_expired(self) -> None:
+        if self.db.get_bind().dialect.name == "postgresql":
+            # Другой воркер мог пересчитать, пока мы ждали блокировку
+            self.db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ALERTS_ADVISORY_LOCK_KEY})
+            if not self._is_expired(self._latest_evaluation()):
+                self.db.commit()
+                return
+        self.refresh()
+
+    def _latest_evaluation(self) -> Optional[AlertEvaluation]:
+        return self.db.query(AlertEvaluation).order_by(AlertEvaluation.evaluated_at.desc()).first()
+
+    def _is_expired(self, evaluation: Optional[AlertEvaluation]) -> bool:
+        if evaluation is None:
+            return True
+        return _as_utc(evaluation.expires_at) <= datetime.now(timezone.utc)
+
+    def _evaluate_isolated(
+        self,
+        alert_type: AlertType,
+        get_alerts: Callable[[], List[Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        savepoint = self.db.begin_nested()
+        try:
+            alerts = get_alerts()
+        except Exception as e:
+            savepoint.rollback()
+            logger.error(f"Error getting {alert_type.value} alerts: {str(e)}")
+            return []
+        savepoint.commit()
         return alerts
 
     def _get_low_stock_alerts(self, location_id: Optional[int] = None) -> List[Dict[str, Any]]:
@@ -100,37 +272,34 @@ class AlertService:
             query += " AND location_id = :location_id"
             params['location_id'] = location_id
 
-        try:
-            results = self.db.execute(text(query), params).fetchall()
-            for row in results:
-                balance = float(row[4]) if row[4] else 0
-                threshold = float(row[5]) if row[5] else 0
-                days_left = row[7] if row[7] else None
-
-                # Determine severity based on how low the stock is
-                if balance <= threshold * 0.5:
-                    severity = AlertSeverity.CRITICAL
-                elif balance <= threshold * 0.75:
-                    severity = AlertSeverity.WARNING
-                else:
-                    severity = AlertSeverity.INFO
-
-                alerts.append({
-                    "type": AlertType.LOW_STOCK.value,
-                    "severity": severity.value,
-                    "ingredient_code": row[0],
-                    "ingredient_name": row[1],
-                    "location_id": row[2],
-                    "location_name": row[3],
-                    "balance": balance,
-                    "threshold": threshold,
-                    "unit": row[6],
-                    "days_left": days_left,
-                    "message": f"Низкий остаток: {row[1]} в {row[3]} ({balance:.2f} {row[6]} <= {threshold:.2f} {row[6]})",
-                    "timestamp": datetime.now().isoformat()
-                })
-        except Exception as e:
-            logger.error(f"Error getting low stock alerts: {str(e)}")
+        results = self.db.execute(text(query), params).fetchall()
+        for row in results:
+            balance = float(row[4]) if row[4] else 0
+            threshold = float(row[5]) if row[5] else 0
+            days_left = row[7] if row[7] else None
+
+            # Determine severity based on how low the stock is
+            if balance <= threshold * 0.5:
+                severity = AlertSeverity.CRITICAL
+            elif balance <= threshold * 0.75:
+                severity = AlertSeverity.WARNING
+            else:
+                severity = AlertSeverity.INFO
+
+            alerts.append({
+                "type": AlertType.LOW_STOCK.value,
+                "severity": severity.value,
+                "ingredient_code": row[0],
+                "ingredient_name": row[1],
+                "location_id": row[2],
+                "location_name": row[3],
+                "balance": balance,
+                "threshold": threshold,
+                "unit": row[6],
+                "days_left": days_left,
+                "message": f"Низкий остаток: {row[1]} в {row[3]} ({balance:.2f} {row[6]} <= {threshold:.2f} {row[6]})",
+                "timestamp": datetime.now().isoformat()
+            })
 
         return alerts
 
@@ -154,42 +323,39 @@ class AlertService:
             query += " AND location_id = :location_id"
             params['location_id'] = location_id
 
-        query += " ORDER BY revenue DESC LIMIT 20"
-
-        try:
-            results = self.db.execute(text(query), params).fetchall()
-            for row in results:
-                margin_pct = float(row[3]) if row[3] else 0
-                revenue = float(row[4]) if row[4] else 0
-
-                # Determine severity based on margin
-                if margin_pct < 10:
-                    severity = AlertSeverity.CRITICAL
-                elif margin_pct < 20:
-                    severity = AlertSeverity.WARNING
-                else:
-                    severity = AlertSeverity.INFO
-
-                alerts.append({
-                    "type": AlertType.LOW_MARGIN.value,
-                    "severity": severity.value,
-                    "drink_id": row[0],
-                    "drink_name": row[1],
-                    "location_id": row[2],
-                    "location_name": None,  # vw_kpi_product doesn't have location_name
-                    "margin_pct": margin_pct,
-                    "revenue": revenue,
-                    "sales_count": int(row[5]) if row[5] else 0,
-                    "message": f"Низкая маржа: {row[1]} ({margin_pct:.1f}% маржа, выручка {revenue:.2f} руб.)",
-                    "timestamp": datetime.now().isoformat()
-                })
-        except Exception as e:
-            logger.error(f"Error getting low margin alerts: {str(e)}")
+        query += " ORDER BY revenue DESC"
+
+        results = self.db.execute(text(query), params).fetchall()
+        for row in results:
+            margin_pct = float(row[3]) if row[3] else 0
+            revenue = float(row[4]) if row[4] else 0
+
+            # Determine severity based on margin
+            if margin_pct < 10:
+                severity = AlertSeverity.CRITICAL
+            elif margin_pct < 20:
+                severity = AlertSeverity.WARNING
+            else:
+                severity = AlertSeverity.INFO
+
+            alerts.append({
+                "type": AlertType.LOW_MARGIN.value,
+                "severity": severity.value,
+                "drink_id": row[0],
+                "drink_name": row[1],
+                "location_id": row[2],
+                "location_name": None,  # vw_kpi_product doesn't have location_name
+                "margin_pct": margin_pct,
+                "revenue": revenue,
+                "sales_count": int(row[5]) if row[5] else 0,
+                "message": f"Низкая маржа: {row[1]} ({margin_pct:.1f}% маржа, выручка {revenue:.2f} руб.)",
+                "timestamp": datetime.now().isoformat()
+            })
 
         return alerts
 
     def _get_sync_error_alerts(self, location_id: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Get alerts for sync errors."""
+        """Get alerts for sync errors (sync runs are not tied to a location)."""
         alerts = []
 
         query = """
@@ -198,37 +364,36 @@ class AlertService:
                 started_at,
                 ok,
                 message,
-                location_id
+                completed_at,
+                period_start,
+                period_end
             FROM sync_runs
-            WHERE ok = false
-              AND started_at >= NOW() - INTERVAL '7 days'
+            WHERE status = 'error'
+              AND started_at >= :since
             ORDER BY started_at DESC
             LIMIT 10
         """
-        params = {}
 
-        if location_id:
-            query = query.replace("WHERE ok = false", "WHERE ok = false AND location_id = :location_id")
-            params['location_id'] = location_id
-
-        try:
-            results = self.db.execute(text(query), params).fetchall()
-            for row in results:
-                run_at = row[1] if isinstance(row[1], str) else row[1].isoformat() if row[1] else None
-                error_message = row[3] if row[3] else "Неизвестная ошибка"
-
-                alerts.append({
-                    "type": AlertType.SYNC_ERROR.value,
-                    "severity": AlertSeverity.CRITICAL.value,
-                    "sync_run_id": row[0],
-                    "run_at": run_at,
-                    "error_message": error_message,
-                    "location_id": row[4] if len(row) > 4 else None,
-                    "message": f"Ошибка синхронизации: {error_message}",
-                    "timestamp": datetime.now().isoformat()
-                })
-        except Exception as e:
-            logger.error(f"Error getting sync error alerts: {str(e)}")
+        # A running job also has ok = false until it finishes: only finished failures count
+        since = datetime.now(timezone.utc) - timedelta(days=7)
+        results = self.db.execute(text(query), {"since": since}).fetchall()
+        for row in results:
+            run_at = row[1] if isinstance(row[1], str) else row[1].isoformat() if row[1] else None
+            error_message = row[3] if row[3] else "Неизвестная ошибка"
+
+            alerts.append({
+                "type": AlertType.SYNC_ERROR.value,
+                "severity": AlertSeverity.CRITICAL.value,
+                "sync_run_id": row[0],
+                "run_at": run_at,
+                "completed_at": row[4].isoformat() if row[4] else None,
+                "period_start": row[5].isoformat() if row[5] else None,
+                "period_end": row[6].isoformat() if row[6] else None,
+                "error_message": error_message,
+                "location_id": None,
+                "message": f"Ошибка синхронизации: {error_message}",
+                "timestamp": datetime.now().isoformat()
+            })
 
         return alerts
 
@@ -257,53 +422,50 @@ class AlertService:
             query += " AND location_id = :location_id"
             params['location_id'] = location_id
 
-        try:
-            results = self.db.execute(text(query), params).fetchall()
-            for row in results:
-                balance = float(row[4]) if row[4] else 0
-                days_threshold = int(row[5]) if row[5] else 3
-                expiry_date = row[7].isoformat() if hasattr(row[7], 'isoformat') else str(row[7]) if row[7] else None
-
-                # Calculate days until expiry
-                if expiry_date:
-                    try:
-                        if isinstance(expiry_date, str):
-                            expiry = datetime.fromisoformat(expiry_date.replace('Z', '+00:00'))
-                        else:
-                            expiry = expiry_date
-                        days_until_expiry = (expiry.date() - date.today()).days
-                    except:
-                        days_until_expiry = None
-                else:
+        results = self.db.execute(text(query), params).fetchall()
+        for row in results:
+            balance = float(row[4]) if row[4] else 0
+            days_threshold = int(row[5]) if row[5] else 3
+            expiry_date = row[7].isoformat() if hasattr(row[7], 'isoformat') else str(row[7]) if row[7] else None
+
+            # Calculate days until expiry
+            if expiry_date:
+                try:
+                    if isinstance(expiry_date, str):
+                        expiry = datetime.fromisoformat(expiry_date.replace('Z', '+00:00'))
+                    else:
+                        expiry = expiry_date
+                    days_until_expiry = (expiry.date() - date.today()).days
+                except:
                     days_until_expiry = None
+            else:
+                days_until_expiry = None
 
-                # Determine severity
-                if days_until_expiry is not None:
-                    if days_until_expiry <= 1:
-                        severity = AlertSeverity.CRITICAL
-                    elif days_until_expiry <= days_threshold:
-                        severity = AlertSeverity.WARNING
-                    else:
-                        severity = AlertSeverity.INFO
-                else:
+            # Determine severity
+            if days_until_expiry is not None:
+                if days_until_expiry <= 1:
+                    severity = AlertSeverity.CRITICAL
+                elif days_until_expiry <= days_threshold:
                     severity = AlertSeverity.WARNING
-
-                alerts.append({
-                    "type": AlertType.EXPIRING_STOCK.value,
-                    "severity": severity.value,
-                    "ingredient_code": row[0],
-                    "ingredient_name": row[1],
-                    "location_id": row[2],
-                    "location_name": row[3],
-                    "balance": balance,
-                    "unit": row[6],
-                    "expiry_date": expiry_date,
-                    "days_until_expiry": days_until_expiry,
-                    "message": f"Скоро истекает срок: {row[1]} в {row[3]} (осталось {days_until_expiry} дней)" if days_until_expiry else f"Скоро истекает срок: {row[1]} в {row[3]}",
-                    "timestamp": datetime.now().isoformat()
-                })
-        except Exception as e:
-            logger.error(f"Error getting expiring stock alerts: {str(e)}")
+                else:
+                    severity = AlertSeverity.INFO
+            else:
+                severity = AlertSeverity.WARNING
+
+            alerts.append({
+                "type": AlertType.EXPIRING_STOCK.value,
+                "severity": severity.value,
+                "ingredient_code": row[0],
+                "ingredient_name": row[1],
+                "location_id": row[2],
+                "location_name": row[3],
+                "balance": balance,
+                "unit": row[6],
+                "expiry_date": expiry_date,
+                "days_until_expiry": days_until_expiry,
+                "message": f"Скоро истекает срок: {row[1]} в {row[3]} (осталось {days_until_expiry} дней)" if days_until_expiry else f"Скоро истекает срок: {row[1]} в {row[3]}",
+                "timestamp": datetime.now().isoformat()
+            })
 
         return alerts
 
@@ -317,10 +479,13 @@ class AlertService:
         Returns:
             Dictionary with alert counts by type and severity
         """
-        all_alerts = self.get_all_alerts(location_id=location_id)
+        return self.summarize(self.get_all_alerts(location_id=location_id))
 
+    def summarize(self, all_alerts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Count alerts by type and severity."""
         summary = {
             "total": len(all_alerts),
+            "new": len([a for a in all_alerts if a.get("is_new")]),
             "by_type": {},
             "by_severity": {
                 "critical": 0,
@@ -343,3 +508,30 @@ class AlertService:
                 summary["by_severity"][severity] += 1
 
         return summary
+
+
+def refresh_alerts(db: Session, alert_types: Optional[Sequence[AlertType]] = None) -> None:
+    """
+    Refresh alerts after a committed write. Failures are logged and rolled
+    back: the write itself already succeeded and the TTL fallback catches up.
+    """
+    try:
+        AlertService(db).refresh(alert_types)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Alert refresh failed: {e}")
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite returns naive timestamps
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def _alert_key(alert: Dict[str, Any]) -> str:
+    """Identity of an alert: its type and the object it is about."""
+    alert_type = alert["type"]
+    if alert_type == AlertType.SYNC_ERROR.value:
+        return f"{alert_type}:{alert['sync_run_id']}"
+    if alert_type == AlertType.LOW_MARGIN.value:
+        return f"{alert_type}:{alert['drink_id']}:{alert.get('location_id')}"
+    return f"{alert_type}:{alert['ingredient_code']}:{alert.get('location_id')}"
@@ -0,0 +1,244 @@
+"""
+Drink cost engine — the single place where recipe cost (COGS) is computed.
+
+item_cost_rub holds the unit conversion rules that used to be repeated in
+vw_tx_cogs, the drinks endpoint and its Python twin. DrinkCostService
+evaluates them once per recipe revision and stores the result in
+drink_cost_snapshot, versioned by effective date; readers (tx_fact, the
+drinks list, recipe cost) join the snapshot instead of recomputing per
+transaction.
+
+Ingredient prices are effective-dated in ingredient_cost_history. tx_fact
+stamps each sale with the snapshot valid at tx_time, so a price change
+only affects sales made after it and old reports stay as they were.
+"""
+from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.models.business import Drink, DrinkItem, Ingredient, IngredientCostHistory, DrinkCostSnapshot
+from sqlalchemy import and_, or_
+import logging
+
+logger = logging.getLogger(__name__)
+
+# First version of a drink or ingredient cost covers the whole history
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Current cost per drink, for joins in raw SQL ({drink_filter} may narrow it)
+CURRENT_DRINK_COST_SQL = """
+    SELECT drink_id, cogs_rub as cogs
+    FROM drink_cost_snapshot
+    WHERE effective_to IS NULL
+      {drink_filter}
+"""
+
+# Join condition picking the snapshot valid at {tx_time} ({alias} = drink_cost_snapshot)
+AS_OF_DRINK_COST_JOIN = """
+    {alias}.drink_id = {drink_id}
+    AND {alias}.effective_from <= {tx_time}
+    AND ({alias}.effective_to IS NULL OR {alias}.effective_to > {tx_time})
+"""
+
+
+def item_cost_rub(
+    qty_per_unit: Decimal,
+    recipe_unit: str,
+    ingredient_unit: str,
+    cost_per_unit_rub: Optional[Decimal],
+    expense_kind: str = "stock_tracked",
+) -> Optional[Decimal]:
+    """
+    Cost of one recipe item in rubles, None if the ingredient is not costed.
+
+    Only stock-tracked ingredients with a price count towards COGS.
+    """
+    if cost_per_unit_rub is None or expense_kind != "stock_tracked":
+        return None
+    qty = Decimal(str(qty_per_unit or 0))
+    cost = Decimal(str(cost_per_unit_rub))
+    if recipe_unit == ingredient_unit:
+        # Если единицы совпадают, просто умножаем. Эвристика «g/g, цена > 100
+        # значит цена за кг» в старом CASE стояла после этой ветки и не срабатывала.
+        return qty * cost
+    if (recipe_unit, ingredient_unit) in (("g", "kg"), ("ml", "l")):
+        # Рецепт в граммах/миллилитрах, цена за килограмм/литр
+        return qty * cost / 1000
+    # Остальные случаи - просто умножаем (предполагаем одинаковые единицы)
+    return qty * cost
+
+
+class DrinkCostService:
+    """Service computing recipe costs and maintaining drink_cost_snapshot."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def compute(
+        self,
+        drink_ids: Iterable[int],
+        as_of: Optional[datetime] = None
+    ) -> Dict[int, Tuple[Decimal, List[dict]]]:
+        """
+        Compute recipe cost from the current drink_items and the ingredient
+        costs valid at as_of (current costs if None).
+
+        Ingredients without history rows fall back to their current values.
+
+        Returns:
+            drink_id -> (cogs_rub, [{ingredient_code, item_cost_rub}])
+        """
+        drink_ids = sorted(set(drink_ids))
+        costs: Dict[int, Tuple[Decimal, List[dict]]] = {drink_id: (Decimal(0), []) for drink_id in drink_ids}
+        if not drink_ids:
+            return costs
+
+        if as_of is None:
+            history_match = IngredientCostHistory.effective_to.is_(None)
+        else:
+            history_match = and_(
+                IngredientCostHistory.effective_from <= as_of,
+                or_(IngredientCostHistory.effective_to.is_(None), IngredientCostHistory.effective_to > as_of),
+            )
+        rows = (
+            self.db.query(DrinkItem, Ingredient, IngredientCostHistory)
+            .join(Ingredient, Ingredient.ingredient_code == DrinkItem.ingredient_code)
+            .outerjoin(IngredientCostHistory, and_(
+                IngredientCostHistory.ingredient_code == DrinkItem.ingredient_code,
+                history_match,
+            ))
+            .filter(DrinkItem.drink_id.in_(drink_ids))
+            .order_by(DrinkItem.drink_id, DrinkItem.ingredient_code)
+            .all()
+        )
+        for item, ingredient, price in rows:
+            price = price or ingredient
+            cost = item_cost_rub(
+                item.qty_per_unit, item.unit, price.unit,
+                price.cost_per_unit_rub, price.expense_kind,
+            )
+            total, items = costs[item.drink_id]
+            items.append({
+                "ingredient_code": item.ingredient_code,
+                "item_cost_rub": float(cost) if cost is not None else None,
+            })
+            costs[item.drink_id] = (total + (cost or 0), items)
+        return costs
+
+    def snapshot(self, drink_ids: Iterable[int], effective_from: Optional[datetime] = None) -> int:
+        """
+        Record a new cost version for drinks whose cost changed (does not commit).
+
+        The previous version is closed at effective_from; the first version
+        of a drink is effective since EPOCH.
+
+        Returns:
+            Number of drinks with a new version
+        """
+        effective_from = effective_from or datetime.now(timezone.utc)
+        costs = self.compute(drink_ids, as_of=effective_from)
+        if not costs:
+            return 0
+
+        current = {
+            snapshot.drink_id: snapshot
+            for snapshot in self.db.query(DrinkCostSnapshot).filter(
+                DrinkCostSnapshot.drink_id.in_(list(costs)),
+                DrinkCostSnapshot.effective_to.is_(None)
+            ).all()
+        }
+        existing_drinks = {
+            drink_id for (drink_id,) in self.db.query(Drink.id).filter(Drink.id.in_(list(costs))).all()
+        }
+
+        created = 0
+        for drink_id, (cogs, items) in costs.items():
+            if drink_id not in existing_drinks:
+                continue
+            previous = current.get(drink_id)
+            if previous is not None:
+                if Decimal(str(previous.cogs_rub)) == cogs and previous.items == items:
+                    continue
+                previous.effective_to = effective_from
+            self.db.add(DrinkCostSnapshot(
+                drink_id=drink_id,
+                effective_from=effective_from if previous is not None else EPOCH,
+                cogs_rub=cogs,
+                items=items,
+            ))
+            created += 1
+
+        if created:
+            self.db.flush()
+            logger.info(f"drink_cost_snapshot: new version for {created} drink(s)")
+        return created
+
+    def record_ingredient_costs(
+        self,
+        ingredient_codes: Iterable[str],
+        effective_from: Optional[datetime] = None
+    ) -> int:
+        """
+        Record the current price, unit and expense kind of ingredients in
+        ingredient_cost_history if they differ from the current row
+        (does not commit). The first row of an ingredient is effective since EPOCH.
+
+        Returns:
+            Number of ingredients with a new history row
+        """
+        codes = sorted(set(ingredient_codes))
+        if not codes:
+            return 0
+        effective_from = effective_from or datetime.now(timezone.utc)
+
+        current = {
+            row.ingredient_code: row
+            for row in self.db.query(IngredientCostHistory).filter(
+                IngredientCostHistory.ingredient_code.in_(codes),
+                IngredientCostHistory.effective_to.is_(None)
+            ).all()
+        }
+        created = 0
+        for ingredient in self.db.query(Ingredient).filter(Ingredient.ingredient_code.in_(codes)).all():
+            previous = current.get(ingredient.ingredient_code)
+            values = (ingredient.cost_per_unit_rub, ingredient.unit, ingredient.expense_kind)
+            if previous is not None:
+                if (previous.cost_per_unit_rub, previous.unit, previous.expense_kind) == values:
+                    continue
+                previous.effective_to = effective_from
+            self.db.add(IngredientCostHistory(
+                ingredient_code=ingredient.ingredient_code,
+                effective_from=effective_from if previous is not None else EPOCH,
+                cost_per_unit_rub=ingredient.cost_per_unit_rub,
+                unit=ingredient.unit,
+                expense_kind=ingredient.expense_kind,
+            ))
+            created += 1
+
+        if created:
+            self.db.flush()
+        return created
+
+    def drinks_using(self, ingredient_codes: Iterable[str]) -> List[int]:
+        """Drinks whose recipe contains any of the ingredients."""
+        codes = sorted(set(ingredient_codes))
+        if not codes:
+            return []
+        rows = (
+            self.db.query(DrinkItem.drink_id)
+            .filter(DrinkItem.ingredient_code.in_(codes))
+            .distinct()
+            .all()
+        )
+        return sorted(drink_id for (drink_id,) in rows)
+
+    def current(self, drink_ids: Iterable[int]) -> Dict[int, DrinkCostSnapshot]:
+        """Current cost versions by drink id."""
+        drink_ids = sorted(set(drink_ids))
+        if not drink_ids:
+            return {}
+        snapshots = self.db.query(DrinkCostSnapshot).filter(
+            DrinkCostSnapshot.drink_id.in_(drink_ids),
+            DrinkCostSnapshot.effective_to.is_(None)
+        ).all()
+        return {snapshot.drink_id: snapshot for snapshot in snapshots}
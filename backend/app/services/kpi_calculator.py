@@ -7,10 +7,15 @@ from sqlalchemy import text
 from typing import Dict, Any, Optional, List
 from datetime import date, datetime
 from decimal import Decimal
+from app.services.kpi_rollup_service import KpiRollupService
+from app.services.single_flight import SingleFlight, single_flight_method
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Identical concurrent KPI requests share one computation
+_kpi_flights = SingleFlight()
+
 
 class KPICalculator:
     """Service for calculating KPI metrics."""
@@ -18,6 +23,7 @@ class KPICalculator:
     def __init__(self, db: Session):
         self.db = db
 
+    @single_flight_method(_kpi_flights)
     def calculate_overview_kpis(
         self,
         from_date: Optional[date] = None,
@@ -109,6 +115,7 @@ class KPICalculator:
             logger.error(f"Error calculating overview KPIs: {str(e)}")
             raise
 
+    @single_flight_method(_kpi_flights)
     def calculate_daily_kpis(
         self,
         from_date: Optional[date] = None,
@@ -153,6 +160,8 @@ class KPICalculator:
         query += " ORDER BY tx_date DESC"
         
         try:
+            # vw_kpi_daily reads kpi_daily_rollup: rebuild days changed since the last read
+            KpiRollupService(self.db).ensure_fresh()
             results = self.db.execute(text(query), params).fetchall()
             daily_kpis = []
             
@@ -172,6 +181,7 @@ class KPICalculator:
             logger.error(f"Error calculating daily KPIs: {str(e)}")
             raise
 
+    @single_flight_method(_kpi_flights)
     def calculate_product_kpis(
         self,
         from_date: Optional[date] = None,
@@ -248,6 +258,7 @@ class KPICalculator:
             logger.error(f"Error calculating product KPIs: {str(e)}")
             raise
 
+    @single_flight_method(_kpi_flights)
     def calculate_sales_summary(
         self,
         from_date: Optional[date] = None,
@@ -280,6 +291,7 @@ class KPICalculator:
             "daily_breakdown": daily_kpis
         }
 
+    @single_flight_method(_kpi_flights)
     def calculate_margin_analysis(
         self,
         from_date: Optional[date] = None,
@@ -0,0 +1,135 @@
+"""
+Service maintaining kpi_daily_rollup — daily sales aggregates over tx_fact —
+and ingredient_usage_daily, the ingredient consumption ledger.
+
+TxFactService queues every day whose facts changed in kpi_dirty_days;
+process_dirty_days rebuilds the rollup and ledger rows of those days only,
+so daily dashboards and inventory balances read O(days) rows instead of
+aggregating all transactions. The queue is drained by each sync batch and
+by readers (ensure_fresh).
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import date
+from typing import Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class KpiRollupService:
+    """Service for the dirty-day queue and daily rollup rebuilds."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    @property
+    def enabled(self) -> bool:
+        return self.db.get_bind().dialect.name == "postgresql"
+
+    def mark_days_dirty(self, days: Iterable[date]) -> None:
+        """Queue days for a rollup rebuild (does not commit)."""
+        days = sorted(set(days))
+        if not days or not self.enabled:
+            return
+        self.db.execute(
+            text("""
+                INSERT INTO kpi_dirty_days (tx_date)
+                SELECT unnest(CAST(:days AS date[]))
+                ON CONFLICT (tx_date) DO NOTHING
+            """),
+            {"days": days}
+        )
+
+    def process_dirty_days(self, limit: Optional[int] = None) -> List[date]:
+        """
+        Take days from the queue and rebuild their rollup and ledger rows (does not commit).
+
+        Queue rows are locked with SKIP LOCKED, so concurrent workers never
+        rebuild the same day; a day re-queued meanwhile waits for this
+        transaction and is rebuilt again by the next call.
+
+        Returns:
+            Rebuilt days
+        """
+        if not self.enabled:
+            return []
+
+        self.db.flush()
+        days = self.db.execute(
+            text(f"""
+                DELETE FROM kpi_dirty_days
+                WHERE tx_date IN (
+                    SELECT tx_date FROM kpi_dirty_days
+                    ORDER BY tx_date
+                    {"LIMIT :limit" if limit else ""}
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING tx_date
+            """),
+            {"limit": limit} if limit else {}
+        ).scalars().all()
+        if not days:
+            return []
+
+        self.db.execute(
+            text("DELETE FROM kpi_daily_rollup WHERE tx_date = ANY(:days)"),
+            {"days": days}
+        )
+        self.db.execute(
+            text("""
+                INSERT INTO kpi_daily_rollup (
+                    tx_date, location_id, term_id, drink_id,
+                    sales_count, revenue, cogs, gross_profit, updated_at
+                )
+                SELECT
+                    tx_date,
+                    location_id,
+                    term_id,
+                    drink_id,
+                    COUNT(*),
+                    SUM(sum_kopecks) / 100.0,
+                    SUM(cogs),
+                    SUM(sum_kopecks) / 100.0 - SUM(cogs),
+                    now()
+                FROM tx_fact
+                WHERE tx_date = ANY(:days)
+                  AND sum_kopecks > 0
+                GROUP BY tx_date, location_id, term_id, drink_id
+            """),
+            {"days": days}
+        )
+
+        self.db.execute(
+            text("DELETE FROM ingredient_usage_daily WHERE tx_date = ANY(:days)"),
+            {"days": days}
+        )
+        self.db.execute(
+            text("""
+                INSERT INTO ingredient_usage_daily (
+                    tx_date, location_id, ingredient_code, qty_used, updated_at
+                )
+                SELECT
+                    f.tx_date,
+                    f.location_id,
+                    di.ingredient_code,
+                    SUM(di.qty_per_unit),
+                    now()
+                FROM tx_fact f
+                JOIN drink_items di ON di.drink_id = f.drink_id
+                WHERE f.tx_date = ANY(:days)
+                  AND f.sum_kopecks > 0
+                GROUP BY f.tx_date, f.location_id, di.ingredient_code
+            """),
+            {"days": days}
+        )
+
+        logger.info(f"kpi_daily_rollup rebuilt for {len(days)} day(s): {min(days)}..{max(days)}")
+        return days
+
+    def ensure_fresh(self) -> int:
+        """Drain the queue before reading the rollup; commits if anything was rebuilt."""
+        days = self.process_dirty_days()
+        if days:
+            self.db.commit()
+        return len(days)
@@ -0,0 +1,152 @@
+"""
+Owner report engine — period totals, expenses, fees and top products.
+
+Everything is computed by one query over kpi_daily_rollup: the same rows
+feed the totals, the top-10 drinks and the (day, location) keys that
+variable expenses are matched against, as in vw_owner_report_daily.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import date
+from typing import Optional
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Комиссии: 8.95% от выручки
+FEES_RATE = 0.0895
+
+OWNER_REPORT_SQL = """
+    WITH days AS (
+        SELECT
+            tx_date,
+            location_id,
+            drink_id,
+            SUM(sales_count) as sales_count,
+            SUM(revenue) as revenue,
+            SUM(cogs) as cogs,
+            SUM(gross_profit) as gross_profit
+        FROM kpi_daily_rollup
+        WHERE tx_date >= :from_date AND tx_date <= :to_date
+          {location_filter}
+        GROUP BY tx_date, location_id, drink_id
+    ),
+    totals AS (
+        SELECT
+            COALESCE(SUM(sales_count), 0) as transactions_count,
+            COALESCE(SUM(revenue), 0) as revenue_gross,
+            COALESCE(SUM(cogs), 0) as cogs_total
+        FROM days
+    ),
+    -- Расходы считаются только за дни/локации с продажами (как в vw_owner_report_daily)
+    expenses AS (
+        SELECT COALESCE(SUM(ve.amount_rub), 0) as expenses_total
+        FROM variable_expenses ve
+        LEFT JOIN vendista_terminals vt ON vt.id = ve.vendista_term_id
+        WHERE ve.expense_date >= :from_date AND ve.expense_date <= :to_date
+          AND EXISTS (
+              SELECT 1 FROM days k
+              WHERE k.tx_date = ve.expense_date
+                AND COALESCE(k.location_id, -1) = COALESCE(vt.location_id, -1)
+          )
+    ),
+    top_products AS (
+        SELECT
+            p.drink_id,
+            d.name as drink_name,
+            SUM(p.sales_count) as sales_count,
+            SUM(p.revenue) as revenue,
+            SUM(p.cogs) as cogs,
+            SUM(p.gross_profit) as gross_profit
+        FROM days p
+        LEFT JOIN drinks d ON d.id = p.drink_id
+        GROUP BY p.drink_id, d.name
+        ORDER BY SUM(p.revenue) DESC, p.drink_id
+        LIMIT 10
+    )
+    SELECT
+        t.transactions_count,
+        t.revenue_gross,
+        t.cogs_total,
+        e.expenses_total,
+        (SELECT json_agg(top_products ORDER BY revenue DESC, drink_id) FROM top_products) as top_products
+    FROM totals t
+    CROSS JOIN expenses e
+"""
+
+
+class OwnerReportService:
+    """Service computing the owner report for a period."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def build(self, period_start: date, period_end: date, location_id: Optional[int] = None) -> dict:
+        """
+        Compute the owner report in a single query.
+
+        Reads kpi_daily_rollup as is: callers drain the dirty-day queue
+        (KpiRollupService.ensure_fresh) first.
+        """
+        params = {'from_date': period_start, 'to_date': period_end}
+        location_filter = ""
+        if location_id:
+            location_filter = "AND location_id = :location_id"
+            params['location_id'] = location_id
+
+        row = self.db.execute(
+            text(OWNER_REPORT_SQL.format(location_filter=location_filter)),
+            params
+        ).fetchone()
+
+        transactions_count = int(row[0]) if row[0] else 0
+        revenue_gross = float(row[1]) if row[1] else 0.0
+        cogs_total = float(row[2]) if row[2] else 0.0
+        expenses_total = float(row[3]) if row[3] else 0.0
+        top_rows = row[4] or []
+        if isinstance(top_rows, str):
+            top_rows = json.loads(top_rows)
+
+        fees_total = round(revenue_gross * FEES_RATE, 2)
+
+        # Чистая прибыль: выручка - COGS - комиссии - переменные расходы
+        gross_profit = revenue_gross - cogs_total
+        net_profit = gross_profit - fees_total - expenses_total if transactions_count > 0 else 0.0
+
+        avg_check = revenue_gross / transactions_count if transactions_count > 0 else 0.0
+        gross_margin_pct = (gross_profit / revenue_gross * 100) if revenue_gross > 0 else 0.0
+        net_margin_pct = (net_profit / revenue_gross * 100) if revenue_gross > 0 else 0.0
+
+        top_products = [
+            {
+                "drink_id": item["drink_id"],
+                "drink_name": item["drink_name"],
+                "sales_count": int(item["sales_count"]),
+                "revenue": float(item["revenue"]),
+                "cogs": float(item["cogs"]),
+                "gross_profit": float(item["gross_profit"])
+            }
+            for item in top_rows
+        ]
+
+        logger.debug(
+            f"Owner report {period_start}..{period_end} location={location_id}: "
+            f"tx={transactions_count}, revenue={revenue_gross}"
+        )
+
+        return {
+            "period_start": period_start.isoformat(),
+            "period_end": period_end.isoformat(),
+            "revenue_gross": revenue_gross,
+            "fees_total": fees_total,
+            "expenses_total": expenses_total,
+            "net_profit": net_profit,
+            "transactions_count": transactions_count,
+            "avg_check": round(avg_check, 2),
+            "gross_profit": round(gross_profit, 2),
+            "gross_margin_pct": round(gross_margin_pct, 2),
+            "net_margin_pct": round(net_margin_pct, 2),
+            "cogs_total": round(cogs_total, 2),
+            "top_products": top_products
+        }
@@ -7,6 +7,7 @@ from app.crud import business as crud
 from app.models.business import Drink, DrinkItem
 from app.schemas.business import DrinkCreate, DrinkUpdate, DrinkCloneRequest, DrinkItemCreate
 from app.api.middleware.error_handlers import BusinessLogicError
+from app.services.drink_cost_service import item_cost_rub
 import logging
 
 logger = logging.getLogger(__name__)
@@ -88,8 +89,11 @@ class RecipeService:
                 logger.warning(f"Ingredient {item.ingredient_code} not found for cost calculation")
                 continue
 
-            # Calculate cost for this item
-            item_cost = float(item.qty_per_unit) * float(ingredient.cost_per_unit_rub or 0)
+            # Единые правила пересчёта единиц (как в drink_cost_snapshot)
+            item_cost = float(item_cost_rub(
+                item.qty_per_unit, item.unit, ingredient.unit,
+                ingredient.cost_per_unit_rub, ingredient.expense_kind,
+            ) or 0)
             total_cost += item_cost
 
             item_costs.append({
@@ -0,0 +1,260 @@
+"""
+Result cache for analytics endpoints.
+
+Results are keyed by endpoint + normalized params + the generations of the
+data scopes the endpoint reads. Writers do not delete entries: they bump
+the generation of a scope after their transaction commits, so stale
+entries simply stop being addressed and age out (LRU / TTL).
+
+Writers call invalidate_on_commit(db, SCOPE) inside the transaction; the
+Session after_commit hook bumps the generations, a rollback discards them.
+
+Backends:
+- memory: in-process LRU + TTL. With WEB_CONCURRENCY > 1 the generations
+  are kept in result_cache_generations instead (one primary-key query per
+  lookup), so a commit in one worker invalidates the entries of all of
+  them; without PostgreSQL the cache is then disabled.
+- redis: shared between workers; any server speaking GET/SETEX/INCR/MGET
+  works (Redis, KeyDB, Valkey, local stand-ins). Requires the optional
+  `redis` package; falls back to memory if it is missing.
+"""
+from collections import OrderedDict
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from fastapi.encoders import jsonable_encoder
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+from app.config import settings
+from app.db.session import engine
+from app.models.result_cache import ResultCacheGeneration
+import json
+import logging
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Data scopes with their own generation counter
+SALES = "sales"        # transactions ingested by sync
+EXPENSES = "expenses"  # variable_expenses
+RECIPES = "recipes"    # drinks, recipes, ingredient costs
+MATRIX = "matrix"      # button matrices, terminal assignments and locations
+
+ALL_SCOPES = (SALES, EXPENSES, RECIPES, MATRIX)
+
+_SESSION_SCOPES_KEY = "result_cache_scopes"
+
+
+class MemoryCacheBackend:
+    """In-process LRU with per-entry TTL."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generations(self, scopes: Sequence[str]) -> List[int]:
+        with self._lock:
+            return [self._generations.get(scope, 0) for scope in scopes]
+
+    def bump(self, scopes: Iterable[str]) -> None:
+        with self._lock:
+            for scope in scopes:
+                self._generations[scope] = self._generations.get(scope, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedGenerationsMemoryBackend(MemoryCacheBackend):
+    """In-process LRU whose generations live in result_cache_generations (shared by workers)."""
+
+    def __init__(self, bind: Engine, max_entries: int = 512):
+        super().__init__(max_entries=max_entries)
+        self.bind = bind
+
+    def generations(self, scopes: Sequence[str]) -> List[int]:
+        query = select(ResultCacheGeneration.scope, ResultCacheGeneration.generation).where(
+            ResultCacheGeneration.scope.in_(scopes)
+        )
+        with self.bind.connect() as conn:
+            current = dict(conn.execute(query).all())
+        return [current.get(scope, 0) for scope in scopes]
+
+    def bump(self, scopes: Iterable[str]) -> None:
+        insert = pg_insert if self.bind.dialect.name == "postgresql" else sqlite_insert
+        stmt = insert(ResultCacheGeneration).values(
+            [{"scope": scope, "generation": 1} for scope in sorted(set(scopes))]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ResultCacheGeneration.scope],
+            set_={"generation": ResultCacheGeneration.generation + 1},
+        )
+        with self.bind.begin() as conn:
+            conn.execute(stmt)
+
+
+class RedisCacheBackend:
+    """Shared cache in Redis; values are stored as JSON."""
+
+    def __init__(self, url: str, namespace: str = "vending"):
+        self.client = redis.Redis.from_url(url, socket_timeout=1.0)
+        self.namespace = namespace
+
+    def _generation_key(self, scope: str) -> str:
+        return f"{self.namespace}:gen:{scope}"
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(f"{self.namespace}:{key}")
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+        self.client.setex(f"{self.namespace}:{key}", ttl_seconds, json.dumps(jsonable_encoder(value)))
+
+    def generations(self, scopes: Sequence[str]) -> List[int]:
+        values = self.client.mget([self._generation_key(scope) for scope in scopes])
+        return [int(value) if value is not None else 0 for value in values]
+
+    def bump(self, scopes: Iterable[str]) -> None:
+        pipe = self.client.pipeline()
+        for scope in scopes:
+            pipe.incr(self._generation_key(scope))
+        pipe.execute()
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(f"{self.namespace}:analytics:*"):
+            self.client.delete(key)
+
+
+class ResultCache:
+    """Endpoint result cache with generation-based invalidation."""
+
+    def __init__(self, backend=None, ttl_seconds: int = 120, enabled: bool = True):
+        self.backend = backend or MemoryCacheBackend()
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+
+    @staticmethod
+    def make_key(endpoint: str, params: dict, generations: Sequence[int]) -> str:
+        normalized = json.dumps(
+            {k: v for k, v in params.items() if v is not None},
+            sort_keys=True,
+            default=str,
+            separators=(",", ":")
+        )
+        return f"analytics:{endpoint}:{'.'.join(map(str, generations))}:{normalized}"
+
+    def get_or_compute(
+        self,
+        endpoint: str,
+        params: dict,
+        compute: Callable[[], Any],
+        scopes: Sequence[str] = ALL_SCOPES,
+    ) -> Any:
+        """Return the cached result or compute and store it."""
+        if not self.enabled:
+            return compute()
+
+        try:
+            key = self.make_key(endpoint, params, self.backend.generations(scopes))
+            cached = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Result cache unavailable, computing {endpoint}: {e}")
+            return compute()
+        if cached is not None:
+            return cached
+
+        value = compute()
+        try:
+            self.backend.set(key, value, self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Result cache write failed for {endpoint}: {e}")
+        return value
+
+    def bump(self, *scopes: str) -> None:
+        """Invalidate every cached result that reads any of the scopes."""
+        if not scopes:
+            return
+        try:
+            self.backend.bump(scopes)
+        except Exception as e:
+            logger.warning(f"Result cache generation bump failed for {scopes}: {e}")
+
+
+def invalidate_on_commit(db: Session, *scopes: str) -> None:
+    """Bump the scopes once the current transaction of db commits."""
+    db.info.setdefault(_SESSION_SCOPES_KEY, set()).update(scopes)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session: Session) -> None:
+    scopes = session.info.pop(_SESSION_SCOPES_KEY, None)
+    if scopes:
+        result_cache.bump(*sorted(scopes))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_on_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop(_SESSION_SCOPES_KEY, None)
+
+
+def _create_result_cache() -> ResultCache:
+    backend_name = settings.RESULT_CACHE_BACKEND
+    backend = None
+    if backend_name == "redis":
+        if redis is None:
+            logger.warning("RESULT_CACHE_BACKEND=redis but the redis package is not installed, using memory")
+        elif not settings.REDIS_URL:
+            logger.warning("RESULT_CACHE_BACKEND=redis but REDIS_URL is empty, using memory")
+        else:
+            backend = RedisCacheBackend(settings.REDIS_URL)
+    enabled = backend_name != "none"
+    if backend is None:
+        if settings.WEB_CONCURRENCY > 1 and engine.dialect.name == "postgresql":
+            # Per-process generations would let other workers serve stale results
+            backend = SharedGenerationsMemoryBackend(engine, max_entries=settings.RESULT_CACHE_MAX_ENTRIES)
+        else:
+            backend = MemoryCacheBackend(max_entries=settings.RESULT_CACHE_MAX_ENTRIES)
+            if enabled and settings.WEB_CONCURRENCY > 1:
+                logger.warning(
+                    "Memory result cache can't share generations between %s workers without PostgreSQL, disabling it",
+                    settings.WEB_CONCURRENCY,
+                )
+                enabled = False
+    return ResultCache(
+        backend=backend,
+        ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+        enabled=enabled,
+    )
+
+
+# Global cache instance
+result_cache = _create_result_cache()
@@ -0,0 +1,78 @@
+"""
+Request coalescing for identical concurrent computations.
+
+Sync endpoints run in the threadpool, so when several clients ask for the
+same report at once each thread would run the same heavy query. With
+single-flight the first caller (leader) computes and the others wait for
+its result — or its exception.
+"""
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Return fn() or the result of an in-flight call with the same key."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logger.debug(f"single-flight {key[0] if isinstance(key, tuple) else key}: shared with {call.waiters} caller(s)")
+        return call.result
+
+
+def single_flight_method(group: SingleFlight) -> Callable:
+    """
+    Coalesce concurrent calls of a service method with equal arguments.
+
+    The instance (and its db session) is not part of the key: waiters get
+    the result computed with the leader's session.
+    """
+    def decorator(method: Callable) -> Callable:
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = (method.__qualname__, args, tuple(sorted(kwargs.items())))
+            return group.do(key, lambda: method(self, *args, **kwargs))
+        return wrapper
+    return decorator
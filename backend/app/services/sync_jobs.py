@@ -0,0 +1,392 @@
+"""
+Background runner for Vendista sync jobs.
+Accepts sync requests without blocking the HTTP worker, enforces single-flight
+execution and runs the periodic incremental/reconcile schedule.
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, date, timedelta, timezone
+from typing import Callable, List, Optional, Set
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from app.config import settings
+from app.db.session import SessionLocal
+from app.services.vendista_sync import sync_service
+from app.services.alert_service import refresh_alerts, SYNC_ALERT_TYPES
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Key for pg_advisory_lock shared by all API workers
+SYNC_ADVISORY_LOCK_KEY = 774_201_001
+
+
+class SyncAlreadyRunningError(Exception):
+    """Raised when a sync is requested while another one is in progress."""
+
+    def __init__(self, run_id: Optional[int] = None):
+        self.run_id = run_id
+        message = "Another sync is already running"
+        if run_id is not None:
+            message += f" (run {run_id})"
+        super().__init__(message)
+
+
+@dataclass
+class SyncJob:
+    """Parameters of one sync job."""
+    mode: str = "full"  # 'full' or 'incremental'
+    trigger: str = "manual"  # 'manual', 'rerun' or 'schedule'
+    period_start: Optional[date] = None
+    period_end: Optional[date] = None
+    items_per_page: int = 50
+    order_desc: bool = True
+    start_page: int = 1
+    term_ids: Optional[List[int]] = None
+
+
+class SyncJobRunner:
+    """
+    In-process async job runner for Vendista syncs.
+
+    Only one sync runs at a time: an in-process flag guards the current
+    worker and a PostgreSQL advisory lock guards other workers and
+    processes. The lock is session-level, so it is taken on a dedicated
+    connection held for the whole job: the job's own Session commits and
+    returns its connection to the pool between steps.
+
+    Every worker runs the schedule loop; a scheduled run starts only if no
+    run of its mode was started for the current slot (see _submit).
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+        self.current_run_id: Optional[int] = None
+        self._busy = False
+        self._tasks: Set[asyncio.Task] = set()
+        self._scheduler_task: Optional[asyncio.Task] = None
+        self._lock_conn: Optional[Connection] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._busy
+
+    async def submit(self, job: SyncJob) -> int:
+        """
+        Record a sync run and start it in the background.
+
+        Returns:
+            sync_runs.id of the accepted job (use it to poll status)
+
+        Raises:
+            SyncAlreadyRunningError: If a sync is already in progress
+        """
+        return await self._submit(job)
+
+    async def _submit(self, job: SyncJob, not_before: Optional[datetime] = None) -> Optional[int]:
+        """
+        Start the job; with not_before, only if no scheduled run of the same
+        mode started since then (checked under the lock, so the schedules of
+        all workers start one run per slot). Returns None if it is not due.
+        """
+        # No await between the check and the flag: atomic within the event loop
+        if self._busy:
+            raise SyncAlreadyRunningError(self.current_run_id)
+        self._busy = True
+
+        db = self.session_factory()
+        try:
+            if not self._try_advisory_lock(db):
+                raise SyncAlreadyRunningError()
+            if not_before is not None:
+                last_started = self._last_scheduled_start(db, job.mode)
+                if last_started is not None and last_started >= not_before:
+                    db.rollback()
+                    self._release(db)
+                    self._busy = False
+                    return None
+            run_id = self._create_run(db, job)
+        except Exception:
+            self._release(db)
+            self._busy = False
+            raise
+
+        self.current_run_id = run_id
+        task = asyncio.create_task(self._run(db, run_id, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        logger.info("Accepted %s sync job %s (trigger=%s)", job.mode, run_id, job.trigger)
+        return run_id
+
+    async def _run(self, db: Session, run_id: int, job: SyncJob) -> None:
+        """
+        Execute the job and record its outcome in sync_runs.
+
+        The job runs on the API worker's event loop: its blocking DB work
+        (batches, bookkeeping, alerts) goes through asyncio.to_thread, one
+        call at a time on the job's own session.
+        """
+        started_at = datetime.utcnow()
+        try:
+            if job.mode == "incremental":
+                result = await sync_service.sync_incremental(
+                    db=db,
+                    term_ids=job.term_ids,
+                    items_per_page=job.items_per_page,
+                )
+            else:
+                result = await sync_service.sync_all_from_vendista(
+                    db=db,
+                    period_start=job.period_start,
+                    period_end=job.period_end,
+                    items_per_page=job.items_per_page,
+                    order_desc=job.order_desc,
+                    start_page=job.start_page,
+                )
+            await asyncio.to_thread(self._finish_run, db, run_id, {
+                "period_start": result.window_start.date() if result.window_start else job.period_start,
+                "period_end": result.window_end.date() if result.window_end else job.period_end,
+                "fetched": result.fetched,
+                "inserted": result.inserted,
+                "skipped_duplicates": result.skipped_duplicates,
+                "expected_total": result.expected_total,
+                "pages_fetched": result.pages_fetched,
+                "items_per_page": result.items_per_page,
+                "last_page": result.last_page,
+                "ok": result.success,
+                "status": "success" if result.success else "error",
+                "message": result.error_message or "Sync completed successfully",
+            })
+            logger.info(
+                "Sync job %s finished in %.1fs (ok=%s, inserted=%s)",
+                run_id,
+                (datetime.utcnow() - started_at).total_seconds(),
+                result.success,
+                result.inserted,
+            )
+        except Exception as e:
+            logger.error(f"Sync job {run_id} failed: {e}", exc_info=True)
+            db.rollback()
+            try:
+                await asyncio.to_thread(self._finish_run, db, run_id, {
+                    "period_start": job.period_start,
+                    "period_end": job.period_end,
+                    "fetched": 0,
+                    "inserted": 0,
+                    "skipped_duplicates": 0,
+                    "expected_total": None,
+                    "pages_fetched": None,
+                    "items_per_page": job.items_per_page,
+                    "last_page": None,
+                    "ok": False,
+                    "status": "error",
+                    "message": str(e),
+                })
+            except Exception as record_error:
+                logger.warning(f"Failed to record sync job {run_id} failure: {record_error}")
+        finally:
+            # Новые продажи и результат синхронизации меняют алерты
+            await asyncio.to_thread(refresh_alerts, db, SYNC_ALERT_TYPES)
+            self._release(db)
+            self.current_run_id = None
+            self._busy = False
+
+    # ------------------------------------------------------------------
+    # sync_runs bookkeeping
+    # ------------------------------------------------------------------
+
+    def _create_run(self, db: Session, job: SyncJob) -> int:
+        query = text("""
+            INSERT INTO sync_runs (
+                started_at, period_start, period_end, items_per_page,
+                ok, status, mode, trigger, order_desc, message
+            ) VALUES (
+                :started_at, :period_start, :period_end, :items_per_page,
+                false, 'running', :mode, :trigger, :order_desc, 'Sync is running'
+            )
+            RETURNING id
+        """)
+        run_id = db.execute(query, {
+            "started_at": datetime.utcnow(),
+            "period_start": job.period_start,
+            "period_end": job.period_end,
+            "items_per_page": job.items_per_page,
+            "mode": job.mode,
+            "trigger": job.trigger,
+            "order_desc": job.order_desc,
+        }).scalar_one()
+        db.commit()
+        return run_id
+
+    def fail_interrupted_runs(self) -> int:
+        """
+        Mark runs left in status 'running' by a stopped process as failed.
+
+        Called on startup. Skipped while another worker holds the sync lock:
+        its running row is a live job.
+
+        Returns:
+            Number of runs marked as failed
+        """
+        db = self.session_factory()
+        try:
+            if not self._try_advisory_lock(db):
+                return 0
+            count = db.execute(text("""
+                UPDATE sync_runs SET
+                    completed_at = :completed_at,
+                    ok = false,
+                    status = 'error',
+                    message = 'Sync was interrupted: the API process stopped before it finished'
+                WHERE status = 'running'
+            """), {"completed_at": datetime.utcnow()}).rowcount
+            db.commit()
+            if count:
+                logger.warning("Marked %s interrupted sync run(s) as failed", count)
+            return count
+        except Exception as e:
+            logger.warning(f"Failed to mark interrupted sync runs: {e}")
+            db.rollback()
+            return 0
+        finally:
+            self._release(db)
+
+    def _last_scheduled_start(self, db: Session, mode: str) -> Optional[datetime]:
+        """Start of the latest scheduled run of this mode (naive UTC, like datetime.utcnow())."""
+        started_at = db.execute(text("""
+            SELECT MAX(started_at) FROM sync_runs
+            WHERE trigger = 'schedule' AND mode = :mode
+        """), {"mode": mode}).scalar()
+        if isinstance(started_at, str):  # SQLite
+            started_at = datetime.fromisoformat(started_at)
+        if started_at is not None and started_at.tzinfo is not None:
+            started_at = started_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return started_at
+
+    def _finish_run(self, db: Session, run_id: int, values: dict) -> None:
+        query = text("""
+            UPDATE sync_runs SET
+                completed_at = :completed_at,
+                period_start = COALESCE(:period_start, period_start),
+                period_end = COALESCE(:period_end, period_end),
+                fetched = :fetched,
+                inserted = :inserted,
+                skipped_duplicates = :skipped_duplicates,
+                expected_total = :expected_total,
+                pages_fetched = :pages_fetched,
+                items_per_page = :items_per_page,
+                last_page = :last_page,
+                ok = :ok,
+                status = :status,
+                message = :message
+            WHERE id = :run_id
+        """)
+        db.execute(query, {**values, "completed_at": datetime.utcnow(), "run_id": run_id})
+        db.commit()
+
+    # ------------------------------------------------------------------
+    # Cross-process lock
+    # ------------------------------------------------------------------
+
+    def _try_advisory_lock(self, db: Session) -> bool:
+        bind = db.get_bind()
+        if bind.dialect.name != "postgresql":
+            return True
+        conn = bind.connect()
+        try:
+            locked = bool(conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": SYNC_ADVISORY_LOCK_KEY}
+            ).scalar())
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not locked:
+            conn.close()
+            return False
+        self._lock_conn = conn
+        return True
+
+    def _release(self, db: Session) -> None:
+        conn, self._lock_conn = self._lock_conn, None
+        try:
+            if conn is not None:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SYNC_ADVISORY_LOCK_KEY})
+                conn.commit()
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Failed to release sync lock: {e}")
+            # Закрываем физическое соединение: сессия PostgreSQL снимет lock сама
+            conn.invalidate()
+        finally:
+            db.close()
+
+    # ------------------------------------------------------------------
+    # Periodic schedule
+    # ------------------------------------------------------------------
+
+    def start_scheduler(self) -> None:
+        """Start the periodic sync schedule (incremental + nightly reconcile)."""
+        if self._scheduler_task is None or self._scheduler_task.done():
+            self._scheduler_task = asyncio.create_task(self._schedule_loop())
+            logger.info(
+                "Sync scheduler started: incremental every %s min, reconcile at %02d:00 UTC",
+                settings.SYNC_INCREMENTAL_INTERVAL_MINUTES,
+                settings.SYNC_RECONCILE_HOUR_UTC,
+            )
+
+    async def stop(self) -> None:
+        """Stop the scheduler and cancel running jobs (used on shutdown)."""
+        tasks = list(self._tasks)
+        if self._scheduler_task is not None:
+            tasks.append(self._scheduler_task)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._scheduler_task = None
+
+    async def _schedule_loop(self) -> None:
+        # Every API worker runs this loop; whether a run is due is decided
+        # from sync_runs under the sync lock, not from per-process timers
+        interval = timedelta(minutes=max(settings.SYNC_INCREMENTAL_INTERVAL_MINUTES, 1))
+
+        while True:
+            await asyncio.sleep(30)
+            now = datetime.utcnow()
+            today = now.date()
+
+            # Reconcile first: it covers everything the incremental run would
+            reconcile = SyncJob(
+                mode="full",
+                trigger="schedule",
+                period_start=today - timedelta(days=max(settings.SYNC_RECONCILE_DAYS, 1) - 1),
+                period_end=today,
+            )
+            if await self._submit_scheduled(reconcile, self._last_reconcile_time(now)):
+                continue
+            await self._submit_scheduled(SyncJob(mode="incremental", trigger="schedule"), now - interval)
+
+    async def _submit_scheduled(self, job: SyncJob, not_before: datetime) -> bool:
+        """Start a scheduled job if it is due; True if it was started."""
+        try:
+            return await self._submit(job, not_before=not_before) is not None
+        except SyncAlreadyRunningError:
+            logger.info("Skipping scheduled %s sync: another sync is running", job.mode)
+        except Exception as e:
+            logger.error(f"Failed to start scheduled {job.mode} sync: {e}", exc_info=True)
+        return False
+
+    @staticmethod
+    def _last_reconcile_time(now: datetime) -> datetime:
+        """Latest reconcile slot at or before now."""
+        candidate = now.replace(hour=settings.SYNC_RECONCILE_HOUR_UTC, minute=0, second=0, microsecond=0)
+        if candidate > now:
+            candidate -= timedelta(days=1)
+        return candidate
+
+
+# Singleton instance
+sync_job_runner = SyncJobRunner()
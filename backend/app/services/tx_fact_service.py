@@ -0,0 +1,226 @@
+"""
+Service maintaining tx_fact — typed per-transaction facts used by analytics.
+
+Rows are derived from vendista_tx_raw at ingest time and re-derived
+incrementally when the inputs change:
+- terminal location / button matrix assignment -> refresh_terminals
+- button matrix items -> refresh_matrix
+- recipe composition -> refresh_drink_recipes
+- ingredient cost, unit or expense kind -> refresh_ingredient_costs
+- drink deletion -> refresh_drinks
+
+COGS comes from the drink_cost_snapshot version valid at tx_time, so a
+price or recipe change only re-prices sales made after it. refresh_drink_costs
+records a new version (DrinkCostService) before re-stamping those facts.
+
+Every changed fact queues its day in kpi_dirty_days, so the daily rollup
+(KpiRollupService) is rebuilt for exactly those days. Each refresh also
+marks the matching analytics result cache scope stale on commit.
+
+Methods do not commit: the caller commits together with the change that
+triggered the refresh. The SQL is PostgreSQL-only, other dialects are skipped.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+from app.services import result_cache
+from app.services.drink_cost_service import DrinkCostService, AS_OF_DRINK_COST_JOIN
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Queue the days of facts returned by the `changed` CTE and count them
+_MARK_DIRTY_SQL = """
+    , dirty AS (
+        INSERT INTO kpi_dirty_days (tx_date)
+        SELECT DISTINCT tx_date FROM changed
+        ON CONFLICT (tx_date) DO NOTHING
+    )
+    SELECT COUNT(*) FROM changed
+"""
+
+# Derive facts for vendista_tx_raw rows matching {where} and upsert them.
+# DISTINCT ON keeps one row per transaction even if a terminal is mapped
+# to several active matrices.
+_UPSERT_FACTS_SQL = """
+    WITH changed AS (
+        INSERT INTO tx_fact (
+            tx_id, term_id, vendista_tx_id, tx_time, tx_date,
+            sum_kopecks, machine_item_id, location_id, drink_id, cogs, updated_at
+        )
+        SELECT DISTINCT ON (t.id)
+            t.id,
+            t.term_id,
+            t.vendista_tx_id,
+            t.tx_time,
+            t.tx_time::date,
+            COALESCE(t.sum_kopecks, 0),
+            t.machine_item_id,
+            vt.location_id,
+            bmi.drink_id,
+            COALESCE(dc.cogs_rub, 0),
+            now()
+        FROM vendista_tx_raw t
+        LEFT JOIN vendista_terminals vt ON vt.id = t.term_id
+        LEFT JOIN terminal_matrix_map tmm
+            ON tmm.vendista_term_id = t.term_id
+            AND tmm.is_active = true
+        LEFT JOIN button_matrix_items bmi
+            ON bmi.matrix_id = tmm.matrix_id
+            AND bmi.machine_item_id = t.machine_item_id
+            AND bmi.is_active = true
+        LEFT JOIN drink_cost_snapshot dc ON {drink_cogs}
+        WHERE {where}
+        ORDER BY t.id, tmm.matrix_id
+        ON CONFLICT (tx_id) DO UPDATE SET
+            location_id = EXCLUDED.location_id,
+            drink_id = EXCLUDED.drink_id,
+            cogs = EXCLUDED.cogs,
+            updated_at = EXCLUDED.updated_at
+        WHERE (tx_fact.location_id, tx_fact.drink_id, tx_fact.cogs)
+            IS DISTINCT FROM (EXCLUDED.location_id, EXCLUDED.drink_id, EXCLUDED.cogs)
+        RETURNING tx_date
+    )
+""" + _MARK_DIRTY_SQL
+
+
+class TxFactService:
+    """Service keeping tx_fact in sync with raw transactions and reference data."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    @property
+    def enabled(self) -> bool:
+        return self.db.get_bind().dialect.name == "postgresql"
+
+    def refresh_transactions(self, tx_ids: Iterable[int]) -> int:
+        """Derive facts for newly ingested vendista_tx_raw rows."""
+        tx_ids = _unique(tx_ids)
+        if not tx_ids:
+            return 0
+        result_cache.invalidate_on_commit(self.db, result_cache.SALES)
+        return self._upsert_facts("t.id = ANY(:tx_ids)", {"tx_ids": tx_ids})
+
+    def refresh_terminals(self, term_ids: Iterable[int]) -> int:
+        """Re-derive all facts of terminals whose location or matrix changed."""
+        term_ids = _unique(term_ids)
+        if not term_ids:
+            return 0
+        result_cache.invalidate_on_commit(self.db, result_cache.MATRIX)
+        return self._upsert_facts("t.term_id = ANY(:term_ids)", {"term_ids": term_ids})
+
+    def refresh_matrix(self, matrix_id: int) -> int:
+        """Re-derive facts of terminals assigned to a button matrix."""
+        result_cache.invalidate_on_commit(self.db, result_cache.MATRIX)
+        if not self.enabled:
+            return 0
+        term_ids = self.db.execute(
+            text("SELECT vendista_term_id FROM terminal_matrix_map WHERE matrix_id = :matrix_id"),
+            {"matrix_id": matrix_id}
+        ).scalars().all()
+        return self.refresh_terminals(term_ids)
+
+    def refresh_drinks(self, drink_ids: Iterable[int]) -> int:
+        """Re-derive facts currently attributed to drinks (e.g. a drink was deleted)."""
+        drink_ids = _unique(drink_ids)
+        if not drink_ids:
+            return 0
+        result_cache.invalidate_on_commit(self.db, result_cache.RECIPES)
+        return self._upsert_facts(
+            "t.id IN (SELECT tx_id FROM tx_fact WHERE drink_id = ANY(:drink_ids))",
+            {"drink_ids": drink_ids}
+        )
+
+    def refresh_drink_costs(self, drink_ids: Iterable[int], effective_from: Optional[datetime] = None) -> int:
+        """
+        Snapshot the recipe cost of drinks as of effective_from (now by default)
+        and re-stamp COGS of their facts from that moment on. Earlier sales keep
+        the cost that was valid when they happened. Versions of a drink cover
+        the whole timeline from EPOCH, so the join always finds one.
+        """
+        drink_ids = _unique(drink_ids)
+        if not drink_ids:
+            return 0
+        effective_from = effective_from or datetime.now(timezone.utc)
+        result_cache.invalidate_on_commit(self.db, result_cache.RECIPES)
+        DrinkCostService(self.db).snapshot(drink_ids, effective_from=effective_from)
+        if not self.enabled:
+            return 0
+        self.db.flush()
+        drink_cogs = AS_OF_DRINK_COST_JOIN.format(alias="dc", drink_id="f.drink_id", tx_time="f.tx_time")
+        query = text(f"""
+            WITH changed AS (
+                UPDATE tx_fact f
+                SET cogs = dc.cogs_rub,
+                    updated_at = now()
+                FROM drink_cost_snapshot dc
+                WHERE {drink_cogs}
+                  AND f.drink_id = ANY(:drink_ids)
+                  AND f.tx_time >= :effective_from
+                  AND f.cogs IS DISTINCT FROM dc.cogs_rub
+                RETURNING f.tx_date
+            )
+        """ + _MARK_DIRTY_SQL)
+        updated = self.db.execute(
+            query, {"drink_ids": drink_ids, "effective_from": effective_from}
+        ).scalar() or 0
+        logger.info(f"tx_fact COGS refreshed for drinks {drink_ids}: {updated} rows")
+        return updated
+
+    def refresh_drink_recipes(self, drink_ids: Iterable[int]) -> int:
+        """
+        Recompute COGS after a recipe change and queue every day with sales
+        of the drinks: ingredient usage changes even where COGS does not.
+        """
+        drink_ids = _unique(drink_ids)
+        updated = self.refresh_drink_costs(drink_ids)
+        if not drink_ids or not self.enabled:
+            return updated
+        self.db.execute(
+            text("""
+                INSERT INTO kpi_dirty_days (tx_date)
+                SELECT DISTINCT tx_date FROM tx_fact WHERE drink_id = ANY(:drink_ids)
+                ON CONFLICT (tx_date) DO NOTHING
+            """),
+            {"drink_ids": drink_ids}
+        )
+        return updated
+
+    def refresh_ingredient_costs(self, ingredient_codes: Iterable[str]) -> int:
+        """
+        Record new ingredient cost versions and recompute COGS of facts for
+        drinks using the ingredients, effective from now.
+        """
+        ingredient_codes = _unique(ingredient_codes)
+        if not ingredient_codes:
+            return 0
+        effective_from = datetime.now(timezone.utc)
+        result_cache.invalidate_on_commit(self.db, result_cache.RECIPES)
+        self.db.flush()
+        costs = DrinkCostService(self.db)
+        costs.record_ingredient_costs(ingredient_codes, effective_from=effective_from)
+        return self.refresh_drink_costs(costs.drinks_using(ingredient_codes), effective_from=effective_from)
+
+    def rebuild(self) -> int:
+        """Re-derive the whole table (used after bulk data fixes)."""
+        result_cache.invalidate_on_commit(self.db, *result_cache.ALL_SCOPES)
+        return self._upsert_facts("true", {})
+
+    def _upsert_facts(self, where: str, params: dict) -> int:
+        if not self.enabled:
+            return 0
+        self.db.flush()
+        query = text(_UPSERT_FACTS_SQL.format(
+            drink_cogs=AS_OF_DRINK_COST_JOIN.format(alias="dc", drink_id="bmi.drink_id", tx_time="t.tx_time"),
+            where=where,
+        ))
+        affected = self.db.execute(query, params).scalar() or 0
+        logger.info(f"tx_fact upserted ({where}): {affected} rows")
+        return affected
+
+
+def _unique(values: Iterable) -> List:
+    return sorted({v for v in values if v is not None})
@@ -3,9 +3,14 @@ Vendista DEFEN API client for fetching transaction data.
 Uses token as query parameter (not Bearer auth).
 Docs: https://wiki.vendista.ru/en/home/defen_api
 """
+import asyncio
 import httpx
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Deque, List, Dict, Any, Optional, Tuple
 import math
 from app.config import settings
 import logging
@@ -13,18 +18,197 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# Candidate terminals endpoints, in order of preference
+TERMINAL_ENDPOINTS = ("/terminals", "/devices", "/machines", "/partner/terminals", "/api/terminals")
+
+# Responses worth retrying: timeouts, rate limiting and server-side errors
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether a failed request may succeed later: transport errors and RETRY_STATUS_CODES."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, httpx.HTTPError)
+
+
+class TokenBucket:
+    """Client-side rate limiter: `rate` requests per second with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Parse Retry-After (delta-seconds or HTTP-date)."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    ceiling = min(
+        settings.vendista_retry_max_delay_seconds,
+        settings.vendista_page_retry_delay_seconds * 2 ** (attempt - 1),
+    )
+    return random.uniform(0, ceiling)
+
+
+def _h2_available() -> bool:
+    """HTTP/2 in httpx needs the optional h2 package (httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
 class VendistaAPIClient:
     """
     Asynchronous client for Vendista DEFEN API.
     Docs: https://wiki.vendista.ru/en/home/defen_api
     Endpoint: https://api.vendista.ru:99/transactions
     Auth: token as query parameter
+
+    All requests share one pooled httpx.AsyncClient (keep-alive, HTTP/2
+    when the h2 package is installed). The app opens it on startup and
+    closes it on shutdown; outside the app it is created on first use.
     """
 
-    def __init__(self):
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
         self.base_url = settings.vendista_api_base_url
         self.api_token = settings.vendista_api_token
         self.timeout = 30.0
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._rate_limiter: Optional[TokenBucket] = None
+        # Discovered terminals endpoint (None = not found) and its expiry (monotonic)
+        self._terminals_endpoint: Optional[str] = None
+        self._terminals_endpoint_expires = 0.0
+
+    def _create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            verify=False,
+            timeout=httpx.Timeout(self.timeout, connect=15.0),
+            limits=httpx.Limits(
+                max_connections=settings.vendista_http_max_connections,
+                max_keepalive_connections=settings.vendista_http_max_keepalive_connections,
+                keepalive_expiry=settings.vendista_http_keepalive_expiry_seconds,
+            ),
+            http2=settings.vendista_http2 and _h2_available(),
+            transport=self._transport,
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Shared client; a new one is created if closed or bound to another event loop."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = self._create_client()
+            self._client_loop = loop
+            self._rate_limiter = None
+        return self._client
+
+    async def _throttle(self) -> None:
+        """Wait for a rate limiter token (vendista_rate_limit_per_second, 0 = off)."""
+        if settings.vendista_rate_limit_per_second <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self._rate_limiter is None or self._client_loop is not loop:
+            self._get_client()
+            self._rate_limiter = TokenBucket(
+                settings.vendista_rate_limit_per_second,
+                settings.vendista_rate_limit_burst,
+            )
+        await self._rate_limiter.acquire()
+
+    async def _request(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        params: Dict[str, Any],
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+    ) -> httpx.Response:
+        """
+        GET with rate limiting and retries.
+
+        Transport errors, 429 and 5xx are retried with exponential backoff and
+        jitter; Retry-After from the server takes precedence. Other 4xx fail
+        immediately.
+
+        Raises:
+            httpx.HTTPError: If the request still fails after all retries
+        """
+        if retries is None:
+            retries = settings.vendista_page_retries
+        attempts = max(retries, 0) + 1
+        request_kwargs = {"timeout": timeout} if timeout is not None else {}
+
+        for attempt in range(1, attempts + 1):
+            await self._throttle()
+            try:
+                response = await client.get(url, params=params, **request_kwargs)
+            except httpx.TransportError as e:
+                if attempt >= attempts:
+                    logger.error("Vendista API %s failed after %s attempts: %s", url, attempt, e)
+                    raise
+                delay = _backoff_delay(attempt)
+                logger.warning("Vendista API %s failed (attempt %s/%s): %s; retry in %.1fs", url, attempt, attempts, e, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < attempts:
+                retry_after = _retry_after_seconds(response)
+                if retry_after is not None:
+                    delay = min(retry_after, settings.vendista_retry_max_delay_seconds)
+                else:
+                    delay = _backoff_delay(attempt)
+                logger.warning(
+                    "Vendista API %s returned %s (attempt %s/%s); retry in %.1fs",
+                    url, response.status_code, attempt, attempts, delay,
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            if response.is_error:
+                logger.error("Vendista API %s returned %s after %s attempt(s)", url, response.status_code, attempt)
+            response.raise_for_status()
+            return response
+
+    async def start(self) -> None:
+        """Open the shared client (FastAPI startup)."""
+        self._get_client()
+
+    async def aclose(self) -> None:
+        """Close the shared client and its pooled connections (FastAPI shutdown)."""
+        client, self._client, self._client_loop = self._client, None, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
 
     def _get_params(self, **kwargs) -> dict:
         """Get query parameters with token."""
@@ -72,16 +256,14 @@ class VendistaAPIClient:
         )
 
         try:
-            async with httpx.AsyncClient(verify=False, timeout=self.timeout) as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                logger.info(
-                    f"Received {len(data.get('items', []))} transactions, "
-                    f"total_count={data.get('items_count', 0)}"
-                )
-                return data
+            response = await self._request(self._get_client(), url, params)
+            data = response.json()
+            
+            logger.info(
+                f"Received {len(data.get('items', []))} transactions, "
+                f"total_count={data.get('items_count', 0)}"
+            )
+            return data
         except httpx.HTTPError as e:
             logger.error(f"Failed to fetch transactions: {e}")
             raise
@@ -100,191 +282,320 @@ class VendistaAPIClient:
             url = f"{self.base_url}/transactions"
             params = self._get_params(limit=1)
             
-            async with httpx.AsyncClient(verify=False, timeout=10.0) as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                logger.info("Vendista API connection test successful")
-                return True
+            response = await self._request(self._get_client(), url, params, timeout=10.0, retries=0)
+            logger.info("Vendista API connection test successful")
+            return True
         except Exception as e:
             logger.error(f"Vendista API connection test failed: {e}")
             return False
 
-    async def get_paginated_transactions(
+    async def _fetch_transactions_page(
+        self,
+        client: httpx.AsyncClient,
+        params: Dict[str, Any],
+        page_number: int,
+    ) -> Dict[str, Any]:
+        """
+        Fetch a single transactions page, retrying transient failures (see _request).
+
+        Raises:
+            httpx.HTTPError: If the page still fails after all retries
+        """
+        page_params = dict(params, PageNumber=page_number)
+        response = await self._request(client, f"{self.base_url}/transactions", page_params)
+        return response.json()
+
+    async def iter_transaction_pages(
         self,
         date_from: str,
         date_to: str,
         items_per_page: int = 50,
-        order_desc: bool = True
-    ) -> Dict[str, Any]:
+        order_desc: bool = True,
+        start_page: int = 1,
+        max_concurrency: Optional[int] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
-        Fetch ALL transactions with pagination using DEFEN parameters.
+        Iterate over transaction pages using DEFEN parameters.
+
+        Yields one page at a time so callers can persist it before the next
+        page is requested; memory usage does not depend on the period length.
+
+        The first page is fetched alone to learn items_count; the remaining
+        pages are fetched concurrently (at most max_concurrency in flight)
+        and yielded in page order.
 
         Args:
             date_from: "YYYY-MM-DD HH:MM:SS"
             date_to:   "YYYY-MM-DD HH:MM:SS"
             items_per_page: Page size (default 50, per API spec)
             order_desc: Whether to sort desc by time
-
-        Returns:
-            Dict with combined items and pagination metadata:
-                items: List of transactions
-                expected_total: items_count from API
+            start_page: Page to start from (used to resume an interrupted sync)
+            max_concurrency: Pages in flight (default from settings)
+
+        Yields:
+            Dict per page:
+                items: List of transactions on the page
+                page_number: page number returned by API
+                items_count: items_count from API
                 items_per_page: page size returned by API
-                pages_fetched: how many pages were fetched
-                last_page: last page number fetched
+                total_pages: total pages according to items_count
         """
-
-        all_items: List[Dict[str, Any]] = []
-        expected_total: Optional[int] = None
-        pages_fetched = 0
-        last_page = 0
-
-        page_number = 1
-        order_desc_str = "true" if order_desc else "false"
+        page_number = max(start_page, 1)
+        if max_concurrency is None:
+            max_concurrency = settings.vendista_max_concurrent_pages
+        max_concurrency = max(max_concurrency, 1)
+
+        params = {
+            "token": self.api_token,
+            "DateFrom": date_from,
+            "DateTo": date_to,
+            "ItemsPerPage": items_per_page,
+            "OrderDesc": "true" if order_desc else "false",
+        }
 
         logger.info(
-            "Starting Vendista pagination: DateFrom=%s, DateTo=%s, ItemsPerPage=%s, OrderDesc=%s",
+            "Starting Vendista pagination: DateFrom=%s, DateTo=%s, ItemsPerPage=%s, OrderDesc=%s, "
+            "StartPage=%s, Concurrency=%s",
             date_from,
             date_to,
             items_per_page,
             order_desc,
+            page_number,
+            max_concurrency,
         )
 
-        async with httpx.AsyncClient(verify=False, timeout=httpx.Timeout(30.0, connect=15.0)) as client:
-            while True:
-                params = {
-                    "token": self.api_token,
-                    "DateFrom": date_from,
-                    "DateTo": date_to,
-                    "ItemsPerPage": items_per_page,
-                    "PageNumber": page_number,
-                    "OrderDesc": order_desc_str,
-                }
-
-                try:
-                    response = await client.get(f"{self.base_url}/transactions", params=params)
-                    response.raise_for_status()
-                    data = response.json()
-                except httpx.HTTPError as e:
-                    logger.error("Vendista API page %s failed: %s", page_number, e)
-                    raise
+        def to_page(data: Dict[str, Any], requested_page: int) -> Dict[str, Any]:
+            items_count = data.get("items_count", 0) or 0
+            items_per_page_resp = data.get("items_per_page", items_per_page)
+            return {
+                "items": data.get("items", []),
+                "page_number": data.get("page_number", requested_page),
+                "items_count": items_count,
+                "items_per_page": items_per_page_resp,
+                "total_pages": math.ceil(items_count / items_per_page_resp) if items_per_page_resp else 1,
+            }
+
+        client = self._get_client()
+        first = to_page(await self._fetch_transactions_page(client, params, page_number), page_number)
+        total_pages = first["total_pages"]
+
+        logger.info(
+            "Page %s/%s: got %s items (count=%s, per_page=%s)",
+            first["page_number"],
+            total_pages,
+            len(first["items"]),
+            first["items_count"],
+            first["items_per_page"],
+        )
 
-                items = data.get("items", [])
-                items_count = data.get("items_count", 0) or 0
-                items_per_page_resp = data.get("items_per_page", items_per_page)
-                page_number_resp = data.get("page_number", page_number)
+        if not first["items"]:
+            logger.warning(
+                "Empty items on page %s (items_count=%s); stopping",
+                first["page_number"],
+                first["items_count"],
+            )
+            return
 
-                if expected_total is None:
-                    expected_total = items_count
+        yield first
 
-                pages_fetched += 1
-                last_page = page_number_resp
+        if first["page_number"] >= total_pages:
+            logger.info("Pagination finished at page %s/%s", first["page_number"], total_pages)
+            return
+
+        # Sliding window of prefetch tasks: bounded in-flight requests and
+        # bounded buffered pages, merged back in page order.
+        next_page = first["page_number"] + 1
+        pending: Deque[Tuple[int, asyncio.Task]] = deque()
+
+        def schedule_more() -> None:
+            nonlocal next_page
+            while len(pending) < max_concurrency and next_page <= total_pages:
+                task = asyncio.create_task(self._fetch_transactions_page(client, params, next_page))
+                pending.append((next_page, task))
+                next_page += 1
+
+        try:
+            schedule_more()
+            while pending:
+                requested_page, task = pending.popleft()
+                page = to_page(await task, requested_page)
 
                 logger.info(
                     "Page %s/%s: got %s items (count=%s, per_page=%s)",
-                    page_number_resp,
-                    math.ceil(items_count / items_per_page_resp) if items_per_page_resp else "?",
-                    len(items),
-                    items_count,
-                    items_per_page_resp,
+                    page["page_number"],
+                    total_pages,
+                    len(page["items"]),
+                    page["items_count"],
+                    page["items_per_page"],
                 )
 
-                if not items:
-                    # If we haven't reached expected_total but items empty -> guard
+                if not page["items"]:
                     logger.warning(
-                        "Empty items on page %s before reaching expected_total=%s; stopping",
-                        page_number_resp,
-                        expected_total,
+                        "Empty items on page %s before reaching total_pages=%s; stopping",
+                        page["page_number"],
+                        total_pages,
                     )
                     break
 
-                all_items.extend(items)
+                schedule_more()
+                yield page
+            else:
+                logger.info("Pagination finished at page %s/%s", total_pages, total_pages)
+        finally:
+            for _, task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
 
-                total_pages = math.ceil(items_count / items_per_page_resp) if items_per_page_resp else 1
+    async def get_paginated_transactions(
+        self,
+        date_from: str,
+        date_to: str,
+        items_per_page: int = 50,
+        order_desc: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Fetch ALL transactions with pagination using DEFEN parameters.
 
-                if page_number_resp >= total_pages:
-                    logger.info("Pagination finished at page %s/%s", page_number_resp, total_pages)
-                    break
+        Accumulates every page in memory; prefer iter_transaction_pages()
+        for long periods.
 
-                page_number = page_number_resp + 1
-                # Guard: ensure progress
-                if page_number > total_pages + 1:
-                    logger.warning("Page number exceeded total_pages (%s); breaking", total_pages)
-                    break
+        Args:
+            date_from: "YYYY-MM-DD HH:MM:SS"
+            date_to:   "YYYY-MM-DD HH:MM:SS"
+            items_per_page: Page size (default 50, per API spec)
+            order_desc: Whether to sort desc by time
+
+        Returns:
+            Dict with combined items and pagination metadata:
+                items: List of transactions
+                expected_total: items_count from API
+                items_per_page: page size returned by API
+                pages_fetched: how many pages were fetched
+                last_page: last page number fetched
+        """
+        all_items: List[Dict[str, Any]] = []
+        expected_total: Optional[int] = None
+        items_per_page_resp = items_per_page
+        pages_fetched = 0
+        last_page = 0
+
+        async for page in self.iter_transaction_pages(
+            date_from=date_from,
+            date_to=date_to,
+            items_per_page=items_per_page,
+            order_desc=order_desc,
+        ):
+            if expected_total is None:
+                expected_total = page["items_count"]
+            items_per_page_resp = page["items_per_page"]
+            pages_fetched += 1
+            last_page = page["page_number"]
+            all_items.extend(page["items"])
 
         return {
             "items": all_items,
             "expected_total": expected_total or 0,
-            "items_per_page": items_per_page_resp if 'items_per_page_resp' in locals() else items_per_page,
+            "items_per_page": items_per_page_resp,
             "pages_fetched": pages_fetched,
             "last_page": last_page,
         }
 
+    @staticmethod
+    def _parse_terminals(data: Any) -> Optional[List[Any]]:
+        """Extract the terminals list from a response, None if it does not look like one."""
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            # Try common response formats
+            terminals = data.get("items") or data.get("terminals") or data.get("devices") or data.get("data")
+            if terminals is not None:
+                return terminals if isinstance(terminals, list) else [terminals]
+        return None
+
+    async def _fetch_terminals(self, endpoint: str, probe: bool) -> Optional[Dict[str, Any]]:
+        """
+        GET terminals from one endpoint.
+
+        Probes use a short timeout and no retries; a known endpoint gets the
+        regular retry policy. Returns None if the endpoint does not serve
+        terminals.
+        """
+        url = f"{self.base_url}{endpoint}"
+        try:
+            if probe:
+                response = await self._request(
+                    self._get_client(), url, self._get_params(),
+                    timeout=settings.vendista_probe_timeout_seconds, retries=0,
+                )
+            else:
+                response = await self._request(self._get_client(), url, self._get_params())
+            data = response.json()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                logger.debug(f"Endpoint {endpoint} not found (404)")
+            else:
+                logger.warning(f"Error fetching from {endpoint}: {e.response.status_code}")
+            return None
+        except Exception as e:
+            logger.debug(f"Error trying {endpoint}: {e}")
+            return None
+
+        terminals = self._parse_terminals(data)
+        if terminals is None:
+            return None
+        return {"success": True, "endpoint": endpoint, "terminals": terminals, "raw_data": data}
+
+    async def _discover_terminals(self) -> Optional[Dict[str, Any]]:
+        """Probe all candidate endpoints concurrently; the first in TERMINAL_ENDPOINTS order wins."""
+        logger.info(f"Discovering Vendista terminals endpoint among {TERMINAL_ENDPOINTS}")
+        results = await asyncio.gather(
+            *(self._fetch_terminals(endpoint, probe=True) for endpoint in TERMINAL_ENDPOINTS)
+        )
+        return next((result for result in results if result is not None), None)
+
     async def get_terminals(self) -> Dict[str, Any]:
         """
         Fetch terminals list from Vendista API.
         
-        Tries multiple possible endpoints:
-        - /terminals
-        - /devices
-        - /machines
-        - /partner/terminals
+        The endpoint is taken from settings.vendista_terminals_endpoint if
+        pinned; otherwise it is discovered by probing TERMINAL_ENDPOINTS
+        concurrently and cached for vendista_endpoint_cache_ttl_seconds.
+        A failed discovery is cached only for
+        vendista_endpoint_negative_cache_ttl_seconds: probes do not retry, so
+        it may be a transient error. A cached endpoint that stops working
+        triggers rediscovery.
         
         Returns:
             Response dict with terminals list or error
         """
-        possible_endpoints = [
-            "/terminals",
-            "/devices", 
-            "/machines",
-            "/partner/terminals",
-            "/api/terminals"
-        ]
-        
-        for endpoint in possible_endpoints:
-            try:
-                url = f"{self.base_url}{endpoint}"
-                params = self._get_params()
-                
-                logger.info(f"Trying to fetch terminals from {url}")
-                
-                async with httpx.AsyncClient(verify=False, timeout=self.timeout) as client:
-                    response = await client.get(url, params=params)
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    # Check if response looks like terminals list
-                    if isinstance(data, dict):
-                        # Try common response formats
-                        terminals = data.get("items") or data.get("terminals") or data.get("devices") or data.get("data")
-                        if terminals is not None:
-                            logger.info(f"Successfully fetched terminals from {endpoint}: {len(terminals) if isinstance(terminals, list) else 'unknown'} items")
-                            return {
-                                "success": True,
-                                "endpoint": endpoint,
-                                "terminals": terminals if isinstance(terminals, list) else [terminals],
-                                "raw_data": data
-                            }
-                    elif isinstance(data, list):
-                        logger.info(f"Successfully fetched terminals from {endpoint}: {len(data)} items")
-                        return {
-                            "success": True,
-                            "endpoint": endpoint,
-                            "terminals": data,
-                            "raw_data": data
-                        }
-                    
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    logger.debug(f"Endpoint {endpoint} not found (404), trying next...")
-                    continue
+        pinned = settings.vendista_terminals_endpoint
+        if pinned:
+            result = await self._fetch_terminals(pinned, probe=False)
+        else:
+            result = None
+            now = time.monotonic()
+            if self._terminals_endpoint_expires > now:
+                if self._terminals_endpoint is None:
+                    logger.debug("Terminals endpoint unavailable (cached discovery result)")
                 else:
-                    logger.warning(f"Error fetching from {endpoint}: {e.response.status_code}")
-                    continue
-            except Exception as e:
-                logger.debug(f"Error trying {endpoint}: {e}")
-                continue
-        
+                    result = await self._fetch_terminals(self._terminals_endpoint, probe=False)
+                    if result is None:
+                        logger.info(f"Cached terminals endpoint {self._terminals_endpoint} failed, rediscovering")
+                        self._terminals_endpoint_expires = 0.0
+            if self._terminals_endpoint_expires <= now:
+                result = await self._discover_terminals()
+                self._terminals_endpoint = result["endpoint"] if result else None
+                ttl = (
+                    settings.vendista_endpoint_cache_ttl_seconds if result
+                    else settings.vendista_endpoint_negative_cache_ttl_seconds
+                )
+                self._terminals_endpoint_expires = time.monotonic() + ttl
+
+        if result is not None:
+            logger.info(f"Successfully fetched terminals from {result['endpoint']}: {len(result['terminals'])} items")
+            return result
+
         # If all endpoints failed, return error
         logger.warning("Could not find terminals endpoint in Vendista API")
         return {
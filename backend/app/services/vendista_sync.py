@@ -2,14 +2,22 @@
 Vendista synchronization service.
 Handles syncing transactions from Vendista API to local database.
 """
-from datetime import datetime, date
-from typing import List, Optional
+import asyncio
+from datetime import datetime, date, time, timedelta, timezone
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from app.models.vendista import VendistaTerminal, VendistaTxRaw, SyncState
-from app.services.vendista_client import vendista_client
+from app.services.vendista_client import vendista_client, is_retryable_error
+from app.services.tx_fact_service import TxFactService
+from app.services.kpi_rollup_service import KpiRollupService
+from app.crud import vendista as crud_vendista
 from app.schemas.vendista import SyncResult
+from app.config import settings
+import httpx
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,18 +35,26 @@ class VendistaSyncService:
         period_end: Optional[date] = None,
         items_per_page: int = 50,
         order_desc: bool = True,
+        start_page: int = 1,
+        commit_every_pages: Optional[int] = None,
     ) -> SyncResult:
         """
         Sync ALL transactions from Vendista DEFEN API into vendista_tx_raw table.
-        Handles pagination automatically.
+        Streams pages from the API and upserts them in batches, committing after
+        each batch, so memory stays bounded regardless of the period length.
         IDEMPOTENT: uses ON CONFLICT DO NOTHING and client-side deduplication.
 
+        If the sync fails midway, everything up to the returned last_page is
+        already committed; pass start_page=last_page + 1 to resume.
+
         Args:
             db: Database session
             period_start: Start date (inclusive)
             period_end: End date (inclusive)
             items_per_page: Page size for Vendista API
             order_desc: OrderDesc flag for Vendista API
+            start_page: First page to fetch (for resuming a failed sync)
+            commit_every_pages: Pages per batch/commit (default from settings)
 
         Returns:
             SyncResult with sync status and count
@@ -51,155 +67,362 @@ class VendistaSyncService:
         if period_start is None:
             period_start = today.replace(day=1)
 
-        date_from_str = f"{period_start.strftime('%Y-%m-%d')} 00:00:00"
-        date_to_str = f"{period_end.strftime('%Y-%m-%d')} 23:59:59"
+        window_start = datetime.combine(period_start, time.min)
+        window_end = datetime.combine(period_end, time(23, 59, 59))
+
+        logger.info("Starting full Vendista sync (period %s..%s)", period_start, period_end)
+
+        # Newest-first pages can't advance watermarks batch by batch (a failure
+        # would leave a gap below the mark), so they advance once at the end.
+        return await self._sync_window(
+            db,
+            window_start=window_start,
+            window_end=window_end,
+            items_per_page=items_per_page,
+            order_desc=order_desc,
+            start_page=start_page,
+            commit_every_pages=commit_every_pages,
+            advance_each_batch=False,
+        )
+
+    async def sync_incremental(
+        self,
+        db: Session,
+        term_ids: Optional[List[int]] = None,
+        overlap_minutes: Optional[int] = None,
+        items_per_page: int = 50,
+        commit_every_pages: Optional[int] = None,
+    ) -> SyncResult:
+        """
+        Sync only transactions newer than the stored sync_state high-water mark.
+
+        The window starts overlap_minutes before the watermark (late-arriving
+        transactions are absorbed by ON CONFLICT DO NOTHING) and ends now.
+        Pages are requested oldest-first and the watermark advances in the same
+        commit as each batch, so a failed run resumes where it stopped.
+        Without a stored watermark, falls back to the current month.
+
+        Args:
+            db: Database session
+            term_ids: Only sync these terminals (None = whole fleet)
+            overlap_minutes: Overlap before the watermark (default from settings)
+            items_per_page: Page size for Vendista API
+            commit_every_pages: Pages per batch/commit (default from settings)
+
+        Returns:
+            SyncResult with sync status, count and the synced window
+        """
+        if overlap_minutes is None:
+            overlap_minutes = settings.vendista_incremental_overlap_minutes
+
+        window_end = datetime.utcnow()
+        watermark = crud_vendista.get_sync_watermark(db, term_ids)
+        if watermark is None:
+            window_start = datetime.combine(window_end.date().replace(day=1), time.min)
+            logger.info("No sync watermark found, incremental sync starts at %s", window_start)
+        else:
+            if watermark.tzinfo is not None:
+                watermark = watermark.astimezone(timezone.utc).replace(tzinfo=None)
+            window_start = watermark - timedelta(minutes=overlap_minutes)
+
+        logger.info(
+            "Starting incremental Vendista sync (from=%s, to=%s, term_ids=%s)",
+            window_start,
+            window_end,
+            term_ids,
+        )
+
+        result = await self._sync_window(
+            db,
+            window_start=window_start,
+            window_end=window_end,
+            items_per_page=items_per_page,
+            order_desc=False,
+            start_page=1,
+            commit_every_pages=commit_every_pages,
+            advance_each_batch=True,
+            term_ids=term_ids,
+        )
+        if not result.success:
+            try:
+                crud_vendista.mark_sync_error(db, result.error_message or "Incremental sync failed")
+            except Exception as e:
+                logger.warning(f"Failed to record sync error state: {e}")
+                db.rollback()
+        return result
+
+    async def _sync_window(
+        self,
+        db: Session,
+        window_start: datetime,
+        window_end: datetime,
+        items_per_page: int,
+        order_desc: bool,
+        start_page: int,
+        commit_every_pages: Optional[int],
+        advance_each_batch: bool,
+        term_ids: Optional[List[int]] = None,
+    ) -> SyncResult:
+        """
+        Stream one DateFrom..DateTo window into vendista_tx_raw.
+
+        Args:
+            advance_each_batch: Advance sync_state with every batch commit
+                (safe only for oldest-first pages); otherwise advance once
+                with the final batch of a successful run.
+            term_ids: Keep only transactions of these terminals; the
+                fleet-wide watermark is then left alone, as the other
+                terminals were not synced
+        """
+        if commit_every_pages is None:
+            commit_every_pages = settings.vendista_sync_commit_pages
+        commit_every_pages = max(commit_every_pages, 1)
+        term_filter = set(term_ids) if term_ids else None
+        advance_global = term_filter is None
+
+        date_from_str = window_start.strftime('%Y-%m-%d %H:%M:%S')
+        date_to_str = window_end.strftime('%Y-%m-%d %H:%M:%S')
 
         logger.info(
-            "Starting full Vendista sync (DateFrom=%s, DateTo=%s, ItemsPerPage=%s, OrderDesc=%s)",
+            "Syncing Vendista window (DateFrom=%s, DateTo=%s, ItemsPerPage=%s, OrderDesc=%s, StartPage=%s)",
             date_from_str,
             date_to_str,
             items_per_page,
             order_desc,
+            start_page,
         )
 
-        try:
-            # Fetch all transactions from Vendista API
-            paginated = await vendista_client.get_paginated_transactions(
-                date_from=date_from_str,
-                date_to=date_to_str,
-                items_per_page=items_per_page,
-                order_desc=order_desc,
-            )
-
-            transactions = paginated.get("items", [])
-            expected_total = paginated.get("expected_total", 0)
-            pages_fetched = paginated.get("pages_fetched", 0)
-            items_per_page_resp = paginated.get("items_per_page", items_per_page)
-            last_page = paginated.get("last_page", pages_fetched)
-
-            logger.info(
-                "Received %s transactions from Vendista API (expected_total=%s, pages=%s, last_page=%s)",
-                len(transactions),
-                expected_total,
-                pages_fetched,
-                last_page,
+        fetched = 0
+        inserted = 0
+        skipped_duplicates = 0
+        expected_total: Optional[int] = None
+        items_per_page_resp = items_per_page
+        pages_fetched = 0
+        # Last page whose rows are committed (checkpoint for resume)
+        last_page = max(start_page, 1) - 1
+
+        batch: List[dict] = []
+        batch_pages = 0
+        batch_last_page = last_page
+        # term_id -> (max tx_time, vendista_tx_id); bounded by fleet size
+        watermarks: Dict[int, Tuple[datetime, int]] = {}
+        resumes_left = max(settings.vendista_resume_attempts, 0)
+
+        async def commit_batch() -> None:
+            nonlocal batch, batch_pages, watermarks, inserted, skipped_duplicates, last_page
+            self._collect_watermarks(batch, watermarks)
+            # Blocking DB work (insert, tx_fact, rollup, commit) runs off the event loop
+            batch_inserted, batch_skipped = await asyncio.to_thread(
+                self._upsert_tx_batch, db, batch, watermarks if advance_each_batch else None, advance_global
             )
+            inserted += batch_inserted
+            skipped_duplicates += batch_skipped
+            last_page = batch_last_page
+            batch = []
+            batch_pages = 0
+            if advance_each_batch:
+                watermarks = {}
 
-            if not transactions:
-                logger.info("No transactions to sync")
-                return SyncResult(
-                    success=True,
-                    fetched=0,
-                    inserted=0,
-                    skipped_duplicates=0,
-                    expected_total=expected_total,
-                    pages_fetched=pages_fetched,
-                    items_per_page=items_per_page_resp,
-                    last_page=last_page,
-                    transactions_synced=0,
-                    error_message=None,
-                )
-
-            # Prepare rows for bulk insert
-            rows = []
-            for tx in transactions:
+        try:
+            while True:
                 try:
-                    vendista_tx_id = tx.get("id")
-                    term_id = tx.get("term_id")
-                    tx_time_str = tx.get("time")
-                    
-                    if not vendista_tx_id or not term_id or not tx_time_str:
-                        logger.warning(f"Skipping transaction with missing fields: {tx}")
-                        continue
-
-                    try:
-                        tx_time = datetime.fromisoformat(tx_time_str.replace('Z', '+00:00'))
-                    except (ValueError, AttributeError):
-                        logger.warning(f"Failed to parse tx_time '{tx_time_str}' for tx {vendista_tx_id}")
-                        tx_time = datetime.utcnow()
-
-                    rows.append({
-                        "term_id": term_id,
-                        "vendista_tx_id": vendista_tx_id,
-                        "tx_time": tx_time,
-                        "payload": tx
-                    })
-
-                except Exception as e:
-                    logger.error(f"Error preparing transaction: {e}")
-                    continue
+                    async for page in vendista_client.iter_transaction_pages(
+                        date_from=date_from_str,
+                        date_to=date_to_str,
+                        items_per_page=items_per_page,
+                        order_desc=order_desc,
+                        start_page=batch_last_page + 1,
+                    ):
+                        if expected_total is None:
+                            expected_total = page["items_count"]
+                        items_per_page_resp = page["items_per_page"]
+                        pages_fetched += 1
+                        fetched += len(page["items"])
+
+                        for tx in page["items"]:
+                            row = self._prepare_tx_row(tx)
+                            if row is None:
+                                continue
+                            if term_filter is not None and row["term_id"] not in term_filter:
+                                continue
+                            batch.append(row)
+                        batch_pages += 1
+                        batch_last_page = page["page_number"]
+
+                        if batch_pages >= commit_every_pages:
+                            await commit_batch()
+                    break
+                except httpx.HTTPError as e:
+                    # A page failed after all its retries: long backfills continue
+                    # after the last received page instead of waiting for a rerun
+                    if not is_retryable_error(e) or resumes_left <= 0:
+                        raise
+                    resumes_left -= 1
+                    if batch_pages:
+                        await commit_batch()
+                    logger.warning(
+                        "Pagination interrupted after page %s: %s; resuming from page %s (%s resume(s) left)",
+                        last_page, e, last_page + 1, resumes_left,
+                    )
 
-            # Client-side deduplication
-            seen = set()
-            unique_rows = []
-            for r in rows:
-                key = (r["term_id"], r["vendista_tx_id"])
-                if key in seen:
-                    continue
-                seen.add(key)
-                unique_rows.append(r)
-
-            skipped_duplicates = len(rows) - len(unique_rows)
-            logger.info(f"Client-side dedupe: {len(rows)} -> {len(unique_rows)} (skipped {skipped_duplicates})")
-
-            if not unique_rows:
-                logger.info("No unique rows to insert after deduplication")
-                return SyncResult(
-                    success=True,
-                    fetched=len(transactions),
-                    inserted=0,
-                    skipped_duplicates=skipped_duplicates,
-                    expected_total=expected_total,
-                    pages_fetched=pages_fetched,
-                    items_per_page=items_per_page_resp,
-                    last_page=last_page,
-                    transactions_synced=0,
-                    error_message=None,
+            # Final batch (possibly empty) carries the remaining watermarks
+            self._collect_watermarks(batch, watermarks)
+            if batch_pages or watermarks:
+                batch_inserted, batch_skipped = await asyncio.to_thread(
+                    self._upsert_tx_batch, db, batch, watermarks, advance_global
                 )
+                inserted += batch_inserted
+                skipped_duplicates += batch_skipped
+                last_page = max(last_page, batch_last_page)
 
-            # Bulk insert with ON CONFLICT DO NOTHING
-            stmt = pg_insert(VendistaTxRaw).values(unique_rows)
-            stmt = stmt.on_conflict_do_nothing(constraint="uq_vendista_tx")
-            
-            result = db.execute(stmt)
-            db.commit()
-
-            inserted = result.rowcount if result.rowcount is not None else 0
-            
             logger.info(
-                f"Sync completed: fetched={len(transactions)}, "
-                f"inserted={inserted}, skipped_duplicates={skipped_duplicates}"
+                f"Sync completed: fetched={fetched}, "
+                f"inserted={inserted}, skipped_duplicates={skipped_duplicates}, "
+                f"pages={pages_fetched}, last_page={last_page}"
             )
 
             return SyncResult(
                 success=True,
-                fetched=len(transactions),
+                fetched=fetched,
                 inserted=inserted,
                 skipped_duplicates=skipped_duplicates,
-                expected_total=expected_total,
+                expected_total=expected_total or 0,
                 pages_fetched=pages_fetched,
                 items_per_page=items_per_page_resp,
                 last_page=last_page,
                 transactions_synced=inserted,
+                window_start=window_start,
+                window_end=window_end,
                 error_message=None,
             )
 
         except Exception as e:
-            logger.error(f"Sync failed: {e}", exc_info=True)
+            logger.error(f"Sync failed after committed page {last_page}: {e}", exc_info=True)
             db.rollback()
             return SyncResult(
                 success=False,
-                fetched=0,
-                inserted=0,
-                skipped_duplicates=0,
-                expected_total=0,
-                pages_fetched=0,
-                items_per_page=items_per_page,
-                last_page=0,
-                transactions_synced=0,
+                fetched=fetched,
+                inserted=inserted,
+                skipped_duplicates=skipped_duplicates,
+                expected_total=expected_total or 0,
+                pages_fetched=pages_fetched,
+                items_per_page=items_per_page_resp,
+                last_page=last_page,
+                transactions_synced=inserted,
+                window_start=window_start,
+                window_end=window_end,
                 error_message=str(e),
             )
 
+    @staticmethod
+    def _collect_watermarks(rows: List[dict], watermarks: Dict[int, Tuple[datetime, int]]) -> None:
+        """Fold the newest tx_time per terminal of a batch into watermarks."""
+        for row in rows:
+            tx_time = row["tx_time"]
+            if tx_time.tzinfo is None:
+                tx_time = tx_time.replace(tzinfo=timezone.utc)
+            current = watermarks.get(row["term_id"])
+            if current is None or tx_time > current[0]:
+                watermarks[row["term_id"]] = (tx_time, row["vendista_tx_id"])
+
+    def _prepare_tx_row(self, tx: dict) -> Optional[dict]:
+        """Convert a Vendista transaction dict into a vendista_tx_raw row (None if invalid)."""
+        try:
+            vendista_tx_id = tx.get("id")
+            term_id = tx.get("term_id")
+            tx_time_str = tx.get("time")
+
+            if not vendista_tx_id or not term_id or not tx_time_str:
+                logger.warning(f"Skipping transaction with missing fields: {tx}")
+                return None
+
+            try:
+                tx_time = datetime.fromisoformat(tx_time_str.replace('Z', '+00:00'))
+            except (ValueError, AttributeError):
+                logger.warning(f"Failed to parse tx_time '{tx_time_str}' for tx {vendista_tx_id}")
+                tx_time = datetime.utcnow()
+
+            machine_items = tx.get("machine_item") or [{}]
+            machine_item = machine_items[0] if isinstance(machine_items, list) and machine_items else {}
+
+            return {
+                "term_id": term_id,
+                "vendista_tx_id": vendista_tx_id,
+                "tx_time": tx_time,
+                "sum_kopecks": self._to_int(tx.get("sum")),
+                "machine_item_id": self._to_int(machine_item.get("machine_item_id")) if isinstance(machine_item, dict) else None,
+                "status": self._json_text(tx.get("status")),
+                "terminal_comment": self._json_text(tx.get("terminal_comment")),
+                "payload": tx
+            }
+        except Exception as e:
+            logger.error(f"Error preparing transaction: {e}")
+            return None
+
+    @staticmethod
+    def _to_int(value) -> Optional[int]:
+        """Parse a numeric payload field like (payload->>'x')::numeric::bigint does."""
+        if value is None or value == "" or isinstance(value, bool):
+            return None
+        try:
+            return int(Decimal(str(value)).to_integral_value(rounding=ROUND_HALF_UP))
+        except (InvalidOperation, ValueError):
+            return None
+
+    @staticmethod
+    def _json_text(value) -> Optional[str]:
+        """Text of a payload field as returned by payload->>'x'."""
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value, ensure_ascii=False)
+
+    def _upsert_tx_batch(
+        self,
+        db: Session,
+        rows: List[dict],
+        watermarks: Optional[Dict[int, Tuple[datetime, int]]] = None,
+        advance_global: bool = True
+    ) -> Tuple[int, int]:
+        """
+        Deduplicate a batch client-side and insert it with ON CONFLICT DO NOTHING.
+        Derives tx_fact rows for the inserted transactions, rebuilds the daily
+        rollup of the touched days, upserts the terminals seen in the batch,
+        advances sync_state watermarks (if given; the fleet-wide one only with
+        advance_global) and commits, all in one transaction.
+
+        Returns:
+            (inserted, skipped_duplicates)
+        """
+        seen = set()
+        unique_rows = []
+        for r in rows:
+            key = (r["term_id"], r["vendista_tx_id"])
+            if key in seen:
+                continue
+            seen.add(key)
+            unique_rows.append(r)
+
+        skipped_duplicates = len(rows) - len(unique_rows)
+
+        inserted = 0
+        if unique_rows:
+            stmt = pg_insert(VendistaTxRaw).values(unique_rows)
+            stmt = stmt.on_conflict_do_nothing(constraint="uq_vendista_tx").returning(VendistaTxRaw.id)
+            inserted_ids = db.execute(stmt).scalars().all()
+            inserted = len(inserted_ids)
+            TxFactService(db).refresh_transactions(inserted_ids)
+            KpiRollupService(db).process_dirty_days()
+            self._upsert_batch_terminals(db, unique_rows)
+
+        if watermarks:
+            crud_vendista.advance_sync_states(db, watermarks, advance_global=advance_global)
+
+        db.commit()
+
+        logger.info(
+            f"Batch upserted: {len(rows)} rows -> {len(unique_rows)} unique, inserted={inserted}"
+        )
+        return inserted, skipped_duplicates
 
     def get_sync_status(self, db: Session) -> dict:
         """
@@ -240,7 +463,6 @@ class VendistaSyncService:
             Dict with sync result
         """
         from app.crud import vendista as crud_vendista
-        from app.schemas.vendista import VendistaTerminalCreate, VendistaTerminalUpdate
         
         try:
             logger.info("Starting terminal sync from Vendista API")
@@ -255,10 +477,8 @@ class VendistaSyncService:
             terminals_data = api_result["terminals"]
             logger.info(f"Received {len(terminals_data)} terminals from API")
             
-            synced_count = 0
-            created_count = 0
-            updated_count = 0
-            terminals = []
+            # term_id -> (title, comment, is_active) reported by the API
+            reported: Dict[int, Tuple[Optional[str], Optional[str], bool]] = {}
             
             for term_data in terminals_data:
                 try:
@@ -289,54 +509,41 @@ class VendistaSyncService:
                     if isinstance(is_active, str):
                         is_active = is_active.lower() in ("true", "1", "yes", "active")
                     
-                    # Check if terminal already exists
-                    existing_terminal = crud_vendista.get_terminal(db, term_id)
-                    
-                    if existing_terminal:
-                        # Update existing terminal
-                        needs_update = False
-                        update_data_dict = {}
-                        
-                        if comment and existing_terminal.comment != comment:
-                            update_data_dict["comment"] = comment
-                            needs_update = True
-                        if title and existing_terminal.title != title:
-                            update_data_dict["title"] = title
-                            needs_update = True
-                        if existing_terminal.is_active != is_active:
-                            update_data_dict["is_active"] = is_active
-                            needs_update = True
-                        
-                        if needs_update:
-                            update_data = VendistaTerminalUpdate(**update_data_dict)
-                            crud_vendista.update_terminal(db, term_id, update_data)
-                            updated_count += 1
-                            logger.info(f"Updated terminal {term_id}: {comment or title}")
-                        else:
-                            logger.debug(f"Terminal {term_id} already up to date")
-                    else:
-                        # Create new terminal
-                        terminal_data = VendistaTerminalCreate(
-                            id=term_id,
-                            title=title,
-                            comment=comment,
-                            is_active=is_active
-                        )
-                        crud_vendista.create_terminal(db, terminal_data)
-                        created_count += 1
-                        logger.info(f"Created terminal {term_id}: {comment or title}")
-                    
-                    synced_count += 1
-                    terminals.append({
-                        "id": term_id,
-                        "comment": comment,
-                        "title": title
-                    })
+                    reported[int(term_id)] = (title, comment, bool(is_active))
                     
                 except Exception as e:
                     logger.error(f"Error processing terminal: {e}", exc_info=True)
                     continue
             
+            existing = crud_vendista.get_terminals_by_ids(db, list(reported))
+            synced_at = datetime.now(timezone.utc)
+            rows = []
+            terminals = []
+            for term_id, (title, comment, is_active) in reported.items():
+                current = existing.get(term_id)
+                # The API reports the current comment: older transactions must not override it
+                comment_tx_time = synced_at if comment else None
+                if current is not None:
+                    # Empty values from the API do not erase what we already have
+                    title = title or current.title
+                    if not comment or comment == current.comment:
+                        comment = comment or current.comment
+                        comment_tx_time = current.comment_tx_time
+                rows.append({
+                    "id": term_id,
+                    "title": title,
+                    "comment": comment,
+                    "comment_tx_time": comment_tx_time,
+                    "is_active": is_active,
+                })
+                terminals.append({
+                    "id": term_id,
+                    "comment": comment,
+                    "title": title
+                })
+            
+            created_count, updated_count = self._upsert_terminals(db, rows, existing)
+            synced_count = len(rows)
             db.commit()
             
             logger.info(
@@ -361,12 +568,95 @@ class VendistaSyncService:
             logger.info("Falling back to transactions sync method")
             return self.sync_terminals_from_transactions(db)
 
+    def _upsert_batch_terminals(self, db: Session, rows: List[dict]) -> None:
+        """Upsert the terminals of an ingest batch: the latest non-empty comment per terminal."""
+        seen: Dict[int, Tuple[datetime, Optional[str], Optional[str]]] = {}
+        for row in rows:
+            tx_time = row["tx_time"]
+            if tx_time.tzinfo is None:
+                tx_time = tx_time.replace(tzinfo=timezone.utc)
+            comment = row["terminal_comment"] or None
+            terminal_id = self._json_text(row["payload"].get("terminal_id")) or None
+            current = seen.get(row["term_id"])
+            if current is None or (comment and (current[1] is None or tx_time > current[0])):
+                seen[row["term_id"]] = (tx_time, comment, terminal_id or (current[2] if current else None))
+        self._apply_seen_terminals(db, {
+            term_id: (comment, terminal_id, tx_time if comment else None)
+            for term_id, (tx_time, comment, terminal_id) in seen.items()
+        })
+
+    def _apply_seen_terminals(
+        self,
+        db: Session,
+        seen: Dict[int, Tuple[Optional[str], Optional[str], Optional[datetime]]]
+    ) -> Tuple[List[dict], int, int]:
+        """
+        Upsert terminals seen in transactions.
+
+        New terminals use terminal_id as title; existing ones keep title and
+        status and only take a non-empty comment newer than the stored one
+        (comment_tx_time): full syncs page newest-first and backfills load
+        old periods, so a later batch may carry an older comment. Does not
+        commit.
+
+        Args:
+            seen: term_id -> (terminal_comment, terminal_id, tx_time of the comment)
+
+        Returns:
+            (terminal rows, created, updated)
+        """
+        existing = crud_vendista.get_terminals_by_ids(db, list(seen))
+        rows = []
+        for term_id, (comment, terminal_id, comment_tx_time) in seen.items():
+            current = existing.get(term_id)
+            if current is not None and not (
+                comment and (current.comment_tx_time is None or comment_tx_time > current.comment_tx_time)
+            ):
+                comment, comment_tx_time = current.comment, current.comment_tx_time
+            rows.append({
+                "id": term_id,
+                "title": current.title if current is not None else terminal_id,
+                "comment": comment,
+                "comment_tx_time": comment_tx_time,
+                "is_active": current.is_active if current is not None else True,
+            })
+        created, updated = self._upsert_terminals(db, rows, existing)
+        return rows, created, updated
+
+    @staticmethod
+    def _upsert_terminals(db: Session, rows: List[dict], existing: Dict[int, VendistaTerminal]) -> Tuple[int, int]:
+        """
+        Write only new or changed terminals with one bulk upsert.
+
+        Args:
+            rows: Desired terminal state (id, title, comment, comment_tx_time, is_active)
+            existing: Current terminals by id
+
+        Returns:
+            (created, updated) counts reported by the upsert
+        """
+        changed = [
+            row for row in rows
+            if row["id"] not in existing
+            or (
+                existing[row["id"]].title, existing[row["id"]].comment,
+                existing[row["id"]].comment_tx_time, existing[row["id"]].is_active
+            ) != (row["title"], row["comment"], row["comment_tx_time"], row["is_active"])
+        ]
+        created, updated = crud_vendista.upsert_terminals(db, changed)
+        logger.debug(f"Terminal upsert: {len(rows)} reported, {len(changed)} changed")
+        return created, updated
+
     def sync_terminals_from_transactions(self, db: Session) -> dict:
         """
         Sync terminals from vendista_tx_raw transactions into vendista_terminals table.
         
-        Extracts unique terminals from transaction payloads and creates/updates
-        terminal records with title (from terminal_comment) and comment.
+        Ingest already upserts the terminals of every batch in the same
+        transaction, so this is a catch-up for rows stored before that. It
+        walks the distinct term_ids with a loose index scan over
+        ix_vendista_tx_raw_term_time and reads the latest rows of each
+        terminal, so the cost follows the number of terminals, not the
+        table size.
         
         Args:
             db: Database session
@@ -375,73 +665,55 @@ class VendistaSyncService:
             Dict with sync result: {success, synced_count, updated_count, created_count, terminals}
         """
         from sqlalchemy import text
-        from app.crud import vendista as crud_vendista
-        from app.schemas.vendista import VendistaTerminalCreate
         
         try:
             logger.info("Starting terminal sync from transactions")
             
-            # Extract unique terminals from transactions
+            # Latest non-empty comment per terminal (terminal_id of the latest row if there is none)
             query = text("""
-                SELECT DISTINCT ON (term_id)
-                    term_id,
-                    MAX(payload->>'terminal_comment') as terminal_comment,
-                    MAX(payload->>'terminal_id') as terminal_id
-                FROM vendista_tx_raw
-                WHERE term_id IS NOT NULL
-                GROUP BY term_id
-                ORDER BY term_id
+                WITH RECURSIVE terms AS (
+                    SELECT MIN(term_id) AS term_id FROM vendista_tx_raw
+                    UNION ALL
+                    SELECT (SELECT MIN(term_id) FROM vendista_tx_raw WHERE term_id > terms.term_id)
+                    FROM terms
+                    WHERE terms.term_id IS NOT NULL
+                )
+                SELECT
+                    terms.term_id,
+                    commented.terminal_comment,
+                    commented.tx_time AS comment_tx_time,
+                    COALESCE(commented.terminal_id, latest.terminal_id) AS terminal_id
+                FROM terms
+                LEFT JOIN LATERAL (
+                    SELECT r.terminal_comment, r.tx_time, r.payload->>'terminal_id' AS terminal_id
+                    FROM vendista_tx_raw r
+                    WHERE r.term_id = terms.term_id AND r.terminal_comment <> ''
+                    ORDER BY r.tx_time DESC
+                    LIMIT 1
+                ) commented ON true
+                LEFT JOIN LATERAL (
+                    SELECT r.payload->>'terminal_id' AS terminal_id
+                    FROM vendista_tx_raw r
+                    WHERE r.term_id = terms.term_id
+                    ORDER BY r.tx_time DESC
+                    LIMIT 1
+                ) latest ON true
+                WHERE terms.term_id IS NOT NULL
             """)
             
-            result = db.execute(query)
-            terminal_rows = result.fetchall()
+            terminal_rows = db.execute(query).fetchall()
             
-            logger.info(f"Found {len(terminal_rows)} unique terminals in transactions")
-            
-            synced_count = 0
-            created_count = 0
-            updated_count = 0
-            terminals = []
-            
-            for row in terminal_rows:
-                term_id = row.term_id
-                terminal_comment = row.terminal_comment or ""
-                terminal_id = row.terminal_id or ""
-                
-                # Check if terminal already exists
-                existing_terminal = crud_vendista.get_terminal(db, term_id)
-                
-                if existing_terminal:
-                    # Update existing terminal if comment changed
-                    if existing_terminal.comment != terminal_comment:
-                        from app.schemas.vendista import VendistaTerminalUpdate
-                        update_data = VendistaTerminalUpdate(
-                            comment=terminal_comment if terminal_comment else None
-                        )
-                        crud_vendista.update_terminal(db, term_id, update_data)
-                        updated_count += 1
-                        logger.info(f"Updated terminal {term_id}: {terminal_comment}")
-                    else:
-                        logger.debug(f"Terminal {term_id} already exists, skipping")
-                else:
-                    # Create new terminal
-                    terminal_data = VendistaTerminalCreate(
-                        id=term_id,
-                        title=terminal_id if terminal_id else None,  # Use terminal_id as title
-                        comment=terminal_comment if terminal_comment else None,
-                        is_active=True
-                    )
-                    crud_vendista.create_terminal(db, terminal_data)
-                    created_count += 1
-                    logger.info(f"Created terminal {term_id}: {terminal_comment}")
-                
-                synced_count += 1
-                terminals.append({
-                    "id": term_id,
-                    "comment": terminal_comment,
-                    "terminal_id": terminal_id
-                })
+            logger.info(f"Found {len(terminal_rows)} terminals in transactions")
             
+            rows, created_count, updated_count = self._apply_seen_terminals(db, {
+                row.term_id: (row.terminal_comment or None, row.terminal_id or None, row.comment_tx_time)
+                for row in terminal_rows
+            })
+            synced_count = len(rows)
+            terminals = [
+                {"id": row.term_id, "comment": row.terminal_comment or "", "terminal_id": row.terminal_id or ""}
+                for row in terminal_rows
+            ]
             db.commit()
             
             logger.info(
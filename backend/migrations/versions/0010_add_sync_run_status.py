@@ -0,0 +1,39 @@
+"""Add job status columns to sync_runs
+
+Revision ID: 0010_add_sync_run_status
+Revises: 0009_add_email_password_auth
+Create Date: 2026-10-17
+
+Sync runs are now executed by a background job runner: the row is created
+when the job is accepted and updated when it finishes, so it needs an
+explicit status plus the parameters required to re-run or resume it.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0010_add_sync_run_status'
+down_revision = '0009_add_email_password_auth'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 'running', 'success', 'error'
+    op.add_column('sync_runs', sa.Column('status', sa.Text(), nullable=False, server_default='success'))
+    # 'full' or 'incremental'
+    op.add_column('sync_runs', sa.Column('mode', sa.Text(), nullable=False, server_default='full'))
+    # 'manual', 'rerun' or 'schedule'
+    op.add_column('sync_runs', sa.Column('trigger', sa.Text(), nullable=False, server_default='manual'))
+    op.add_column('sync_runs', sa.Column('order_desc', sa.Boolean(), nullable=False, server_default='true'))
+
+    op.execute("UPDATE sync_runs SET status = CASE WHEN ok THEN 'success' ELSE 'error' END")
+    op.create_index('idx_sync_runs_status', 'sync_runs', ['status'])
+
+
+def downgrade():
+    op.drop_index('idx_sync_runs_status', table_name='sync_runs')
+    op.drop_column('sync_runs', 'order_desc')
+    op.drop_column('sync_runs', 'trigger')
+    op.drop_column('sync_runs', 'mode')
+    op.drop_column('sync_runs', 'status')
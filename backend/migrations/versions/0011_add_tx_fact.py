@@ -0,0 +1,189 @@
+"""Add tx_fact table and read vw_tx_cogs from it
+
+Revision ID: 0011_add_tx_fact
+Revises: 0010_add_sync_run_status
+Create Date: 2026-10-17
+
+vw_tx_cogs re-parsed the JSON payload, joined four tables and ran the COGS
+subquery twice for every row of every analytics query. tx_fact stores the
+derived values once (filled at ingest, refreshed by TxFactService when
+recipes, matrices, prices or terminal locations change); vw_tx_cogs keeps
+its columns and becomes a thin projection over it.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0011_add_tx_fact'
+down_revision = '0010_add_sync_run_status'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'tx_fact',
+        sa.Column('tx_id', sa.BigInteger(), nullable=False),
+        sa.Column('term_id', sa.BigInteger(), nullable=False),
+        sa.Column('vendista_tx_id', sa.BigInteger(), nullable=False),
+        sa.Column('tx_time', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('tx_date', sa.Date(), nullable=False),
+        sa.Column('sum_kopecks', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('machine_item_id', sa.Integer(), nullable=True),
+        sa.Column('location_id', sa.Integer(), nullable=True),
+        sa.Column('drink_id', sa.Integer(), nullable=True),
+        sa.Column('cogs', sa.Numeric(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['tx_id'], ['vendista_tx_raw.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('tx_id')
+    )
+    op.create_index('ix_tx_fact_term_id', 'tx_fact', ['term_id'])
+    op.create_index('ix_tx_fact_tx_time', 'tx_fact', ['tx_time'])
+    op.create_index('ix_tx_fact_date_location', 'tx_fact', ['tx_date', 'location_id'])
+    op.create_index('ix_tx_fact_drink', 'tx_fact', ['drink_id'])
+
+    # Backfill from existing raw transactions (same derivation as TxFactService)
+    op.execute("""
+        INSERT INTO tx_fact (
+            tx_id, term_id, vendista_tx_id, tx_time, tx_date,
+            sum_kopecks, machine_item_id, location_id, drink_id, cogs
+        )
+        SELECT DISTINCT ON (t.id)
+            t.id,
+            t.term_id,
+            t.vendista_tx_id,
+            t.tx_time,
+            t.tx_time::date,
+            COALESCE((t.payload->>'sum')::numeric, 0)::bigint,
+            (t.payload->'machine_item'->0->>'machine_item_id')::int,
+            vt.location_id,
+            bmi.drink_id,
+            COALESCE(dc.cogs, 0)
+        FROM vendista_tx_raw t
+        LEFT JOIN vendista_terminals vt ON vt.id = t.term_id
+        LEFT JOIN terminal_matrix_map tmm
+            ON tmm.vendista_term_id = t.term_id
+            AND tmm.is_active = true
+        LEFT JOIN button_matrix_items bmi
+            ON bmi.matrix_id = tmm.matrix_id
+            AND bmi.machine_item_id = (t.payload->'machine_item'->0->>'machine_item_id')::int
+            AND bmi.is_active = true
+        LEFT JOIN (
+            SELECT
+                di.drink_id,
+                SUM(
+                    CASE
+                        WHEN di.unit = i.unit THEN di.qty_per_unit * i.cost_per_unit_rub
+                        WHEN di.unit = 'g' AND i.unit = 'kg' THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
+                        WHEN di.unit = 'ml' AND i.unit = 'l' THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
+                        WHEN di.unit = 'g' AND i.unit = 'g' AND i.cost_per_unit_rub > 100 THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
+                        ELSE di.qty_per_unit * i.cost_per_unit_rub
+                    END
+                ) as cogs
+            FROM drink_items di
+            JOIN ingredients i ON i.ingredient_code = di.ingredient_code
+            WHERE i.expense_kind = 'stock_tracked'
+              AND i.cost_per_unit_rub IS NOT NULL
+            GROUP BY di.drink_id
+        ) dc ON dc.drink_id = bmi.drink_id
+        ORDER BY t.id, tmm.matrix_id
+    """)
+
+    # Same columns and types as before, so dependent views stay valid
+    op.execute("""
+        CREATE OR REPLACE VIEW vw_tx_cogs AS
+        SELECT
+            f.tx_id as id,
+            f.term_id,
+            f.vendista_tx_id,
+            f.tx_date,
+            f.tx_time,
+            NULL::text as product_name,
+            NULL::text as price,
+            f.sum_kopecks / 100.0 as revenue,  -- Convert from kopecks to rubles
+            f.machine_item_id,
+            f.location_id,
+            f.drink_id,
+            d.name as drink_name,
+            f.cogs,
+            f.sum_kopecks / 100.0 - f.cogs as gross_profit
+        FROM tx_fact f
+        LEFT JOIN drinks d ON d.id = f.drink_id
+        WHERE f.sum_kopecks > 0;
+    """)
+
+
+def downgrade():
+    # Restore the payload-parsing definition from 0008
+    op.execute("""
+        CREATE OR REPLACE VIEW vw_tx_cogs AS
+        SELECT
+            t.id,
+            t.term_id,
+            t.vendista_tx_id,
+            t.tx_time::date as tx_date,
+            t.tx_time,
+            NULL as product_name,  -- Not available in new payload structure
+            NULL as price,  -- Not available in new payload structure
+            (t.payload->>'sum')::numeric / 100.0 as revenue,  -- Convert from kopecks to rubles
+            (t.payload->'machine_item'->0->>'machine_item_id')::int as machine_item_id,
+            vt.location_id,
+            bmi.drink_id,
+            d.name as drink_name,
+            COALESCE(
+                (SELECT SUM(
+                    CASE 
+                        -- Если единицы совпадают, просто умножаем
+                        WHEN di.unit = i.unit THEN di.qty_per_unit * i.cost_per_unit_rub
+                        -- Конвертация: рецепт в граммах, ингредиент в килограммах
+                        WHEN di.unit = 'g' AND i.unit = 'kg' THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
+                        -- Конвертация: рецепт в миллилитрах, ингредиент в литрах
+                        WHEN di.unit = 'ml' AND i.unit = 'l' THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
+                        -- Конвертация: рецепт в граммах, ингредиент в граммах (но цена за кг, если цена > 100)
+                        WHEN di.unit = 'g' AND i.unit = 'g' AND i.cost_per_unit_rub > 100 THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
+                        -- Остальные случаи - просто умножаем (предполагаем одинаковые единицы)
+                        ELSE di.qty_per_unit * i.cost_per_unit_rub
+                    END
+                )
+                 FROM drink_items di
+                 JOIN ingredients i ON i.ingredient_code = di.ingredient_code
+                 WHERE di.drink_id = bmi.drink_id
+                   AND i.expense_kind = 'stock_tracked'
+                   AND i.cost_per_unit_rub IS NOT NULL),
+                0
+            ) as cogs,
+            (t.payload->>'sum')::numeric / 100.0 - COALESCE(
+                (SELECT SUM(
+                    CASE 
+                        WHEN di.unit = i.unit THEN di.qty_per_unit * i.cost_per_unit_rub
+                        WHEN di.unit = 'g' AND i.unit = 'kg' THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
+                        WHEN di.unit = 'ml' AND i.unit = 'l' THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
+                        WHEN di.unit = 'g' AND i.unit = 'g' AND i.cost_per_unit_rub > 100 THEN di.qty_per_unit * (i.cost_per_unit_rub / 1000.0)
+                        ELSE di.qty_per_unit * i.cost_per_unit_rub
+                    END
+                )
+                 FROM drink_items di
+                 JOIN ingredients i ON i.ingredient_code = di.ingredient_code
+                 WHERE di.drink_id = bmi.drink_id
+                   AND i.expense_kind = 'stock_tracked'
+                   AND i.cost_per_unit_rub IS NOT NULL),
+                0
+            ) as gross_profit
+        FROM vendista_tx_raw t
+        LEFT JOIN vendista_terminals vt ON vt.id = t.term_id
+        LEFT JOIN terminal_matrix_map tmm 
+            ON tmm.vendista_term_id = t.term_id 
+            AND tmm.is_active = true
+        LEFT JOIN button_matrix_items bmi 
+            ON bmi.matrix_id = tmm.matrix_id 
+            AND bmi.machine_item_id = (t.payload->'machine_item'->0->>'machine_item_id')::int
+            AND bmi.is_active = true
+        LEFT JOIN drinks d ON d.id = bmi.drink_id
+        WHERE (t.payload->>'sum')::numeric > 0;
+    """)
+
+    op.drop_index('ix_tx_fact_drink', table_name='tx_fact')
+    op.drop_index('ix_tx_fact_date_location', table_name='tx_fact')
+    op.drop_index('ix_tx_fact_tx_time', table_name='tx_fact')
+    op.drop_index('ix_tx_fact_term_id', table_name='tx_fact')
+    op.drop_table('tx_fact')
@@ -0,0 +1,113 @@
+"""Add kpi_daily_rollup with dirty-day queue and read vw_kpi_daily from it
+
+Revision ID: 0012_add_kpi_daily_rollup
+Revises: 0011_add_tx_fact
+Create Date: 2026-10-17
+
+vw_kpi_daily (and vw_owner_report_daily built on it) aggregated the whole
+transaction history on every request. kpi_daily_rollup keeps per-day
+aggregates keyed by (tx_date, location_id, term_id, drink_id); days whose
+tx_fact rows change are queued in kpi_dirty_days and rebuilt by
+KpiRollupService. vw_kpi_daily keeps its columns, so vw_owner_report_daily
+now reads the rollup as well.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0012_add_kpi_daily_rollup'
+down_revision = '0011_add_tx_fact'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'kpi_daily_rollup',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('tx_date', sa.Date(), nullable=False),
+        sa.Column('location_id', sa.Integer(), nullable=True),
+        sa.Column('term_id', sa.BigInteger(), nullable=False),
+        sa.Column('drink_id', sa.Integer(), nullable=True),
+        sa.Column('sales_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('revenue', sa.Numeric(), nullable=False, server_default='0'),
+        sa.Column('cogs', sa.Numeric(), nullable=False, server_default='0'),
+        sa.Column('gross_profit', sa.Numeric(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_kpi_daily_rollup_key',
+        'kpi_daily_rollup',
+        ['tx_date', 'location_id', 'term_id', 'drink_id']
+    )
+
+    op.create_table(
+        'kpi_dirty_days',
+        sa.Column('tx_date', sa.Date(), nullable=False),
+        sa.Column('queued_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('tx_date')
+    )
+
+    # Backfill from tx_fact (same aggregation as KpiRollupService)
+    op.execute("""
+        INSERT INTO kpi_daily_rollup (
+            tx_date, location_id, term_id, drink_id,
+            sales_count, revenue, cogs, gross_profit
+        )
+        SELECT
+            tx_date,
+            location_id,
+            term_id,
+            drink_id,
+            COUNT(*),
+            SUM(sum_kopecks) / 100.0,
+            SUM(cogs),
+            SUM(sum_kopecks) / 100.0 - SUM(cogs)
+        FROM tx_fact
+        WHERE sum_kopecks > 0
+        GROUP BY tx_date, location_id, term_id, drink_id
+    """)
+
+    # Same columns and types as before, so vw_owner_report_daily stays valid
+    op.execute("""
+        CREATE OR REPLACE VIEW vw_kpi_daily AS
+        SELECT
+            tx_date,
+            location_id,
+            SUM(sales_count)::bigint as sales_count,
+            SUM(revenue) as revenue,
+            SUM(cogs) as cogs,
+            SUM(gross_profit) as gross_profit,
+            CASE 
+                WHEN SUM(revenue) > 0 
+                THEN (SUM(gross_profit) / SUM(revenue) * 100)::numeric(5,2)
+                ELSE 0 
+            END as gross_margin_pct
+        FROM kpi_daily_rollup
+        GROUP BY tx_date, location_id;
+    """)
+
+
+def downgrade():
+    op.execute("""
+        CREATE OR REPLACE VIEW vw_kpi_daily AS
+        SELECT
+            tx_date,
+            location_id,
+            COUNT(*) as sales_count,
+            SUM(revenue) as revenue,
+            SUM(cogs) as cogs,
+            SUM(gross_profit) as gross_profit,
+            CASE 
+                WHEN SUM(revenue) > 0 
+                THEN (SUM(gross_profit) / SUM(revenue) * 100)::numeric(5,2)
+                ELSE 0 
+            END as gross_margin_pct
+        FROM vw_tx_cogs
+        GROUP BY tx_date, location_id;
+    """)
+
+    op.drop_table('kpi_dirty_days')
+    op.drop_index('ix_kpi_daily_rollup_key', table_name='kpi_daily_rollup')
+    op.drop_table('kpi_daily_rollup')
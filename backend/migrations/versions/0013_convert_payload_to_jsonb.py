@@ -0,0 +1,64 @@
+"""Convert vendista_tx_raw.payload to JSONB and index payload fields
+
+Revision ID: 0013_convert_payload_to_jsonb
+Revises: 0012_add_kpi_daily_rollup
+Create Date: 2026-10-17
+
+With JSON every payload->>'...' access re-parsed the document text.
+JSONB is stored pre-parsed, and lets the hot filters use indexes:
+- ix_vendista_tx_raw_sales_time: tx_time of sales only (partial, sum > 0),
+  used by the transactions list/export and terminal stats
+- ix_vendista_tx_raw_term_machine_item: (term_id, machine_item_id
+  expression), used by the matrix joins and unmapped-items lookup
+- ix_vendista_tx_raw_term_time: (term_id, tx_time) for per-terminal
+  filters (term_id is already a column equal to payload term_id)
+
+No view reads payload since 0011, so the column type can change in place.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0013_convert_payload_to_jsonb'
+down_revision = '0012_add_kpi_daily_rollup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column(
+        'vendista_tx_raw',
+        'payload',
+        type_=postgresql.JSONB(astext_type=sa.Text()),
+        existing_type=postgresql.JSON(astext_type=sa.Text()),
+        existing_nullable=False,
+        postgresql_using='payload::jsonb'
+    )
+
+    op.create_index(
+        'ix_vendista_tx_raw_sales_time',
+        'vendista_tx_raw',
+        ['tx_time'],
+        postgresql_where=sa.text("(payload->>'sum')::numeric > 0")
+    )
+    op.execute("""
+        CREATE INDEX ix_vendista_tx_raw_term_machine_item
+        ON vendista_tx_raw (term_id, ((payload->'machine_item'->0->>'machine_item_id')::int))
+    """)
+    op.create_index('ix_vendista_tx_raw_term_time', 'vendista_tx_raw', ['term_id', 'tx_time'])
+
+
+def downgrade():
+    op.drop_index('ix_vendista_tx_raw_term_time', table_name='vendista_tx_raw')
+    op.drop_index('ix_vendista_tx_raw_term_machine_item', table_name='vendista_tx_raw')
+    op.drop_index('ix_vendista_tx_raw_sales_time', table_name='vendista_tx_raw')
+
+    op.alter_column(
+        'vendista_tx_raw',
+        'payload',
+        type_=postgresql.JSON(astext_type=sa.Text()),
+        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+        existing_nullable=False,
+        postgresql_using='payload::json'
+    )
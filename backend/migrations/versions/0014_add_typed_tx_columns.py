@@ -0,0 +1,69 @@
+"""Add typed payload columns to vendista_tx_raw
+
+Revision ID: 0014_add_typed_tx_columns
+Revises: 0013_convert_payload_to_jsonb
+Create Date: 2026-10-17
+
+sum_kopecks, machine_item_id, status and terminal_comment are written by
+the sync at ingest, so readers no longer cast JSON strings per row. The
+payload expression indexes from 0013 are replaced by indexes on the
+new columns.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0014_add_typed_tx_columns'
+down_revision = '0013_convert_payload_to_jsonb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('vendista_tx_raw', sa.Column('sum_kopecks', sa.BigInteger(), nullable=True))
+    op.add_column('vendista_tx_raw', sa.Column('machine_item_id', sa.Integer(), nullable=True))
+    op.add_column('vendista_tx_raw', sa.Column('status', sa.Text(), nullable=True))
+    op.add_column('vendista_tx_raw', sa.Column('terminal_comment', sa.Text(), nullable=True))
+
+    # Backfill existing rows (same parsing as VendistaSyncService._prepare_tx_row)
+    op.execute("""
+        UPDATE vendista_tx_raw SET
+            sum_kopecks = (payload->>'sum')::numeric::bigint,
+            machine_item_id = (payload->'machine_item'->0->>'machine_item_id')::int,
+            status = payload->>'status',
+            terminal_comment = payload->>'terminal_comment'
+    """)
+
+    op.drop_index('ix_vendista_tx_raw_term_machine_item', table_name='vendista_tx_raw')
+    op.drop_index('ix_vendista_tx_raw_sales_time', table_name='vendista_tx_raw')
+    op.create_index(
+        'ix_vendista_tx_raw_sales_time',
+        'vendista_tx_raw',
+        ['tx_time'],
+        postgresql_where=sa.text("sum_kopecks > 0")
+    )
+    op.create_index(
+        'ix_vendista_tx_raw_term_machine_item',
+        'vendista_tx_raw',
+        ['term_id', 'machine_item_id']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_vendista_tx_raw_term_machine_item', table_name='vendista_tx_raw')
+    op.drop_index('ix_vendista_tx_raw_sales_time', table_name='vendista_tx_raw')
+    op.create_index(
+        'ix_vendista_tx_raw_sales_time',
+        'vendista_tx_raw',
+        ['tx_time'],
+        postgresql_where=sa.text("(payload->>'sum')::numeric > 0")
+    )
+    op.execute("""
+        CREATE INDEX ix_vendista_tx_raw_term_machine_item
+        ON vendista_tx_raw (term_id, ((payload->'machine_item'->0->>'machine_item_id')::int))
+    """)
+
+    op.drop_column('vendista_tx_raw', 'terminal_comment')
+    op.drop_column('vendista_tx_raw', 'status')
+    op.drop_column('vendista_tx_raw', 'machine_item_id')
+    op.drop_column('vendista_tx_raw', 'sum_kopecks')
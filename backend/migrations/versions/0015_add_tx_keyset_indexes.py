@@ -0,0 +1,50 @@
+"""Add (tx_time, id) keyset indexes to vendista_tx_raw
+
+Revision ID: 0015_add_tx_keyset_indexes
+Revises: 0014_add_typed_tx_columns
+Create Date: 2026-10-17
+
+Cursor pagination of GET /transactions orders by (tx_time, id) and seeks
+with a row comparison, so each page is an index range scan:
+- ix_vendista_tx_raw_time_id: all transactions
+- ix_vendista_tx_raw_sales_time: sales only (sum_kopecks > 0), now with id
+- ix_vendista_tx_raw_term_time: per-terminal listing, now with id
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0015_add_tx_keyset_indexes'
+down_revision = '0014_add_typed_tx_columns'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_vendista_tx_raw_time_id', 'vendista_tx_raw', ['tx_time', 'id'])
+
+    op.drop_index('ix_vendista_tx_raw_sales_time', table_name='vendista_tx_raw')
+    op.create_index(
+        'ix_vendista_tx_raw_sales_time',
+        'vendista_tx_raw',
+        ['tx_time', 'id'],
+        postgresql_where=sa.text("sum_kopecks > 0")
+    )
+
+    op.drop_index('ix_vendista_tx_raw_term_time', table_name='vendista_tx_raw')
+    op.create_index('ix_vendista_tx_raw_term_time', 'vendista_tx_raw', ['term_id', 'tx_time', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_vendista_tx_raw_term_time', table_name='vendista_tx_raw')
+    op.create_index('ix_vendista_tx_raw_term_time', 'vendista_tx_raw', ['term_id', 'tx_time'])
+
+    op.drop_index('ix_vendista_tx_raw_sales_time', table_name='vendista_tx_raw')
+    op.create_index(
+        'ix_vendista_tx_raw_sales_time',
+        'vendista_tx_raw',
+        ['tx_time'],
+        postgresql_where=sa.text("sum_kopecks > 0")
+    )
+
+    op.drop_index('ix_vendista_tx_raw_time_id', table_name='vendista_tx_raw')
@@ -0,0 +1,136 @@
+"""Add ingredient_usage_daily ledger and read vw_inventory_balance from it
+
+Revision ID: 0016_add_ingredient_usage_daily
+Revises: 0015_add_tx_keyset_indexes
+Create Date: 2026-10-17
+
+vw_inventory_balance ran the same correlated subquery over vw_tx_cogs twice
+for every (ingredient, location) group, re-reading the whole sales history.
+ingredient_usage_daily keeps per-day consumption per location and
+ingredient; it is rebuilt together with kpi_daily_rollup for every day taken
+from kpi_dirty_days. The view keeps its columns and becomes loads minus
+ledger.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0016_add_ingredient_usage_daily'
+down_revision = '0015_add_tx_keyset_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ingredient_usage_daily',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('tx_date', sa.Date(), nullable=False),
+        sa.Column('location_id', sa.Integer(), nullable=True),
+        sa.Column('ingredient_code', sa.Text(), nullable=False),
+        sa.Column('qty_used', sa.Numeric(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ingredient_usage_daily_tx_date', 'ingredient_usage_daily', ['tx_date'])
+    op.create_index(
+        'ix_ingredient_usage_daily_ingredient_location',
+        'ingredient_usage_daily',
+        ['ingredient_code', 'location_id']
+    )
+
+    # Backfill from tx_fact (same aggregation as KpiRollupService)
+    op.execute("""
+        INSERT INTO ingredient_usage_daily (tx_date, location_id, ingredient_code, qty_used)
+        SELECT
+            f.tx_date,
+            f.location_id,
+            di.ingredient_code,
+            SUM(di.qty_per_unit)
+        FROM tx_fact f
+        JOIN drink_items di ON di.drink_id = f.drink_id
+        WHERE f.sum_kopecks > 0
+        GROUP BY f.tx_date, f.location_id, di.ingredient_code
+    """)
+
+    # Same columns as before; total_used becomes numeric from the ledger
+    op.execute("DROP VIEW IF EXISTS vw_inventory_balance")
+    op.execute("""
+        CREATE VIEW vw_inventory_balance AS
+        WITH loads AS (
+            SELECT ingredient_code, location_id, SUM(qty) as total_loaded
+            FROM ingredient_loads
+            GROUP BY ingredient_code, location_id
+        ),
+        usage AS (
+            SELECT ingredient_code, location_id, SUM(qty_used) as total_used
+            FROM ingredient_usage_daily
+            GROUP BY ingredient_code, location_id
+        )
+        SELECT
+            i.ingredient_code,
+            i.display_name_ru,
+            i.unit,
+            i.unit_ru,
+            i.cost_per_unit_rub,
+            i.alert_threshold,
+            i.alert_days_threshold,
+            ld.location_id,
+            l.name as location_name,
+            COALESCE(ld.total_loaded, 0) as total_loaded,
+            COALESCE(u.total_used, 0) as total_used,
+            COALESCE(ld.total_loaded, 0) - COALESCE(u.total_used, 0) as balance
+        FROM ingredients i
+        LEFT JOIN loads ld ON ld.ingredient_code = i.ingredient_code
+        LEFT JOIN locations l ON l.id = ld.location_id
+        LEFT JOIN usage u
+            ON u.ingredient_code = i.ingredient_code
+            AND u.location_id = ld.location_id
+        WHERE i.expense_kind = 'stock_tracked';
+    """)
+
+
+def downgrade():
+    # Restore the correlated-subquery definition from 0008
+    op.execute("DROP VIEW IF EXISTS vw_inventory_balance")
+    op.execute("""
+        CREATE VIEW vw_inventory_balance AS
+        SELECT
+            i.ingredient_code,
+            i.display_name_ru,
+            i.unit,
+            i.unit_ru,
+            i.cost_per_unit_rub,
+            i.alert_threshold,
+            i.alert_days_threshold,
+            il.location_id,
+            l.name as location_name,
+            COALESCE(SUM(il.qty), 0) as total_loaded,
+            COALESCE(
+                (SELECT SUM(di.qty_per_unit)
+                 FROM vw_tx_cogs t
+                 JOIN drink_items di ON di.drink_id = t.drink_id
+                 WHERE di.ingredient_code = i.ingredient_code
+                   AND t.location_id = il.location_id),
+                0
+            ) as total_used,
+            COALESCE(SUM(il.qty), 0) - COALESCE(
+                (SELECT SUM(di.qty_per_unit)
+                 FROM vw_tx_cogs t
+                 JOIN drink_items di ON di.drink_id = t.drink_id
+                 WHERE di.ingredient_code = i.ingredient_code
+                   AND t.location_id = il.location_id),
+                0
+            ) as balance
+        FROM ingredients i
+        LEFT JOIN ingredient_loads il ON il.ingredient_code = i.ingredient_code
+        LEFT JOIN locations l ON l.id = il.location_id
+        WHERE i.expense_kind = 'stock_tracked'
+        GROUP BY i.ingredient_code, i.display_name_ru, i.unit, i.unit_ru,
+                 i.cost_per_unit_rub, i.alert_threshold, i.alert_days_threshold,
+                 il.location_id, l.name;
+    """)
+
+    op.drop_index('ix_ingredient_usage_daily_ingredient_location', table_name='ingredient_usage_daily')
+    op.drop_index('ix_ingredient_usage_daily_tx_date', table_name='ingredient_usage_daily')
+    op.drop_table('ingredient_usage_daily')
@@ -0,0 +1,87 @@
+"""Add drink_cost_snapshot — recipe cost versioned by effective date
+
+Revision ID: 0017_add_drink_cost_snapshot
+Revises: 0016_add_ingredient_usage_daily
+Create Date: 2026-10-17
+
+The unit-conversion CASE was evaluated per transaction and per ingredient
+and repeated in several places. DrinkCostService now computes the cost of
+a recipe once per revision and stores it here; tx_fact and the drinks list
+read the current version (effective_to IS NULL).
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0017_add_drink_cost_snapshot'
+down_revision = '0016_add_ingredient_usage_daily'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'drink_cost_snapshot',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('drink_id', sa.Integer(), nullable=False),
+        sa.Column('effective_from', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('effective_to', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('cogs_rub', sa.Numeric(), nullable=False, server_default='0'),
+        sa.Column('items', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['drink_id'], ['drinks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_drink_cost_snapshot_drink_effective',
+        'drink_cost_snapshot',
+        ['drink_id', 'effective_from']
+    )
+    # At most one current version per drink
+    op.create_index(
+        'uq_drink_cost_snapshot_current',
+        'drink_cost_snapshot',
+        ['drink_id'],
+        unique=True,
+        postgresql_where=sa.text('effective_to IS NULL')
+    )
+
+    # Initial version of every drink (same rules as drink_cost_service.item_cost_rub),
+    # effective since the beginning of history
+    op.execute("""
+        INSERT INTO drink_cost_snapshot (drink_id, effective_from, cogs_rub, items)
+        SELECT
+            d.id,
+            TIMESTAMPTZ 'epoch',
+            COALESCE(SUM(c.item_cost), 0),
+            COALESCE(
+                jsonb_agg(
+                    jsonb_build_object('ingredient_code', c.ingredient_code, 'item_cost_rub', c.item_cost)
+                    ORDER BY c.ingredient_code
+                ) FILTER (WHERE c.ingredient_code IS NOT NULL),
+                '[]'::jsonb
+            )
+        FROM drinks d
+        LEFT JOIN (
+            SELECT
+                di.drink_id,
+                di.ingredient_code,
+                CASE
+                    WHEN i.cost_per_unit_rub IS NULL OR i.expense_kind <> 'stock_tracked' THEN NULL
+                    WHEN di.unit = i.unit THEN di.qty_per_unit * i.cost_per_unit_rub
+                    WHEN (di.unit = 'g' AND i.unit = 'kg') OR (di.unit = 'ml' AND i.unit = 'l')
+                        THEN di.qty_per_unit * i.cost_per_unit_rub / 1000
+                    ELSE di.qty_per_unit * i.cost_per_unit_rub
+                END as item_cost
+            FROM drink_items di
+            JOIN ingredients i ON i.ingredient_code = di.ingredient_code
+        ) c ON c.drink_id = d.id
+        GROUP BY d.id
+    """)
+
+
+def downgrade():
+    op.drop_index('uq_drink_cost_snapshot_current', table_name='drink_cost_snapshot')
+    op.drop_index('ix_drink_cost_snapshot_drink_effective', table_name='drink_cost_snapshot')
+    op.drop_table('drink_cost_snapshot')
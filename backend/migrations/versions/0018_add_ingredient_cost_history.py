@@ -0,0 +1,54 @@
+"""Add ingredient_cost_history — effective-dated ingredient prices
+
+Revision ID: 0018_add_ingredient_cost_history
+Revises: 0017_add_drink_cost_snapshot
+Create Date: 2026-10-17
+
+A price change used to re-stamp COGS of every historical sale of the
+affected drinks, rewriting past margins. Ingredient prices are now kept
+with effective dates; DrinkCostService computes a drink cost version as of
+the change and tx_fact joins the drink_cost_snapshot version valid at
+tx_time, so only sales after the change are re-priced.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0018_add_ingredient_cost_history'
+down_revision = '0017_add_drink_cost_snapshot'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ingredient_cost_history',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('ingredient_code', sa.Text(), nullable=False),
+        sa.Column('effective_from', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('effective_to', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('cost_per_unit_rub', sa.Numeric(10, 2), nullable=True),
+        sa.Column('unit', sa.Text(), nullable=False),
+        sa.Column('expense_kind', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['ingredient_code'], ['ingredients.ingredient_code'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_ingredient_cost_history_code_effective',
+        'ingredient_cost_history',
+        ['ingredient_code', 'effective_from']
+    )
+
+    # Current prices are the only known version, effective since the
+    # beginning of history (matches the initial drink_cost_snapshot rows)
+    op.execute("""
+        INSERT INTO ingredient_cost_history (ingredient_code, effective_from, cost_per_unit_rub, unit, expense_kind)
+        SELECT ingredient_code, TIMESTAMPTZ 'epoch', cost_per_unit_rub, unit, expense_kind
+        FROM ingredients
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_ingredient_cost_history_code_effective', table_name='ingredient_cost_history')
+    op.drop_table('ingredient_cost_history')
@@ -0,0 +1,54 @@
+"""Add alerts and alert_evaluations — persisted alert evaluation
+
+Revision ID: 0019_add_alerts
+Revises: 0018_add_ingredient_cost_history
+Create Date: 2026-10-17
+
+/analytics/alerts ran every alert query twice per request (list and
+summary). AlertService now evaluates all alert types once, stores the
+result in alerts and keeps it until the alert_evaluations row expires, so
+polling clients read a small table.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0019_add_alerts'
+down_revision = '0018_add_ingredient_cost_history'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'alerts',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('alert_key', sa.Text(), nullable=False),
+        sa.Column('alert_type', sa.Text(), nullable=False),
+        sa.Column('severity', sa.Text(), nullable=False),
+        sa.Column('location_id', sa.Integer(), nullable=True),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('evaluated_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('alert_key')
+    )
+    op.create_index('ix_alerts_type_severity', 'alerts', ['alert_type', 'severity'])
+
+    op.create_table(
+        'alert_evaluations',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('evaluated_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('alerts_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_alert_evaluations_evaluated_at', 'alert_evaluations', ['evaluated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_alert_evaluations_evaluated_at', table_name='alert_evaluations')
+    op.drop_table('alert_evaluations')
+    op.drop_index('ix_alerts_type_severity', table_name='alerts')
+    op.drop_table('alerts')
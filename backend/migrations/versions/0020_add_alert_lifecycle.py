@@ -0,0 +1,54 @@
+"""Track alert lifecycle — first_seen_at, last_seen_at, resolved_at
+
+Revision ID: 0020_add_alert_lifecycle
+Revises: 0019_add_alerts
+Create Date: 2026-10-17
+
+Alerts are no longer replaced wholesale on every evaluation: sync and
+ingredient load writes re-evaluate the affected alert types and reconcile
+the stored rows. Active alerts keep first_seen_at (clients can show what is
+new since their last visit), alerts that disappear are resolved and kept
+for history. alert_key is unique among active alerts only.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0020_add_alert_lifecycle'
+down_revision = '0019_add_alerts'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('alerts', sa.Column('first_seen_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.add_column('alerts', sa.Column('last_seen_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.add_column('alerts', sa.Column('resolved_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.execute("UPDATE alerts SET first_seen_at = evaluated_at, last_seen_at = evaluated_at")
+    op.alter_column('alerts', 'first_seen_at', nullable=False)
+    op.alter_column('alerts', 'last_seen_at', nullable=False)
+    op.drop_column('alerts', 'evaluated_at')
+
+    op.drop_constraint('alerts_alert_key_key', 'alerts', type_='unique')
+    op.create_index(
+        'uq_alerts_active_key',
+        'alerts',
+        ['alert_key'],
+        unique=True,
+        postgresql_where=sa.text('resolved_at IS NULL')
+    )
+    op.create_index('ix_alerts_first_seen_at', 'alerts', ['first_seen_at'])
+
+
+def downgrade():
+    op.drop_index('ix_alerts_first_seen_at', table_name='alerts')
+    op.drop_index('uq_alerts_active_key', table_name='alerts')
+    op.execute("DELETE FROM alerts WHERE resolved_at IS NOT NULL")
+    op.create_unique_constraint('alerts_alert_key_key', 'alerts', ['alert_key'])
+
+    op.add_column('alerts', sa.Column('evaluated_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.execute("UPDATE alerts SET evaluated_at = last_seen_at")
+    op.alter_column('alerts', 'evaluated_at', nullable=False)
+    op.drop_column('alerts', 'resolved_at')
+    op.drop_column('alerts', 'last_seen_at')
+    op.drop_column('alerts', 'first_seen_at')
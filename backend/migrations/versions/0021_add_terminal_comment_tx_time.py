@@ -0,0 +1,28 @@
+"""Add vendista_terminals.comment_tx_time — age of the stored comment
+
+Revision ID: 0021_add_terminal_comment_tx_time
+Revises: 0020_add_alert_lifecycle
+Create Date: 2026-10-17
+
+Ingest batches upsert the terminals they contain. Full syncs page
+newest-first and backfills load old periods, so a later batch can carry an
+older comment. comment_tx_time keeps the tx_time the stored comment comes
+from; a batch replaces the comment only with a newer one. Existing rows
+start with NULL (any comment from transactions replaces them once).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0021_add_terminal_comment_tx_time'
+down_revision = '0020_add_alert_lifecycle'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('vendista_terminals', sa.Column('comment_tx_time', sa.TIMESTAMP(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column('vendista_terminals', 'comment_tx_time')
@@ -0,0 +1,36 @@
+"""Add result_cache_generations — result cache generations shared by workers
+
+Revision ID: 0022_add_result_cache_generations
+Revises: 0021_add_terminal_comment_tx_time
+Create Date: 2026-10-17
+
+The memory result cache kept its scope generations per process, so with
+several API workers a commit invalidated the cache of one worker only.
+With WEB_CONCURRENCY > 1 the memory backend keeps its entries in process
+and reads the generations from this table (one primary-key lookup).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0022_add_result_cache_generations'
+down_revision = '0021_add_terminal_comment_tx_time'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'result_cache_generations',
+        sa.Column('scope', sa.Text(), nullable=False),
+        sa.Column('generation', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('scope')
+    )
+    op.execute("""
+        INSERT INTO result_cache_generations (scope)
+        VALUES ('sales'), ('expenses'), ('recipes'), ('matrix')
+    """)
+
+
+def downgrade():
+    op.drop_table('result_cache_generations')
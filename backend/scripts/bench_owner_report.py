@@ -0,0 +1,152 @@
+"""
+Benchmark the owner report: legacy cascading queries vs OwnerReportService.
+
+Runs both implementations against the configured DATABASE_URL, checks that
+they return identical numbers and prints latency percentiles.
+
+Usage:
+    python scripts/bench_owner_report.py [period_start] [period_end] [location_id] [--runs N]
+"""
+import argparse
+import sys
+import os
+import statistics
+import time
+from datetime import date
+
+# Add app path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import text
+from app.db.session import SessionLocal
+from app.services.owner_report_service import OwnerReportService, FEES_RATE
+
+
+def legacy_owner_report(db, period_start, period_end, location_id=None):
+    """Owner report as computed before OwnerReportService (view cascade)."""
+    params = {'from_date': period_start, 'to_date': period_end}
+    location_sql = " AND location_id = :location_id" if location_id else ""
+    if location_id:
+        params['location_id'] = location_id
+
+    row = db.execute(text("""
+        SELECT
+            COALESCE(SUM(sales_count), 0), COALESCE(SUM(revenue), 0),
+            COALESCE(SUM(cogs), 0), COALESCE(SUM(variable_expenses), 0),
+            COALESCE(SUM(net_profit), 0)
+        FROM vw_owner_report_daily
+        WHERE tx_date >= :from_date AND tx_date <= :to_date
+    """ + location_sql), params).fetchone()
+    transactions_count = int(row[0]) if row[0] else 0
+    revenue_gross = float(row[1]) if row[1] else 0.0
+    cogs_total = float(row[2]) if row[2] else 0.0
+    expenses_total = float(row[3]) if row[3] else 0.0
+
+    if transactions_count == 0 and revenue_gross == 0.0:
+        # Fallbacks: vw_kpi_daily, then vw_tx_cogs, each with its own expense query
+        for source, count_sql in (("vw_kpi_daily", "SUM(sales_count)"), ("vw_tx_cogs", "COUNT(*)")):
+            fallback = db.execute(text(f"""
+                SELECT COALESCE({count_sql}, 0), COALESCE(SUM(revenue), 0), COALESCE(SUM(cogs), 0)
+                FROM {source}
+                WHERE tx_date >= :from_date AND tx_date <= :to_date
+            """ + location_sql), params).fetchone()
+            if fallback and fallback[0] and fallback[0] > 0:
+                transactions_count = int(fallback[0])
+                revenue_gross = float(fallback[1] or 0)
+                cogs_total = float(fallback[2] or 0)
+                expense_sql = """
+                    SELECT COALESCE(SUM(ve.amount_rub), 0)
+                    FROM variable_expenses ve
+                    LEFT JOIN vendista_terminals vt ON vt.id = ve.vendista_term_id
+                    WHERE ve.expense_date >= :from_date AND ve.expense_date <= :to_date
+                """
+                if location_id:
+                    expense_sql += " AND COALESCE(vt.location_id, -1) = :location_id"
+                expenses_total = float(db.execute(text(expense_sql), params).scalar() or 0)
+                break
+
+    top_rows = db.execute(text("""
+        SELECT r.drink_id, d.name, SUM(r.sales_count), SUM(r.revenue), SUM(r.cogs), SUM(r.gross_profit)
+        FROM kpi_daily_rollup r
+        LEFT JOIN drinks d ON d.id = r.drink_id
+        WHERE r.tx_date >= :from_date AND r.tx_date <= :to_date
+    """ + location_sql.replace("location_id", "r.location_id", 1) + """
+        GROUP BY r.drink_id, d.name
+        ORDER BY SUM(r.revenue) DESC, r.drink_id
+        LIMIT 10
+    """), params).fetchall()
+
+    fees_total = round(revenue_gross * FEES_RATE, 2)
+    gross_profit = revenue_gross - cogs_total
+    net_profit = gross_profit - fees_total - expenses_total if transactions_count > 0 else 0.0
+    return {
+        "transactions_count": transactions_count,
+        "revenue_gross": revenue_gross,
+        "cogs_total": round(cogs_total, 2),
+        "expenses_total": expenses_total,
+        "fees_total": fees_total,
+        "net_profit": net_profit,
+        "top_products": [
+            (r[0], r[1], int(r[2]), float(r[3]), float(r[4]), float(r[5])) for r in top_rows
+        ],
+    }
+
+
+def comparable(report):
+    keys = ("transactions_count", "revenue_gross", "cogs_total", "expenses_total", "fees_total", "net_profit")
+    result = {k: report[k] for k in keys}
+    result["top_products"] = [
+        (p["drink_id"], p["drink_name"], p["sales_count"], p["revenue"], p["cogs"], p["gross_profit"])
+        if isinstance(p, dict) else p
+        for p in report["top_products"]
+    ]
+    return result
+
+
+def measure(fn, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        report = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return report, statistics.median(timings), p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("period_start", nargs="?", type=date.fromisoformat, default=date.today().replace(day=1))
+    parser.add_argument("period_end", nargs="?", type=date.fromisoformat, default=date.today())
+    parser.add_argument("location_id", nargs="?", type=int, default=None)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    period_start, period_end, location_id, runs = args.period_start, args.period_end, args.location_id, args.runs
+
+    db = SessionLocal()
+    try:
+        service = OwnerReportService(db)
+        legacy, legacy_p50, legacy_p95 = measure(
+            lambda: legacy_owner_report(db, period_start, period_end, location_id), runs
+        )
+        engine, engine_p50, engine_p95 = measure(
+            lambda: service.build(period_start, period_end, location_id), runs
+        )
+    finally:
+        db.close()
+
+    print(f"Period {period_start}..{period_end}, location={location_id}, runs={runs}")
+    print(f"  legacy cascade:     p50={legacy_p50:8.2f} ms  p95={legacy_p95:8.2f} ms")
+    print(f"  OwnerReportService: p50={engine_p50:8.2f} ms  p95={engine_p95:8.2f} ms")
+
+    if comparable(legacy) != comparable(engine):
+        print("❌ Results differ:")
+        print(f"  legacy: {comparable(legacy)}")
+        print(f"  engine: {comparable(engine)}")
+        return 1
+    print("✅ Results are identical")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
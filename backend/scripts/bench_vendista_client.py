@@ -0,0 +1,94 @@
+"""
+Benchmark Vendista API calls: new httpx client per call vs the shared client.
+
+Starts a local mock Vendista server (uvicorn) and measures per-call
+latency of VendistaAPIClient.get_transactions with a fresh AsyncClient
+per call (old behaviour) and with the shared keep-alive client.
+
+Usage:
+    python scripts/bench_vendista_client.py [--calls N] [--port PORT]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+# Add app path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from app.services.vendista_client import VendistaAPIClient
+
+mock_vendista = FastAPI()
+
+
+@mock_vendista.get("/transactions")
+def mock_transactions(limit: int = 50):
+    items = [{"id": i, "term_id": 100, "sum": 15000, "time": "2026-01-15T10:00:00"} for i in range(min(limit, 50))]
+    return {"items": items, "page_number": 1, "items_count": len(items), "items_per_page": 50, "success": True}
+
+
+def start_mock_server(port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(mock_vendista, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def summarize(name: str, timings: list) -> None:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"  {name:<24} p50={statistics.median(timings):7.2f} ms  p95={p95:7.2f} ms")
+
+
+async def bench(base_url: str, calls: int) -> None:
+    client = VendistaAPIClient()
+    client.base_url = base_url
+
+    # Old behaviour: a new AsyncClient (new connection) for every call
+    per_call = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        async with httpx.AsyncClient(verify=False, timeout=client.timeout) as http_client:
+            response = await http_client.get(f"{base_url}/transactions", params=client._get_params(limit=50))
+            response.json()
+        per_call.append((time.perf_counter() - started) * 1000)
+
+    # Shared client with keep-alive
+    await client.start()
+    shared = []
+    try:
+        for _ in range(calls):
+            started = time.perf_counter()
+            await client.get_transactions(limit=50)
+            shared.append((time.perf_counter() - started) * 1000)
+    finally:
+        await client.aclose()
+
+    print(f"{calls} sequential calls against {base_url}")
+    summarize("new client per call:", per_call)
+    summarize("shared client:", shared)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = start_mock_server(args.port)
+    try:
+        asyncio.run(bench(f"http://127.0.0.1:{args.port}", args.calls))
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
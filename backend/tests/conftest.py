@@ -7,8 +7,9 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.db.base import Base
-from app.db.session import get_db
+from app.db.session import get_db, get_analytics_db
 from app.models.user import User
+from app.services.result_cache import result_cache
 
 # Test database URL (SQLite in-memory)
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -47,6 +48,9 @@ def client(db):
             pass
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_analytics_db] = override_get_db
+    # Each test starts with a fresh database, so cached results must not leak
+    result_cache.backend.clear()
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
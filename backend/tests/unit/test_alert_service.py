@@ -0,0 +1,153 @@
+"""
+Unit tests for alert evaluation and the persisted alert set.
+"""
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from sqlalchemy import text
+from app.models.alerts import Alert, AlertEvaluation
+from app.services.alert_service import (
+    AlertService, AlertSeverity, AlertType, LOAD_ALERT_TYPES, LOW_MARGIN_ALERTS_LIMIT, refresh_alerts
+)
+
+
+def _low_stock(code, location_id, severity="warning"):
+    return {
+        "type": AlertType.LOW_STOCK.value,
+        "severity": severity,
+        "ingredient_code": code,
+        "location_id": location_id,
+        "timestamp": "2026-01-15T10:00:00",
+    }
+
+
+def _low_margin(drink_id, revenue):
+    return {
+        "type": AlertType.LOW_MARGIN.value,
+        "severity": "info",
+        "drink_id": drink_id,
+        "location_id": 1,
+        "revenue": revenue,
+        "timestamp": "2026-01-15T10:00:00",
+    }
+
+
+class TestAlertService:
+    """Test cases for one-pass alert evaluation."""
+
+    def test_persisted_alerts_are_reused_until_expired(self, db):
+        """Alerts are evaluated once per TTL; list and summary come from the same set."""
+        service = AlertService(db)
+        alerts = [_low_stock("MILK", 1, "critical"), _low_stock("CUPS", 2)]
+
+        with patch.object(AlertService, "evaluate", return_value=alerts) as mock_evaluate:
+            first = service.get_all_alerts()
+            second = service.get_all_alerts(location_id=2)
+            summary = service.summarize(first)
+
+        mock_evaluate.assert_called_once()
+        assert [a["ingredient_code"] for a in first] == ["MILK", "CUPS"]
+        assert [a["ingredient_code"] for a in second] == ["CUPS"]
+        assert summary["total"] == 2
+        assert summary["by_severity"] == {"critical": 1, "warning": 1, "info": 0}
+        assert db.query(AlertEvaluation).one().alerts_count == 2
+
+    def test_refresh_tracks_lifecycle(self, db):
+        """Alerts keep first_seen_at, get last_seen_at updates and are resolved when gone."""
+        service = AlertService(db)
+        with patch.object(AlertService, "evaluate", return_value=[_low_stock("MILK", 1)]):
+            service.refresh()
+        seen_before = datetime.now(timezone.utc)
+
+        with patch.object(AlertService, "evaluate", return_value=[_low_stock("MILK", 1, "critical"), _low_stock("CUPS", 1)]):
+            service.refresh()
+        with patch.object(AlertService, "evaluate", return_value=[_low_stock("CUPS", 1)]):
+            alerts = service.get_all_alerts(since=seen_before)
+
+        milk = db.query(Alert).filter(Alert.alert_key == "low_stock:MILK:1").one()
+        cups = db.query(Alert).filter(Alert.alert_key == "low_stock:CUPS:1").one()
+        assert milk.severity == "critical"
+        assert milk.resolved_at is None
+        assert milk.last_seen_at > milk.first_seen_at
+        assert [(a["ingredient_code"], a["is_new"]) for a in alerts] == [("MILK", False), ("CUPS", True)]
+        assert service.summarize(alerts)["new"] == 1
+
+        # Evaluation expired: MILK is gone and gets resolved, CUPS stays
+        db.query(AlertEvaluation).update({"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)})
+        db.commit()
+        with patch.object(AlertService, "evaluate", return_value=[_low_stock("CUPS", 1)]):
+            alerts = service.get_all_alerts()
+
+        db.refresh(milk)
+        assert milk.resolved_at is not None
+        assert [a["ingredient_code"] for a in alerts] == ["CUPS"]
+        assert db.query(Alert).filter(Alert.alert_key == "low_stock:CUPS:1").one().id == cups.id
+
+    def test_targeted_refresh_keeps_other_types(self, db):
+        """A write refreshes only its alert types and does not extend the full evaluation."""
+        service = AlertService(db)
+        sync_error = {"type": AlertType.SYNC_ERROR.value, "severity": "critical", "sync_run_id": 7, "location_id": None}
+        with patch.object(AlertService, "evaluate", return_value=[_low_stock("MILK", 1), sync_error]):
+            service.refresh()
+
+        with patch.object(AlertService, "evaluate", return_value=[]) as mock_evaluate:
+            refresh_alerts(db, LOAD_ALERT_TYPES)
+
+        mock_evaluate.assert_called_once_with([AlertType.LOW_STOCK])
+        active = db.query(Alert).filter(Alert.resolved_at.is_(None)).all()
+        assert [a.alert_key for a in active] == ["sync_error:7"]
+        assert db.query(AlertEvaluation).count() == 1
+
+    def test_evaluate_drains_rollup_without_committing(self, db):
+        """The rollup is rebuilt inside the refresh transaction, keeping its advisory lock."""
+        with patch("app.services.alert_service.KpiRollupService") as mock_rollup, \
+                patch.object(AlertService, "_get_low_stock_alerts", return_value=[_low_stock("MILK", 1)]), \
+                patch.object(db, "commit") as mock_commit:
+            alerts = AlertService(db).evaluate([AlertType.LOW_STOCK])
+
+        assert [a["ingredient_code"] for a in alerts] == ["MILK"]
+        mock_rollup.return_value.process_dirty_days.assert_called_once_with()
+        mock_rollup.return_value.ensure_fresh.assert_not_called()
+        mock_commit.assert_not_called()
+
+    def test_running_sync_is_not_an_error(self, db):
+        """A live run (ok = false until it finishes) does not raise a sync error alert."""
+        db.execute(text("CREATE TABLE sync_runs (id INTEGER PRIMARY KEY, started_at TIMESTAMP, ok BOOLEAN, "
+                        "status TEXT, message TEXT, completed_at TIMESTAMP, period_start DATE, period_end DATE)"))
+        started_at = datetime.now(timezone.utc) - timedelta(minutes=5)
+        db.execute(text("INSERT INTO sync_runs (id, started_at, ok, status, message) VALUES "
+                        "(1, :started_at, false, 'running', 'Sync is running'), "
+                        "(2, :started_at, false, 'error', 'Vendista API page failed')"),
+                   {"started_at": started_at})
+
+        try:
+            alerts = AlertService(db)._get_sync_error_alerts()
+        finally:
+            # sync_runs has no model: drop_all of the fixture does not remove it
+            db.rollback()
+            db.execute(text("DROP TABLE IF EXISTS sync_runs"))
+            db.commit()
+
+        assert [a["sync_run_id"] for a in alerts] == [2]
+
+    def test_failing_alert_type_does_not_drop_others(self, db):
+        """Each type runs in a savepoint; the others are still evaluated."""
+        # SQLite has no analytics views: every query except the patched one fails
+        with patch.object(AlertService, "_get_low_margin_alerts", return_value=[_low_margin(5, 100.0)]):
+            alerts = AlertService(db).evaluate()
+
+        assert [a["drink_id"] for a in alerts] == [5]
+
+    def test_filter_keeps_top_low_margin_by_revenue(self):
+        """Low margin alerts are capped by revenue, other filters apply by type and severity."""
+        service = AlertService(None)
+        alerts = [_low_margin(i, float(i)) for i in range(LOW_MARGIN_ALERTS_LIMIT + 5)]
+        alerts.append(_low_stock("MILK", 1, "critical"))
+
+        filtered = service.filter_alerts(alerts)
+        assert len(filtered) == LOW_MARGIN_ALERTS_LIMIT + 1
+        assert filtered[0]["type"] == AlertType.LOW_STOCK.value
+        assert min(a["revenue"] for a in filtered[1:]) == 5.0
+
+        critical = service.filter_alerts(alerts, severity=AlertSeverity.CRITICAL)
+        assert [a["ingredient_code"] for a in critical] == ["MILK"]
+        assert service.filter_alerts(alerts, alert_type=AlertType.SYNC_ERROR) == []
@@ -0,0 +1,31 @@
+"""
+Unit tests for engine pool and timeout configuration.
+"""
+from unittest.mock import patch
+from app.db.session import _engine_options
+
+
+class TestEngineOptions:
+    """Test cases for create_engine options."""
+
+    def test_postgresql_gets_pool_and_timeouts(self):
+        """Pool sizing and session timeouts are applied on PostgreSQL."""
+        with patch('app.db.session.settings') as mock_settings:
+            mock_settings.DATABASE_URL = "postgresql://u:p@db:5432/vending"
+            mock_settings.DB_LOCK_TIMEOUT_MS = 5000
+            mock_settings.DB_POOL_TIMEOUT_SECONDS = 30
+            options = _engine_options(pool_size=4, max_overflow=2, statement_timeout_ms=120000)
+
+        assert options["pool_size"] == 4
+        assert options["max_overflow"] == 2
+        assert options["connect_args"]["options"] == "-c statement_timeout=120000 -c lock_timeout=5000"
+
+    def test_sqlite_gets_only_generic_options(self):
+        """Queue-pool and server options are skipped for SQLite."""
+        with patch('app.db.session.settings') as mock_settings:
+            mock_settings.DATABASE_URL = "sqlite:///./test.db"
+            options = _engine_options(pool_size=4, max_overflow=2, statement_timeout_ms=1000)
+
+        assert "pool_size" not in options
+        assert "connect_args" not in options
+        assert "pool_pre_ping" in options
@@ -0,0 +1,96 @@
+"""
+Unit tests for the drink cost engine.
+"""
+from datetime import datetime, timezone
+from decimal import Decimal
+from app.models.business import Drink, DrinkItem, Ingredient, IngredientCostHistory, DrinkCostSnapshot
+from app.services.drink_cost_service import DrinkCostService, EPOCH, item_cost_rub
+
+
+class TestItemCost:
+    """Test cases for unit conversion rules."""
+
+    def test_unit_conversion(self):
+        """Recipe in g/ml against a price per kg/l is divided by 1000."""
+        assert item_cost_rub(Decimal("18"), "g", "kg", Decimal("1500")) == Decimal("27")
+        assert item_cost_rub(Decimal("150"), "ml", "l", Decimal("90")) == Decimal("13.5")
+        assert item_cost_rub(Decimal("2"), "pcs", "pcs", Decimal("3.5")) == Decimal("7")
+
+    def test_untracked_or_unpriced_ingredient_has_no_cost(self):
+        """Only stock-tracked ingredients with a price count towards COGS."""
+        assert item_cost_rub(Decimal("1"), "pcs", "pcs", None) is None
+        assert item_cost_rub(Decimal("1"), "pcs", "pcs", Decimal("5"), "not_tracked") is None
+
+
+class TestDrinkCostSnapshot:
+    """Test cases for versioned cost snapshots."""
+
+    def _setup(self, db):
+        db.add_all([
+            Ingredient(ingredient_code="COFFEE", unit="kg", cost_per_unit_rub=Decimal("1500"), expense_kind="stock_tracked"),
+            Ingredient(ingredient_code="CUP", unit="pcs", cost_per_unit_rub=Decimal("4"), expense_kind="stock_tracked"),
+            Ingredient(ingredient_code="WATER", unit="ml", cost_per_unit_rub=None, expense_kind="not_tracked"),
+        ])
+        drink = Drink(name="Эспрессо", is_active=True)
+        db.add(drink)
+        db.flush()
+        db.add_all([
+            DrinkItem(drink_id=drink.id, ingredient_code="COFFEE", qty_per_unit=Decimal("18"), unit="g"),
+            DrinkItem(drink_id=drink.id, ingredient_code="CUP", qty_per_unit=Decimal("1"), unit="pcs"),
+            DrinkItem(drink_id=drink.id, ingredient_code="WATER", qty_per_unit=Decimal("30"), unit="ml"),
+        ])
+        db.flush()
+        return drink
+
+    def test_snapshot_versions_only_on_change(self, db):
+        """A new version is recorded when the cost changes and closes the previous one."""
+        drink = self._setup(db)
+        service = DrinkCostService(db)
+        first_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        second_at = datetime(2026, 2, 1, tzinfo=timezone.utc)
+
+        assert service.snapshot([drink.id], effective_from=first_at) == 1
+        assert service.snapshot([drink.id], effective_from=second_at) == 0
+
+        cup = db.query(Ingredient).filter(Ingredient.ingredient_code == "CUP").one()
+        cup.cost_per_unit_rub = Decimal("6")
+        db.flush()
+        assert service.snapshot(service.drinks_using(["CUP"]), effective_from=second_at) == 1
+        db.commit()
+
+        versions = db.query(DrinkCostSnapshot).order_by(DrinkCostSnapshot.effective_from).all()
+        assert [Decimal(str(v.cogs_rub)) for v in versions] == [Decimal("31"), Decimal("33")]
+        assert versions[0].effective_to is not None
+        assert versions[1].effective_to is None
+        assert service.current([drink.id])[drink.id].items == [
+            {"ingredient_code": "COFFEE", "item_cost_rub": 27.0},
+            {"ingredient_code": "CUP", "item_cost_rub": 6.0},
+            {"ingredient_code": "WATER", "item_cost_rub": None},
+        ]
+
+    def test_cost_as_of_uses_price_valid_at_that_time(self, db):
+        """Past prices from ingredient_cost_history are used for an earlier point in time."""
+        drink = self._setup(db)
+        service = DrinkCostService(db)
+        changed_at = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+        assert service.record_ingredient_costs(["COFFEE", "CUP", "WATER"]) == 3
+        cup = db.query(Ingredient).filter(Ingredient.ingredient_code == "CUP").one()
+        cup.cost_per_unit_rub = Decimal("6")
+        db.flush()
+        assert service.record_ingredient_costs(["CUP"], effective_from=changed_at) == 1
+        assert service.record_ingredient_costs(["COFFEE", "CUP"], effective_from=changed_at) == 0
+
+        before = service.compute([drink.id], as_of=datetime(2026, 2, 1, tzinfo=timezone.utc))
+        after = service.compute([drink.id], as_of=changed_at)
+        assert before[drink.id][0] == Decimal("31")
+        assert after[drink.id][0] == Decimal("33")
+
+        history = (
+            db.query(IngredientCostHistory)
+            .filter(IngredientCostHistory.ingredient_code == "CUP")
+            .order_by(IngredientCostHistory.effective_from)
+            .all()
+        )
+        assert [h.effective_from.replace(tzinfo=timezone.utc) for h in history] == [EPOCH, changed_at]
+        assert history[0].effective_to is not None
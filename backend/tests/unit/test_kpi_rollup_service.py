@@ -0,0 +1,51 @@
+"""
+Unit tests for the daily KPI rollup service.
+"""
+from datetime import date
+from unittest.mock import MagicMock
+from sqlalchemy.orm import Session
+from app.services.kpi_rollup_service import KpiRollupService
+
+
+def _make_db(dirty_days):
+    db = MagicMock(spec=Session)
+    db.get_bind.return_value.dialect.name = "postgresql"
+    db.execute.return_value.scalars.return_value.all.return_value = dirty_days
+    return db
+
+
+class TestKpiRollupService:
+    """Test cases for dirty-day rollup rebuilds."""
+
+    def test_rebuilds_only_queued_days(self):
+        """Rollup and ingredient ledger rows are replaced for the dequeued days only."""
+        days = [date(2026, 1, 14), date(2026, 1, 15)]
+        db = _make_db(days)
+
+        rebuilt = KpiRollupService(db).process_dirty_days()
+
+        assert rebuilt == days
+        statements = [str(c[0][0]) for c in db.execute.call_args_list]
+        assert "FOR UPDATE SKIP LOCKED" in statements[0]
+        assert "DELETE FROM kpi_daily_rollup" in statements[1]
+        assert "INSERT INTO kpi_daily_rollup" in statements[2]
+        assert db.execute.call_args_list[2][0][1] == {"days": days}
+        assert "DELETE FROM ingredient_usage_daily" in statements[3]
+        assert "INSERT INTO ingredient_usage_daily" in statements[4]
+        assert db.execute.call_args_list[4][0][1] == {"days": days}
+        db.commit.assert_not_called()
+
+    def test_ensure_fresh_is_noop_for_empty_queue(self):
+        """Readers pay a single cheap statement when nothing changed."""
+        db = _make_db([])
+
+        assert KpiRollupService(db).ensure_fresh() == 0
+        assert db.execute.call_count == 1
+        db.commit.assert_not_called()
+
+    def test_ensure_fresh_commits_rebuilt_days(self):
+        """Rebuilt days are committed before the caller reads the rollup."""
+        db = _make_db([date(2026, 1, 15)])
+
+        assert KpiRollupService(db).ensure_fresh() == 1
+        db.commit.assert_called_once()
@@ -0,0 +1,44 @@
+"""
+Unit tests for the owner report engine.
+"""
+from datetime import date
+from decimal import Decimal
+from unittest.mock import MagicMock
+from app.services.owner_report_service import OwnerReportService
+
+
+class TestOwnerReportService:
+    """Test cases for single-query owner report."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.db = MagicMock()
+        self.service = OwnerReportService(self.db)
+
+    def test_metrics_from_single_query(self):
+        """Totals, fees, margins and top products come from one row."""
+        top = [{"drink_id": 3, "drink_name": "Латте", "sales_count": 10,
+                "revenue": 1500.0, "cogs": 400.5, "gross_profit": 1099.5}]
+        self.db.execute.return_value.fetchone.return_value = (
+            10, Decimal("1500.00"), Decimal("400.50"), Decimal("100"), top
+        )
+
+        report = self.service.build(date(2026, 1, 1), date(2026, 1, 31), location_id=2)
+
+        assert self.db.execute.call_count == 1
+        assert self.db.execute.call_args[0][1]["location_id"] == 2
+        assert report["fees_total"] == 134.25
+        assert report["net_profit"] == 1500.0 - 400.5 - 134.25 - 100.0
+        assert report["avg_check"] == 150.0
+        assert report["top_products"][0]["drink_name"] == "Латте"
+
+    def test_empty_period(self):
+        """No sales produce a zero report."""
+        self.db.execute.return_value.fetchone.return_value = (0, Decimal("0"), Decimal("0"), Decimal("0"), None)
+
+        report = self.service.build(date(2026, 1, 1), date(2026, 1, 31))
+
+        assert report["transactions_count"] == 0
+        assert report["net_profit"] == 0.0
+        assert report["top_products"] == []
+        assert "location_id" not in self.db.execute.call_args[0][1]
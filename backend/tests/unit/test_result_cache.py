@@ -0,0 +1,118 @@
+"""
+Unit tests for the analytics result cache.
+"""
+from datetime import date
+from unittest.mock import MagicMock
+from sqlalchemy import text
+from app.config import settings
+from app.services.result_cache import (
+    ResultCache, MemoryCacheBackend, SharedGenerationsMemoryBackend, invalidate_on_commit, _create_result_cache,
+    SALES, EXPENSES
+)
+
+
+class TestResultCache:
+    """Test cases for generation-keyed caching."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.cache = ResultCache(backend=MemoryCacheBackend(max_entries=2), ttl_seconds=60)
+        self.compute = MagicMock(side_effect=lambda: {"revenue": 100})
+
+    def test_same_params_are_computed_once(self):
+        """Parameter order and None values do not change the key."""
+        self.cache.get_or_compute("overview", {"from_date": date(2026, 1, 1), "location_id": None}, self.compute)
+        result = self.cache.get_or_compute("overview", {"location_id": None, "from_date": date(2026, 1, 1)}, self.compute)
+
+        assert result == {"revenue": 100}
+        assert self.compute.call_count == 1
+
+    def test_bump_invalidates_dependent_endpoints_only(self):
+        """A scope bump recomputes endpoints reading that scope."""
+        self.cache.get_or_compute("owner-report", {}, self.compute, scopes=(SALES, EXPENSES))
+        self.cache.get_or_compute("sales/summary", {}, self.compute, scopes=(SALES,))
+
+        self.cache.bump(EXPENSES)
+        self.cache.get_or_compute("owner-report", {}, self.compute, scopes=(SALES, EXPENSES))
+        self.cache.get_or_compute("sales/summary", {}, self.compute, scopes=(SALES,))
+
+        assert self.compute.call_count == 3
+
+    def test_lru_evicts_oldest_entry(self):
+        """The memory backend keeps at most max_entries results."""
+        for location_id in (1, 2, 3):
+            self.cache.get_or_compute("overview", {"location_id": location_id}, self.compute)
+        self.cache.get_or_compute("overview", {"location_id": 1}, self.compute)
+
+        assert self.compute.call_count == 4
+
+    def test_backend_failure_falls_back_to_compute(self):
+        """A broken backend never breaks the endpoint."""
+        backend = MagicMock()
+        backend.generations.side_effect = ConnectionError("redis down")
+        cache = ResultCache(backend=backend)
+
+        assert cache.get_or_compute("overview", {}, self.compute) == {"revenue": 100}
+
+    def test_several_workers_share_generations(self, monkeypatch):
+        """With several workers the memory backend reads generations from PostgreSQL."""
+        monkeypatch.setattr(settings, "RESULT_CACHE_BACKEND", "memory")
+        monkeypatch.setattr(settings, "WEB_CONCURRENCY", 4)
+        monkeypatch.setattr("app.services.result_cache.engine", MagicMock(**{"dialect.name": "postgresql"}))
+        cache = _create_result_cache()
+        assert cache.enabled is True
+        assert isinstance(cache.backend, SharedGenerationsMemoryBackend)
+
+        # Without PostgreSQL per-process generations would serve stale results
+        monkeypatch.setattr("app.services.result_cache.engine", MagicMock(**{"dialect.name": "sqlite"}))
+        assert _create_result_cache().enabled is False
+
+        monkeypatch.setattr(settings, "WEB_CONCURRENCY", 1)
+        cache = _create_result_cache()
+        assert cache.enabled is True
+        assert type(cache.backend) is MemoryCacheBackend
+
+
+class TestSharedGenerations:
+    """Test cases for generations shared between worker processes."""
+
+    def test_bump_in_one_worker_invalidates_the_others(self, db):
+        """Each worker keeps its own entries, but a bump is seen by all of them."""
+        worker_a = ResultCache(backend=SharedGenerationsMemoryBackend(db.get_bind()))
+        worker_b = ResultCache(backend=SharedGenerationsMemoryBackend(db.get_bind()))
+        compute = MagicMock(side_effect=[{"revenue": 100}, {"revenue": 150}])
+
+        assert worker_b.get_or_compute("overview", {}, compute, scopes=(SALES,)) == {"revenue": 100}
+        assert worker_b.get_or_compute("overview", {}, compute, scopes=(SALES,)) == {"revenue": 100}
+        worker_a.bump(SALES, EXPENSES)
+        worker_a.bump(SALES)
+
+        assert worker_b.get_or_compute("overview", {}, compute, scopes=(SALES,)) == {"revenue": 150}
+        assert worker_b.backend.generations([SALES, EXPENSES]) == [2, 1]
+        assert compute.call_count == 2
+
+class TestInvalidateOnCommit:
+    """Test cases for commit-driven generation bumps."""
+
+    def test_scopes_are_bumped_after_commit(self, db, monkeypatch):
+        """Scopes marked in a transaction are bumped once it commits."""
+        cache = ResultCache(backend=MemoryCacheBackend())
+        monkeypatch.setattr("app.services.result_cache.result_cache", cache)
+
+        invalidate_on_commit(db, EXPENSES)
+        assert cache.backend.generations([EXPENSES]) == [0]
+        db.commit()
+
+        assert cache.backend.generations([EXPENSES]) == [1]
+
+    def test_rollback_discards_scopes(self, db, monkeypatch):
+        """Rolled back writes do not invalidate anything."""
+        cache = ResultCache(backend=MemoryCacheBackend())
+        monkeypatch.setattr("app.services.result_cache.result_cache", cache)
+
+        db.execute(text("SELECT 1"))
+        invalidate_on_commit(db, SALES)
+        db.rollback()
+        db.commit()
+
+        assert cache.backend.generations([SALES]) == [0]
@@ -0,0 +1,72 @@
+"""
+Unit tests for request coalescing.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+import pytest
+from app.services.single_flight import SingleFlight, single_flight_method
+
+
+class TestSingleFlight:
+    """Test cases for single-flight calls."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.group = SingleFlight()
+        self.release = threading.Event()
+
+    def _run_concurrently(self, fn, callers=5):
+        with ThreadPoolExecutor(max_workers=callers) as pool:
+            futures = [pool.submit(self.group.do, "overview", fn) for _ in range(callers)]
+            # Wait until every follower has joined the in-flight call
+            while self.group._calls.get("overview") is None or self.group._calls["overview"].waiters < callers - 1:
+                time.sleep(0.001)
+            self.release.set()
+            return futures
+
+    def test_concurrent_calls_share_one_computation(self):
+        """Followers receive the leader's result."""
+        compute = MagicMock(side_effect=lambda: self.release.wait() and {"revenue": 100})
+
+        futures = self._run_concurrently(compute)
+
+        assert [f.result() for f in futures] == [{"revenue": 100}] * 5
+        assert compute.call_count == 1
+        assert self.group._calls == {}
+
+    def test_leader_error_is_shared(self):
+        """A failed computation fails every waiting caller."""
+        def compute():
+            self.release.wait()
+            raise RuntimeError("db down")
+
+        futures = self._run_concurrently(compute, callers=3)
+
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
+
+    def test_sequential_calls_recompute(self):
+        """Only in-flight calls are shared, results are not cached."""
+        compute = MagicMock(return_value=1)
+
+        self.group.do("overview", compute)
+        self.group.do("overview", compute)
+
+        assert compute.call_count == 2
+
+    def test_method_key_ignores_instance(self):
+        """Calls through different instances with equal args are coalesced."""
+        group = SingleFlight()
+
+        class Calculator:
+            def __init__(self, db):
+                self.db = db
+
+            @single_flight_method(group)
+            def summary(self, from_date, location_id=None):
+                return (self.db, from_date, location_id)
+
+        assert Calculator("db1").summary("2026-01-01", location_id=2) == ("db1", "2026-01-01", 2)
@@ -0,0 +1,182 @@
+"""
+Unit tests for the background sync job runner.
+"""
+import asyncio
+from datetime import datetime
+from unittest.mock import MagicMock, AsyncMock, patch
+import pytest
+from app.schemas.vendista import SyncResult
+from app.services.sync_jobs import SyncJob, SyncJobRunner, SyncAlreadyRunningError, SYNC_ALERT_TYPES
+
+
+def _make_session(run_id=7, dialect="sqlite"):
+    db = MagicMock()
+    db.get_bind.return_value.dialect.name = dialect
+    db.execute.return_value.scalar_one.return_value = run_id
+    return db
+
+
+class TestSyncJobRunner:
+    """Test cases for single-flight background syncs."""
+
+    def test_submit_returns_run_id_and_records_result(self):
+        """Job is accepted immediately and the run row is finalized."""
+        db = _make_session()
+        runner = SyncJobRunner(session_factory=lambda: db)
+        result = SyncResult(success=True, fetched=3, inserted=3, transactions_synced=3)
+
+        async def scenario():
+            run_id = await runner.submit(SyncJob(mode="full"))
+            assert runner.is_running is True
+            await asyncio.gather(*runner._tasks)
+            return run_id
+
+        with patch('app.services.sync_jobs.sync_service') as mock_service, \
+                patch('app.services.sync_jobs.refresh_alerts') as mock_refresh_alerts:
+            mock_service.sync_all_from_vendista = AsyncMock(return_value=result)
+            run_id = asyncio.run(scenario())
+
+        assert run_id == 7
+        mock_refresh_alerts.assert_called_once_with(db, SYNC_ALERT_TYPES)
+        assert runner.is_running is False
+        update_params = db.execute.call_args_list[-1][0][1]
+        assert update_params["status"] == "success"
+        assert update_params["inserted"] == 3
+        db.close.assert_called_once()
+
+    def test_second_submit_is_rejected_while_running(self):
+        """Only one sync may run at a time."""
+        runner = SyncJobRunner(session_factory=_make_session)
+        release = None
+
+        async def slow_sync(**kwargs):
+            await release.wait()
+            return SyncResult(success=True, transactions_synced=0)
+
+        async def scenario():
+            nonlocal release
+            release = asyncio.Event()
+            await runner.submit(SyncJob(mode="incremental"))
+            with pytest.raises(SyncAlreadyRunningError) as exc_info:
+                await runner.submit(SyncJob(mode="full"))
+            release.set()
+            await asyncio.gather(*runner._tasks)
+            return exc_info.value
+
+        with patch('app.services.sync_jobs.sync_service') as mock_service:
+            mock_service.sync_incremental = slow_sync
+            error = asyncio.run(scenario())
+
+        assert error.run_id == 7
+        assert runner.is_running is False
+
+    def test_advisory_lock_held_elsewhere_rejects_job(self):
+        """Another worker holding the PostgreSQL lock blocks the job."""
+        db = _make_session(dialect="postgresql")
+        lock_conn = db.get_bind.return_value.connect.return_value
+        lock_conn.execute.return_value.scalar.return_value = False
+        runner = SyncJobRunner(session_factory=lambda: db)
+
+        with pytest.raises(SyncAlreadyRunningError):
+            asyncio.run(runner.submit(SyncJob()))
+
+        assert runner.is_running is False
+        lock_conn.close.assert_called_once()
+        db.close.assert_called_once()
+
+    def test_advisory_lock_is_held_on_dedicated_connection(self):
+        """The lock and unlock run on one connection kept for the whole job, not on the job's session."""
+        db = _make_session(dialect="postgresql")
+        lock_conn = db.get_bind.return_value.connect.return_value
+        lock_conn.execute.return_value.scalar.return_value = True
+        runner = SyncJobRunner(session_factory=lambda: db)
+
+        async def scenario():
+            await runner.submit(SyncJob(mode="incremental"))
+            assert runner._lock_conn is lock_conn
+            await asyncio.gather(*runner._tasks)
+
+        with patch('app.services.sync_jobs.sync_service') as mock_service, \
+                patch('app.services.sync_jobs.refresh_alerts'):
+            mock_service.sync_incremental = AsyncMock(return_value=SyncResult(success=True, transactions_synced=0))
+            asyncio.run(scenario())
+
+        lock_sql = [str(c[0][0]) for c in lock_conn.execute.call_args_list]
+        assert "pg_try_advisory_lock" in lock_sql[0]
+        assert "pg_advisory_unlock" in lock_sql[1]
+        assert not any("advisory" in str(c[0][0]) for c in db.execute.call_args_list)
+        lock_conn.close.assert_called_once()
+        assert runner._lock_conn is None
+
+    def test_interrupted_runs_are_marked_failed(self):
+        """Runs left 'running' by a stopped process are failed on startup."""
+        db = _make_session()
+        db.execute.return_value.rowcount = 2
+        runner = SyncJobRunner(session_factory=lambda: db)
+
+        assert runner.fail_interrupted_runs() == 2
+        assert "WHERE status = 'running'" in str(db.execute.call_args[0][0])
+        db.commit.assert_called_once()
+        db.close.assert_called_once()
+
+    def test_interrupted_runs_are_kept_while_lock_is_held(self):
+        """A running row of a live job in another worker is left alone."""
+        db = _make_session(dialect="postgresql")
+        db.get_bind.return_value.connect.return_value.execute.return_value.scalar.return_value = False
+        runner = SyncJobRunner(session_factory=lambda: db)
+
+        assert runner.fail_interrupted_runs() == 0
+        db.execute.assert_not_called()
+        db.close.assert_called_once()
+
+    def test_scheduled_job_is_skipped_when_another_worker_started_it(self):
+        """A schedule slot already taken by any worker does not start a second run."""
+        db = _make_session()
+        db.execute.return_value.scalar.return_value = datetime(2026, 1, 15, 10, 3)
+        runner = SyncJobRunner(session_factory=lambda: db)
+        job = SyncJob(mode="incremental", trigger="schedule")
+
+        started = asyncio.run(runner._submit_scheduled(job, not_before=datetime(2026, 1, 15, 10, 0)))
+
+        assert started is False
+        assert "MAX(started_at)" in str(db.execute.call_args[0][0])
+        assert runner.is_running is False
+        db.close.assert_called_once()
+
+    def test_scheduled_job_starts_when_due(self):
+        """The latest scheduled run is older than the slot: the job starts."""
+        db = _make_session()
+        db.execute.return_value.scalar.return_value = datetime(2026, 1, 15, 9, 55)
+        runner = SyncJobRunner(session_factory=lambda: db)
+        job = SyncJob(mode="incremental", trigger="schedule")
+
+        async def scenario():
+            started = await runner._submit_scheduled(job, not_before=datetime(2026, 1, 15, 10, 0))
+            await asyncio.gather(*runner._tasks)
+            return started
+
+        with patch('app.services.sync_jobs.sync_service') as mock_service, \
+                patch('app.services.sync_jobs.refresh_alerts'):
+            mock_service.sync_incremental = AsyncMock(return_value=SyncResult(success=True, transactions_synced=0))
+            assert asyncio.run(scenario()) is True
+
+        mock_service.sync_incremental.assert_awaited_once()
+
+    def test_last_reconcile_time(self):
+        """The reconcile slot is today's hour once passed, otherwise yesterday's."""
+        with patch('app.services.sync_jobs.settings.SYNC_RECONCILE_HOUR_UTC', 3):
+            assert SyncJobRunner._last_reconcile_time(datetime(2026, 1, 15, 10)) == datetime(2026, 1, 15, 3)
+            assert SyncJobRunner._last_reconcile_time(datetime(2026, 1, 15, 2)) == datetime(2026, 1, 14, 3)
+
+
+class TestRerunStartPage:
+    """Test cases for choosing where a rerun starts."""
+
+    def test_only_failed_full_runs_are_resumed(self):
+        """A failed full run continues after its last page, anything else starts over."""
+        from app.api.v1.sync import _rerun_start_page
+
+        assert _rerun_start_page(mode="full", ok=False, last_page=4) == 5
+        assert _rerun_start_page(mode="incremental", ok=False, last_page=4) == 1
+        assert _rerun_start_page(mode="full", ok=True, last_page=4) == 1
+        assert _rerun_start_page(mode="full", ok=False, last_page=None) == 1
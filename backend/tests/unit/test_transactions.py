@@ -0,0 +1,120 @@
+"""
+Unit tests for transactions list pagination helpers.
+"""
+import asyncio
+import threading
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, AsyncMock
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.api.v1 import transactions
+from app.api.v1.transactions import _encode_cursor, _decode_cursor, _cached_total, _stream_csv, _stream_copy
+
+
+class TestCursor:
+    """Test cases for keyset continuation tokens."""
+
+    def test_round_trip(self):
+        """A token decodes to the (tx_time, id) it was built from."""
+        tx_time = datetime(2026, 1, 15, 10, 0, 0, 123000, tzinfo=timezone.utc)
+
+        token = _encode_cursor(tx_time, 42, order_desc=True)
+
+        assert "=" not in token
+        assert _decode_cursor(token, order_desc=True) == (tx_time, 42)
+
+    def test_malformed_token_is_rejected(self):
+        """Garbage tokens are a client error, not a server error."""
+        with pytest.raises(HTTPException) as exc_info:
+            _decode_cursor("not-a-cursor", order_desc=True)
+
+        assert exc_info.value.status_code == 400
+
+    def test_token_is_bound_to_sort_order(self):
+        """A DESC token cannot continue an ASC listing."""
+        token = _encode_cursor(datetime(2026, 1, 15), 1, order_desc=True)
+
+        with pytest.raises(HTTPException):
+            _decode_cursor(token, order_desc=False)
+
+
+class TestCachedTotal:
+    """Test cases for the cursor-mode total cache."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        transactions._TOTAL_CACHE.clear()
+        self.db = MagicMock()
+        self.db.execute = AsyncMock(return_value=MagicMock(**{"scalar_one.return_value": 1200}))
+
+    def test_count_runs_once_per_filter_set(self):
+        """Repeated pages with the same filters reuse the count."""
+        first = asyncio.run(_cached_total(self.db, "COUNT", {}, ("2026-01-01", "2026-01-31", None, "positive")))
+        second = asyncio.run(_cached_total(self.db, "COUNT", {}, ("2026-01-01", "2026-01-31", None, "positive")))
+        asyncio.run(_cached_total(self.db, "COUNT", {}, ("2026-01-01", "2026-01-31", 100, "positive")))
+
+        assert first == second == 1200
+        assert self.db.execute.call_count == 2
+
+
+class TestStreamCsv:
+    """Test cases for the chunked CSV export."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        engine = create_engine("sqlite://")
+        self.session_factory = sessionmaker(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (id INTEGER, name TEXT)"))
+            conn.execute(
+                text("INSERT INTO t (id, name) VALUES (:id, :name)"),
+                [{"id": i, "name": f"row{i}"} for i in range(5)]
+            )
+
+    def _export(self, where="1 = 1"):
+        return list(_stream_csv(
+            text(f"SELECT id, name FROM t WHERE {where} ORDER BY id"), {}, ["id", "name"],
+            lambda row: {"id": row[0], "name": row[1]}, "test",
+            session_factory=self.session_factory,
+        ))
+
+    def test_rows_are_emitted_in_chunks(self, monkeypatch):
+        """Each server-side cursor partition becomes one chunk."""
+        monkeypatch.setattr(transactions, "EXPORT_CHUNK_ROWS", 2)
+
+        chunks = self._export()
+
+        assert len(chunks) == 3
+        assert chunks[0].decode().splitlines() == ["id,name", "0,row0", "1,row1"]
+        assert b"".join(chunks).decode().count("\n") == 6
+
+    def test_empty_export_has_header(self):
+        """No rows still produce a valid CSV file."""
+        assert self._export(where="id < 0") == [b"id,name\r\n"]
+
+
+class TestStreamCopy:
+    """Test cases for the COPY-based raw export."""
+
+    def test_disconnect_with_full_queue_ends_worker(self):
+        """Closing the generator while the queue is full does not leak the COPY thread."""
+        def copy_expert(sql, writer):
+            for i in range(100):
+                writer.write(f"{i},row{i}\n")
+
+        db = MagicMock()
+        db.get_bind.return_value.dialect = create_engine("sqlite://").dialect
+        cursor = db.connection.return_value.connection.cursor.return_value.__enter__.return_value
+        cursor.mogrify.return_value = b"SELECT 1"
+        cursor.copy_expert.side_effect = copy_expert
+
+        stream = _stream_copy(text("SELECT 1"), {}, "test", session_factory=lambda: db)
+        assert next(stream) == b"0,row0\n"
+        worker = next(t for t in threading.enumerate() if t.name == "csv-copy-export")
+        stream.close()
+
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+        db.close.assert_called_once()
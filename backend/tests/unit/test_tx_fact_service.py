@@ -0,0 +1,73 @@
+"""
+Unit tests for tx_fact maintenance service.
+"""
+from unittest.mock import MagicMock, patch
+from sqlalchemy.orm import Session
+from app.services.tx_fact_service import TxFactService
+
+
+def _make_db(dialect="postgresql"):
+    db = MagicMock(spec=Session)
+    db.get_bind.return_value.dialect.name = dialect
+    db.execute.return_value.scalar.return_value = 3
+    return db
+
+
+class TestTxFactService:
+    """Test cases for incremental tx_fact refresh."""
+
+    def test_refresh_transactions_upserts_by_raw_id(self):
+        """Ingested rows are derived in one statement, in the caller's transaction."""
+        db = _make_db()
+
+        affected = TxFactService(db).refresh_transactions([5, 3, 5, None])
+
+        assert affected == 3
+        sql, params = str(db.execute.call_args[0][0]), db.execute.call_args[0][1]
+        assert "INSERT INTO tx_fact" in sql
+        assert "INSERT INTO kpi_dirty_days" in sql
+        assert "t.id = ANY(:tx_ids)" in sql
+        assert params == {"tx_ids": [3, 5]}
+        db.commit.assert_not_called()
+
+    def test_ingredient_change_updates_costs_of_using_drinks(self):
+        """Price changes only touch COGS of later sales of drinks using the ingredient."""
+        db = _make_db()
+
+        with patch("app.services.tx_fact_service.DrinkCostService") as mock_costs:
+            mock_costs.return_value.drinks_using.return_value = [7, 9]
+            TxFactService(db).refresh_ingredient_costs(["MILK"])
+
+        costs = mock_costs.return_value
+        costs.drinks_using.assert_called_once_with(["MILK"])
+        effective_from = costs.record_ingredient_costs.call_args.kwargs["effective_from"]
+        costs.record_ingredient_costs.assert_called_once_with(["MILK"], effective_from=effective_from)
+        costs.snapshot.assert_called_once_with([7, 9], effective_from=effective_from)
+
+        sql, params = str(db.execute.call_args[0][0]), db.execute.call_args[0][1]
+        assert "UPDATE tx_fact" in sql
+        assert "f.tx_time >= :effective_from" in sql
+        assert params == {"drink_ids": [7, 9], "effective_from": effective_from}
+
+    def test_recipe_change_queues_all_days_of_the_drink(self):
+        """Ingredient usage depends on the recipe, so every sales day is rebuilt."""
+        db = _make_db()
+
+        TxFactService(db).refresh_drink_recipes([7])
+
+        statements = [str(c[0][0]) for c in db.execute.call_args_list]
+        assert "UPDATE tx_fact" in statements[0]
+        assert "INSERT INTO kpi_dirty_days" in statements[1]
+        assert "FROM tx_fact WHERE drink_id = ANY(:drink_ids)" in statements[1]
+        assert db.execute.call_args_list[1][0][1] == {"drink_ids": [7]}
+
+    def test_skips_non_postgres_and_empty_input(self):
+        """Nothing is executed for other dialects or empty id lists."""
+        sqlite_db = _make_db(dialect="sqlite")
+        assert TxFactService(sqlite_db).refresh_terminals([1]) == 0
+        assert TxFactService(sqlite_db).refresh_drink_costs([1]) == 0
+        sqlite_db.execute.assert_not_called()
+
+        pg_db = _make_db()
+        assert TxFactService(pg_db).refresh_transactions([]) == 0
+        pg_db.execute.assert_not_called()
@@ -0,0 +1,253 @@
+"""
+Unit tests for Vendista API client.
+"""
+import asyncio
+import random
+import time
+import httpx
+import pytest
+from unittest.mock import patch
+from app.config import settings
+from app.services.vendista_client import VendistaAPIClient, TokenBucket
+
+
+def _page_data(page_number, items_count=10, items_per_page=2):
+    return {
+        "items": [{"id": page_number * 100 + i} for i in range(items_per_page)],
+        "page_number": page_number,
+        "items_count": items_count,
+        "items_per_page": items_per_page,
+    }
+
+
+async def _collect(client, **kwargs):
+    return [page async for page in client.iter_transaction_pages("2026-01-01 00:00:00", "2026-01-31 23:59:59", **kwargs)]
+
+
+class TestIterTransactionPages:
+    """Test cases for concurrent pagination."""
+
+    def test_pages_are_yielded_in_order(self):
+        """Pages fetched concurrently are merged back in page order."""
+        client = VendistaAPIClient()
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_fetch(http_client, params, page_number):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(random.uniform(0, 0.01))
+            in_flight -= 1
+            return _page_data(page_number)
+
+        with patch.object(client, "_fetch_transactions_page", side_effect=fake_fetch):
+            pages = asyncio.run(_collect(client, max_concurrency=3))
+
+        assert [p["page_number"] for p in pages] == [1, 2, 3, 4, 5]
+        assert max_in_flight <= 3
+
+    def test_stops_on_empty_page(self):
+        """An empty page ends pagination even if items_count promised more."""
+        client = VendistaAPIClient()
+
+        async def fake_fetch(http_client, params, page_number):
+            if page_number >= 3:
+                return {"items": [], "page_number": page_number, "items_count": 10, "items_per_page": 2}
+            return _page_data(page_number)
+
+        with patch.object(client, "_fetch_transactions_page", side_effect=fake_fetch):
+            pages = asyncio.run(_collect(client, max_concurrency=4))
+
+        assert [p["page_number"] for p in pages] == [1, 2]
+
+    def test_fetch_page_retries_transient_errors(self):
+        """A page that fails once is retried and succeeds."""
+        client = VendistaAPIClient()
+        calls = {"count": 0}
+
+        def handler(request):
+            calls["count"] += 1
+            if calls["count"] == 1:
+                return httpx.Response(502)
+            return httpx.Response(200, json=_page_data(int(request.url.params["PageNumber"])))
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+                return await client._fetch_transactions_page(http_client, {}, 2)
+
+        with patch("app.services.vendista_client.settings.vendista_page_retry_delay_seconds", 0):
+            data = asyncio.run(run())
+
+        assert data["page_number"] == 2
+        assert calls["count"] == 2
+
+    def test_fetch_page_raises_after_retries(self):
+        """A page that keeps failing raises after the configured retries."""
+        client = VendistaAPIClient()
+
+        async def run():
+            transport = httpx.MockTransport(lambda request: httpx.Response(500))
+            async with httpx.AsyncClient(transport=transport) as http_client:
+                return await client._fetch_transactions_page(http_client, {}, 1)
+
+        with patch("app.services.vendista_client.settings.vendista_page_retry_delay_seconds", 0):
+            with pytest.raises(httpx.HTTPStatusError):
+                asyncio.run(run())
+
+    def test_retry_after_is_honoured(self):
+        """429 waits for the server-provided Retry-After before retrying."""
+        client = VendistaAPIClient()
+        responses = [httpx.Response(429, headers={"Retry-After": "7"}), httpx.Response(200, json=_page_data(1))]
+        delays = []
+
+        async def fake_sleep(seconds):
+            delays.append(seconds)
+
+        async def run():
+            transport = httpx.MockTransport(lambda request: responses.pop(0))
+            async with httpx.AsyncClient(transport=transport) as http_client:
+                return await client._fetch_transactions_page(http_client, {}, 1)
+
+        with patch("app.services.vendista_client.asyncio.sleep", side_effect=fake_sleep):
+            data = asyncio.run(run())
+
+        assert data["page_number"] == 1
+        assert delays == [7.0]
+
+    def test_client_errors_are_not_retried(self):
+        """4xx other than 408/429 fail on the first attempt."""
+        client = VendistaAPIClient()
+        calls = {"count": 0}
+
+        def handler(request):
+            calls["count"] += 1
+            return httpx.Response(404)
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+                return await client._fetch_transactions_page(http_client, {}, 1)
+
+        with pytest.raises(httpx.HTTPStatusError):
+            asyncio.run(run())
+        assert calls["count"] == 1
+
+
+class TestTokenBucket:
+    """Test cases for the client-side rate limiter."""
+
+    def test_burst_then_throttle(self):
+        """Up to burst requests pass at once, the next one waits for a token."""
+        bucket = TokenBucket(rate=20, burst=2)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            for _ in range(3):
+                await bucket.acquire()
+            return loop.time() - started
+
+        elapsed = asyncio.run(run())
+
+        assert 0.03 <= elapsed < 0.5
+
+
+class TestSharedClient:
+    """Test cases for the lifecycle-managed httpx client."""
+
+    def test_calls_reuse_one_client(self):
+        """Requests share the pooled client until it is closed."""
+        client = VendistaAPIClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})))
+
+        async def run():
+            await client.start()
+            shared = client._client
+            assert await client.test_connection() is True
+            await client.get_transactions(limit=1)
+            assert client._client is shared
+            await client.aclose()
+            return shared
+
+        shared = asyncio.run(run())
+
+        assert shared.is_closed
+        assert client._client is None
+
+    def test_new_event_loop_gets_new_client(self):
+        """A client bound to a finished loop is not reused."""
+        client = VendistaAPIClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})))
+
+        async def current():
+            return client._get_client()
+
+        first = asyncio.run(current())
+        second = asyncio.run(current())
+
+        assert first is not second
+
+
+class TestTerminalsEndpointDiscovery:
+    """Test cases for get_terminals endpoint discovery and caching."""
+
+    @staticmethod
+    def _client(calls, working="/machines"):
+        def handler(request):
+            calls.append(request.url.path)
+            if request.url.path == working:
+                return httpx.Response(200, json={"items": [{"id": 1}]})
+            return httpx.Response(404)
+
+        client = VendistaAPIClient(transport=httpx.MockTransport(handler))
+        client.base_url = "http://vendista.test"
+        return client
+
+    def test_discovered_endpoint_is_cached(self):
+        """Discovery probes every candidate once, later calls hit only the cached endpoint."""
+        calls = []
+        client = self._client(calls)
+
+        async def run():
+            return await client.get_terminals(), await client.get_terminals()
+
+        first, second = asyncio.run(run())
+
+        assert first["endpoint"] == "/machines" and second["endpoint"] == "/machines"
+        assert len(calls) == 6
+        assert calls[-1] == "/machines"
+
+    def test_broken_cached_endpoint_triggers_rediscovery(self):
+        """A cached endpoint that stops working is rediscovered."""
+        calls = []
+        client = self._client(calls, working="/devices")
+        client._terminals_endpoint = "/terminals"
+        client._terminals_endpoint_expires = float("inf")
+
+        result = asyncio.run(client.get_terminals())
+
+        assert result["endpoint"] == "/devices"
+        assert client._terminals_endpoint == "/devices"
+
+    def test_failed_discovery_is_cached_briefly(self):
+        """A failed discovery is retried after the short negative TTL, not the endpoint TTL."""
+        calls = []
+        client = self._client(calls, working="/nowhere")
+
+        started = time.monotonic()
+        result = asyncio.run(client.get_terminals())
+
+        assert result["success"] is False
+        assert client._terminals_endpoint is None
+        ttl = settings.vendista_endpoint_negative_cache_ttl_seconds
+        assert started + ttl <= client._terminals_endpoint_expires <= time.monotonic() + ttl
+        assert ttl < settings.vendista_endpoint_cache_ttl_seconds
+
+    def test_pinned_endpoint_skips_discovery(self):
+        """settings.vendista_terminals_endpoint disables probing."""
+        calls = []
+        client = self._client(calls)
+
+        with patch("app.services.vendista_client.settings.vendista_terminals_endpoint", "/machines"):
+            result = asyncio.run(client.get_terminals())
+
+        assert result["success"] is True
+        assert calls == ["/machines"]
@@ -0,0 +1,393 @@
+"""
+Unit tests for Vendista sync service.
+"""
+import asyncio
+import threading
+import httpx
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+from sqlalchemy.orm import Session
+from app.services.vendista_sync import VendistaSyncService
+
+
+def _make_page(page_number, tx_ids, items_count=5, items_per_page=2):
+    return {
+        "items": [
+            {"id": tx_id, "term_id": 100, "time": "2026-01-15T10:00:00"}
+            for tx_id in tx_ids
+        ],
+        "page_number": page_number,
+        "items_count": items_count,
+        "items_per_page": items_per_page,
+        "total_pages": 3,
+    }
+
+
+def _pages_iterator(pages, fail_after=None):
+    async def _iter(**kwargs):
+        for index, page in enumerate(pages):
+            if fail_after is not None and index >= fail_after:
+                raise RuntimeError("Vendista API page failed")
+            yield page
+    return _iter
+
+
+class TestSyncAllFromVendista:
+    """Test cases for streaming ingestion."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.db = MagicMock(spec=Session)
+        # INSERT ... RETURNING id yields two new rows per batch
+        self.db.execute.return_value.scalars.return_value.all.return_value = [1, 2]
+        self.service = VendistaSyncService()
+
+    def test_commits_each_batch(self):
+        """Each batch of pages is upserted and committed separately."""
+        pages = [_make_page(1, [1, 2]), _make_page(2, [3, 4]), _make_page(3, [5])]
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client, \
+             patch('app.crud.vendista.advance_sync_states') as mock_advance, \
+             patch('app.crud.vendista.upsert_terminals', return_value=(0, 0)) as mock_terminals:
+            mock_client.iter_transaction_pages = _pages_iterator(pages)
+            result = asyncio.run(self.service.sync_all_from_vendista(self.db, commit_every_pages=1))
+
+        assert result.success is True
+        assert result.fetched == 5
+        assert result.pages_fetched == 3
+        assert result.last_page == 3
+        assert result.expected_total == 5
+        assert self.db.execute.call_count == 3
+        # Terminals of every batch are upserted in the same transaction
+        assert mock_terminals.call_count == 3
+        # Newest-first sync advances the watermark once, after the last batch
+        mock_advance.assert_called_once()
+        assert self.db.commit.call_count == 4
+
+    def test_batches_are_written_off_the_event_loop(self):
+        """Blocking batch writes run in a worker thread, not on the loop thread."""
+        pages = [_make_page(1, [1, 2]), _make_page(2, [3, 4])]
+        threads = []
+
+        def upsert_batch(db, rows, watermarks=None, advance_global=True):
+            threads.append(threading.current_thread())
+            return len(rows), 0
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client, \
+             patch.object(self.service, '_upsert_tx_batch', side_effect=upsert_batch):
+            mock_client.iter_transaction_pages = _pages_iterator(pages)
+            result = asyncio.run(self.service.sync_all_from_vendista(self.db, commit_every_pages=1))
+
+        assert result.inserted == 4
+        assert threads and threading.main_thread() not in threads
+
+    def test_derives_facts_for_inserted_rows(self):
+        """tx_fact rows are derived for newly inserted transactions before commit."""
+        pages = [_make_page(1, [1, 2])]
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client, \
+             patch('app.services.vendista_sync.TxFactService') as mock_facts:
+            mock_client.iter_transaction_pages = _pages_iterator(pages)
+            asyncio.run(self.service.sync_all_from_vendista(self.db))
+
+        mock_facts.return_value.refresh_transactions.assert_called_once_with([1, 2])
+
+    def test_deduplicates_within_batch(self):
+        """Duplicates inside one batch are skipped client-side."""
+        pages = [_make_page(1, [1, 2]), _make_page(2, [2, 3])]
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client:
+            mock_client.iter_transaction_pages = _pages_iterator(pages)
+            result = asyncio.run(self.service.sync_all_from_vendista(self.db, commit_every_pages=10))
+
+        assert result.success is True
+        assert result.skipped_duplicates == 1
+        assert self.db.commit.call_count == 1
+
+    def test_failure_keeps_committed_checkpoint(self):
+        """A failure reports the last committed page so the sync can resume."""
+        pages = [_make_page(1, [1, 2]), _make_page(2, [3, 4]), _make_page(3, [5])]
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client:
+            mock_client.iter_transaction_pages = _pages_iterator(pages, fail_after=2)
+            result = asyncio.run(self.service.sync_all_from_vendista(self.db, commit_every_pages=1))
+
+        assert result.success is False
+        assert result.last_page == 2
+        assert result.inserted == 4
+        assert "page failed" in result.error_message
+        self.db.rollback.assert_called_once()
+
+    def test_resumes_after_last_received_page(self):
+        """A page that still fails after its retries is refetched without restarting the window."""
+        pages = {n: _make_page(n, [2 * n - 1, 2 * n]) for n in (1, 2, 3)}
+        starts = []
+
+        async def iter_pages(start_page, **kwargs):
+            starts.append(start_page)
+            for number in range(start_page, 4):
+                if number == 3 and len(starts) == 1:
+                    raise httpx.ConnectError("connection reset")
+                yield pages[number]
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client, \
+             patch('app.crud.vendista.advance_sync_states'):
+            mock_client.iter_transaction_pages = iter_pages
+            result = asyncio.run(self.service.sync_all_from_vendista(self.db, commit_every_pages=10))
+
+        assert result.success is True
+        assert starts == [1, 3]
+        assert result.pages_fetched == 3
+        assert result.last_page == 3
+        # Pages 1-2 are committed before resuming, page 3 with the final batch
+        assert self.db.commit.call_count == 2
+
+    def test_client_error_is_not_resumed(self):
+        """A non-retryable 4xx fails the run at once."""
+        request = httpx.Request("GET", "http://vendista.test/transactions")
+        error = httpx.HTTPStatusError("forbidden", request=request, response=httpx.Response(403, request=request))
+        starts = []
+
+        async def iter_pages(start_page, **kwargs):
+            starts.append(start_page)
+            yield _make_page(1, [1, 2])
+            raise error
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client:
+            mock_client.iter_transaction_pages = iter_pages
+            result = asyncio.run(self.service.sync_all_from_vendista(self.db, commit_every_pages=10))
+
+        assert result.success is False
+        assert starts == [1]
+        assert result.last_page == 0
+
+
+class TestPrepareTxRow:
+    """Test cases for typed column extraction at ingest."""
+
+    def test_extracts_typed_columns(self):
+        """Hot payload fields are written into typed columns."""
+        tx = {
+            "id": 1,
+            "term_id": 100,
+            "time": "2026-01-15T10:00:00",
+            "sum": 15000,
+            "status": 0,
+            "terminal_comment": "Островского Терм#1",
+            "machine_item": [{"machine_item_id": "7"}],
+        }
+
+        row = VendistaSyncService()._prepare_tx_row(tx)
+
+        assert row["sum_kopecks"] == 15000
+        assert row["machine_item_id"] == 7
+        assert row["status"] == "0"
+        assert row["terminal_comment"] == "Островского Терм#1"
+        assert row["payload"] is tx
+
+    def test_missing_fields_are_null(self):
+        """Transactions without sum or machine item keep NULL columns."""
+        row = VendistaSyncService()._prepare_tx_row(
+            {"id": 1, "term_id": 100, "time": "2026-01-15T10:00:00", "machine_item": []}
+        )
+
+        assert row["sum_kopecks"] is None
+        assert row["machine_item_id"] is None
+
+
+class TestSyncIncremental:
+    """Test cases for watermark-driven incremental sync."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.db = MagicMock(spec=Session)
+        self.db.execute.return_value = MagicMock(rowcount=1)
+        self.service = VendistaSyncService()
+
+    def test_window_starts_at_watermark_minus_overlap(self):
+        """Incremental sync requests oldest-first pages from the watermark."""
+        captured = {}
+
+        async def fake_iter(**kwargs):
+            captured.update(kwargs)
+            yield _make_page(1, [1], items_count=1)
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client, \
+             patch('app.crud.vendista.get_sync_watermark', return_value=datetime(2026, 1, 15, 12, 0, 0)), \
+             patch('app.crud.vendista.advance_sync_states') as mock_advance:
+            mock_client.iter_transaction_pages = fake_iter
+            result = asyncio.run(self.service.sync_incremental(self.db, overlap_minutes=10))
+
+        assert result.success is True
+        assert captured["date_from"] == "2026-01-15 11:50:00"
+        assert captured["order_desc"] is False
+        watermarks = mock_advance.call_args[0][1]
+        assert watermarks[100][1] == 1
+        assert mock_advance.call_args.kwargs["advance_global"] is True
+
+    def test_watermark_advances_with_each_batch(self):
+        """Every committed batch carries the watermarks of its own rows."""
+        pages = [_make_page(1, [1, 2]), _make_page(2, [3])]
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client, \
+             patch('app.crud.vendista.get_sync_watermark', return_value=None), \
+             patch('app.crud.vendista.advance_sync_states') as mock_advance:
+            mock_client.iter_transaction_pages = _pages_iterator(pages)
+            asyncio.run(self.service.sync_incremental(self.db, commit_every_pages=1))
+
+        assert mock_advance.call_count == 2
+        assert self.db.commit.call_count == 2
+
+    def test_term_filter_drops_other_terminals(self):
+        """Only the requested terminals are written."""
+        page = _make_page(1, [1, 2], items_count=2)
+        page["items"][1]["term_id"] = 200
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client, \
+             patch('app.crud.vendista.get_sync_watermark', return_value=None), \
+             patch('app.crud.vendista.advance_sync_states') as mock_advance:
+            mock_client.iter_transaction_pages = _pages_iterator([page])
+            asyncio.run(self.service.sync_incremental(self.db, term_ids=[200]))
+
+        assert list(mock_advance.call_args[0][1].keys()) == [200]
+        # The other terminals were not synced: the fleet-wide watermark stays
+        assert mock_advance.call_args.kwargs["advance_global"] is False
+
+    def test_filtered_run_leaves_global_watermark_unchanged(self):
+        """advance_global=False writes only the per-terminal sync_state rows."""
+        from sqlalchemy.dialects import postgresql
+        from app.crud.vendista import advance_sync_states, GLOBAL_SYNC_STATE_TERM_ID
+
+        advance_sync_states(self.db, {200: (datetime(2026, 1, 15, 10, 0, 0), 5)}, advance_global=False)
+
+        stmt = self.db.execute.call_args[0][0]
+        params = stmt.compile(dialect=postgresql.dialect()).params
+        term_ids = [value for key, value in params.items() if key.startswith("term_id")]
+        assert term_ids == [200]
+        assert GLOBAL_SYNC_STATE_TERM_ID not in term_ids
+
+
+class TestTerminalUpsert:
+    """Test cases for the bulk terminal sync."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.db = MagicMock(spec=Session)
+        self.service = VendistaSyncService()
+
+    def test_api_sync_upserts_only_changed_terminals(self):
+        """Existing terminals are loaded once; unchanged ones are not written."""
+        api_terminals = [
+            {"id": 1, "comment": "Островского Терм#1", "title": "T1"},
+            {"id": 2, "comment": "Новый коммент", "title": None},
+            {"id": 3, "comment": "Новый терминал"},
+        ]
+        seen_at = datetime(2026, 1, 10, tzinfo=timezone.utc)
+        existing = {
+            1: MagicMock(id=1, title="T1", comment="Островского Терм#1", comment_tx_time=seen_at, is_active=True),
+            2: MagicMock(id=2, title="T2", comment="Старый коммент", comment_tx_time=seen_at, is_active=True),
+        }
+
+        with patch('app.services.vendista_sync.vendista_client') as mock_client, \
+             patch('app.crud.vendista.get_terminals_by_ids', return_value=existing) as mock_get, \
+             patch('app.crud.vendista.upsert_terminals', return_value=(1, 1)) as mock_upsert:
+            async def get_terminals():
+                return {"success": True, "terminals": api_terminals}
+            mock_client.get_terminals = get_terminals
+            result = asyncio.run(self.service.sync_terminals_from_api(self.db))
+
+        mock_get.assert_called_once()
+        rows = mock_upsert.call_args[0][1]
+        # API comments are current: stamped with the sync time
+        assert all(row.pop("comment_tx_time") > seen_at for row in rows)
+        assert rows == [
+            {"id": 2, "title": "T2", "comment": "Новый коммент", "is_active": True},
+            {"id": 3, "title": None, "comment": "Новый терминал", "is_active": True},
+        ]
+        assert result["synced_count"] == 3
+        assert result["created_count"] == 1
+        assert result["updated_count"] == 1
+        self.db.commit.assert_called_once()
+
+    def test_upsert_statement_detects_changes(self):
+        """The upsert skips unchanged rows and reports inserts via xmax."""
+        from sqlalchemy.dialects import postgresql
+        from app.crud.vendista import upsert_terminals
+
+        self.db.execute.return_value.all.return_value = [
+            MagicMock(id=1, inserted=True), MagicMock(id=2, inserted=False)
+        ]
+        created, updated = upsert_terminals(self.db, [
+            {"id": 1, "title": None, "comment": "a", "comment_tx_time": None, "is_active": True},
+            {"id": 2, "title": None, "comment": "b", "comment_tx_time": None, "is_active": True},
+        ])
+
+        sql = str(self.db.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+        assert "ON CONFLICT (id) DO UPDATE" in sql
+        assert "IS DISTINCT FROM" in sql
+        assert "xmax = 0" in sql
+        assert (created, updated) == (1, 1)
+
+    def test_batch_terminals_take_latest_comment(self):
+        """Ingest upserts batch terminals with their latest non-empty comment."""
+        rows = [
+            {"term_id": 100, "tx_time": datetime(2026, 1, 15, 10), "terminal_comment": "Старый",
+             "payload": {"terminal_id": "T-100"}},
+            {"term_id": 100, "tx_time": datetime(2026, 1, 15, 12), "terminal_comment": "Новый", "payload": {}},
+            {"term_id": 100, "tx_time": datetime(2026, 1, 15, 13), "terminal_comment": None, "payload": {}},
+            {"term_id": 200, "tx_time": datetime(2026, 1, 15, 11), "terminal_comment": None, "payload": {}},
+        ]
+        existing = {200: MagicMock(id=200, title="T-200", comment="Островского", comment_tx_time=None, is_active=False)}
+
+        with patch('app.crud.vendista.get_terminals_by_ids', return_value=existing), \
+             patch('app.crud.vendista.upsert_terminals', return_value=(1, 0)) as mock_upsert:
+            self.service._upsert_batch_terminals(self.db, rows)
+
+        # Terminal 200 is unchanged and not written
+        assert mock_upsert.call_args[0][1] == [
+            {"id": 100, "title": "T-100", "comment": "Новый",
+             "comment_tx_time": datetime(2026, 1, 15, 12, tzinfo=timezone.utc), "is_active": True},
+        ]
+
+    def test_newest_first_batches_keep_newest_comment(self):
+        """A later batch with older transactions does not roll the comment back."""
+        stored = {}
+
+        def upsert(db, rows):
+            for row in rows:
+                stored[row["id"]] = MagicMock(**row)
+            return 0, len(rows)
+
+        # Full sync pages newest-first: the second batch holds older rows
+        batches = [
+            [{"term_id": 100, "tx_time": datetime(2026, 1, 15, 12), "terminal_comment": "Новый", "payload": {}}],
+            [{"term_id": 100, "tx_time": datetime(2026, 1, 10, 9), "terminal_comment": "Старый", "payload": {}}],
+        ]
+        with patch('app.crud.vendista.get_terminals_by_ids', side_effect=lambda db, ids: dict(stored)), \
+             patch('app.crud.vendista.upsert_terminals', side_effect=upsert) as mock_upsert:
+            for batch in batches:
+                self.service._upsert_batch_terminals(self.db, batch)
+
+        assert stored[100].comment == "Новый"
+        assert stored[100].comment_tx_time == datetime(2026, 1, 15, 12, tzinfo=timezone.utc)
+        # The older batch changes nothing and writes nothing
+        assert mock_upsert.call_args[0][1] == []
+
+    def test_transactions_sync_walks_terminals_by_index(self):
+        """Terminal sync from transactions visits distinct terminals instead of a raw id range."""
+        self.db.execute.return_value.fetchall.return_value = [
+            MagicMock(term_id=100, terminal_comment="Островского Терм#1", terminal_id="T-100",
+                      comment_tx_time=datetime(2026, 1, 15, 12, tzinfo=timezone.utc)),
+            MagicMock(term_id=200, terminal_comment=None, terminal_id="T-200", comment_tx_time=None),
+        ]
+
+        with patch('app.crud.vendista.get_terminals_by_ids', return_value={}), \
+             patch('app.crud.vendista.upsert_terminals', return_value=(2, 0)) as mock_upsert:
+            result = self.service.sync_terminals_from_transactions(self.db)
+
+        query = str(self.db.execute.call_args_list[0][0][0])
+        assert "WITH RECURSIVE terms" in query
+        assert "sync_state" not in query
+        assert [row["comment"] for row in mock_upsert.call_args[0][1]] == ["Островского Терм#1", None]
+        assert result["created_count"] == 2
+        self.db.commit.assert_called_once()
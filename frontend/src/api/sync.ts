@@ -26,6 +26,20 @@ export interface SyncRun {
   last_page: number | null;
   ok: boolean | null;
   message: string | null;
+  status: 'running' | 'success' | 'error' | null;
+  mode: 'full' | 'incremental' | null;
+  trigger: 'manual' | 'rerun' | 'schedule' | null;
+}
+
+// Response of POST /sync/sync and /sync/runs/{id}/rerun (sync runs in background)
+export interface SyncStarted {
+  ok: boolean;
+  run_id: number;
+  status: 'running';
+  mode: 'full' | 'incremental';
+  period_start: string | null;
+  period_end: string | null;
+  message: string;
 }
 
 export interface VendistaTerminal {
@@ -46,8 +60,8 @@ export interface VendistaTransaction {
 }
 
 // Trigger manual sync
-export const triggerSync = (params?: { terminal_id?: number; force?: boolean }) =>
-  apiClient.post<{ message: string; synced_count: number }>('/sync/sync', null, { params });
+export const triggerSync = (params?: { mode?: 'full' | 'incremental' }) =>
+  apiClient.post<SyncStarted>('/sync/sync', null, { params });
 
 // Get sync status
 export const getSyncStatus = (terminalId?: number) =>
@@ -85,20 +99,32 @@ export const getSyncRuns = async (params?: {
 
 // Rerun a specific sync run
 export const rerunSync = (runId: number) =>
-  apiClient.post<{
-    ok: boolean;
-    started_at: string;
-    completed_at: string;
-    duration_seconds: number;
-    fetched: number;
-    inserted: number;
-    skipped_duplicates: number;
-    expected_total: number;
-    items_per_page: number;
-    pages_fetched: number;
-    last_page: number;
-    message: string;
-  }>(`/sync/runs/${runId}/rerun`);
+  apiClient.post<SyncStarted>(`/sync/runs/${runId}/rerun`);
+
+// Get a single sync run (poll background sync status)
+export const getSyncRun = async (runId: number) => {
+  const response = await apiClient.get<SyncRun>(`/sync/runs/${runId}`);
+  return response.data;
+};
+
+// Poll a background sync run until it finishes (gives up after timeoutMs)
+export const waitForSyncRun = async (
+  runId: number,
+  intervalMs = 2000,
+  timeoutMs = 30 * 60 * 1000,
+): Promise<SyncRun> => {
+  const deadline = Date.now() + timeoutMs;
+  for (;;) {
+    const run = await getSyncRun(runId);
+    if (run.status !== 'running') {
+      return run;
+    }
+    if (Date.now() >= deadline) {
+      throw new Error(`Синхронизация #${runId} не завершилась за отведённое время`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
 
 // Sync health check
 export const checkSyncHealth = () =>
@@ -110,21 +136,8 @@ export const triggerSyncWithPeriod = (params: {
   period_end?: string;
   items_per_page?: number;
   order_desc?: boolean;
-}) => apiClient.post<{
-  ok: boolean;
-  started_at: string;
-  completed_at: string;
-  duration_seconds: number;
-  fetched: number;
-  inserted: number;
-  skipped_duplicates: number;
-  expected_total: number;
-  items_per_page: number;
-  pages_fetched: number;
-  last_page: number;
-  transactions_synced: number;
-  message: string;
-}>('/sync/sync', null, { params });
+  mode?: 'full' | 'incremental';
+}) => apiClient.post<SyncStarted>('/sync/sync', null, { params });
 
 // Sync terminals from transactions
 export interface TerminalSyncResult {
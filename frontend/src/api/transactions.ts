@@ -16,10 +16,12 @@ export interface Transaction {
 
 export interface TransactionsResponse {
   items: Transaction[];
-  page: number;
+  page: number | null;           // null в режиме cursor
   page_size: number;
-  total: number;
-  total_pages: number;
+  total: number | null;          // в режиме cursor только при include_total (кэшируется)
+  total_pages: number | null;
+  has_more: boolean;
+  next_cursor: string | null;    // передать как cursor для следующей страницы
 }
 
 export const transactionsApi = {
@@ -30,6 +32,9 @@ export const transactionsApi = {
     sum_type?: 'all' | 'positive' | 'non_positive';
     page?: number;
     page_size?: number;
+    pagination?: 'offset' | 'cursor';
+    cursor?: string | null;
+    include_total?: boolean;
   }): Promise<TransactionsResponse> => {
     const queryParams = new URLSearchParams();
     if (params.date_from) queryParams.append('date_from', params.date_from);
@@ -38,6 +43,9 @@ export const transactionsApi = {
     if (params.sum_type) queryParams.append('sum_type', params.sum_type);
     if (params.page) queryParams.append('page', String(params.page));
     if (params.page_size) queryParams.append('page_size', String(params.page_size));
+    if (params.pagination) queryParams.append('pagination', params.pagination);
+    if (params.cursor) queryParams.append('cursor', params.cursor);
+    if (params.include_total) queryParams.append('include_total', 'true');
     
     // Добавляем trailing slash чтобы избежать редиректа
     const response = await apiClient.get<TransactionsResponse>(`/transactions/?${queryParams.toString()}`);
@@ -4,7 +4,7 @@ import { DollarOutlined, CreditCardOutlined, ShoppingOutlined, LineChartOutlined
 import { LineChart, Line, BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip as RechartsTooltip, Legend, ResponsiveContainer, PieChart, Pie, Cell } from 'recharts';
 import apiClient from '../api/client';
 import { getOwnerReport, getDailySales } from '../api/analytics';
-import { getTerminals, VendistaTerminal } from '../api/sync';
+import { getTerminals, triggerSync, waitForSyncRun, VendistaTerminal } from '../api/sync';
 import dayjs, { Dayjs } from 'dayjs';
 
 const { Paragraph, Title, Text } = Typography;
@@ -237,11 +237,11 @@ export default function OwnerReportPage() {
       onOk: async () => {
         setSyncLoading(true);
         try {
-          const res = await apiClient.post('/sync/sync');
-          const { ok, transactions_synced, message: msg } = res.data;
+          const { data } = await triggerSync();
+          const { ok, inserted, message: msg } = await waitForSyncRun(data.run_id);
 
           if (ok) {
-            message.success(`✅ Синхронизировано ${transactions_synced} транзакций`);
+            message.success(`✅ Синхронизировано ${inserted} транзакций`);
             await loadReport();
             await loadDailyData();
           } else {
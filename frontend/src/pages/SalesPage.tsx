@@ -21,9 +21,9 @@ const SalesPage = () => {
   const [transactions, setTransactions] = useState<Transaction[]>([]);
   const [transactionsLoading, setTransactionsLoading] = useState(false);
   const [exporting, setExporting] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [total, setTotal] = useState(0);
-  const [totalPages, setTotalPages] = useState(0);
-  const [page, setPage] = useState(1);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [pageSize] = useState(50);
   const [dateFrom, setDateFrom] = useState<Dayjs>(dayjs().startOf('month'));
   const [dateTo, setDateTo] = useState<Dayjs>(dayjs());
@@ -56,25 +56,29 @@ const SalesPage = () => {
     }
   };
 
-  const fetchTransactions = async (currentPage: number = page) => {
-    setTransactionsLoading(true);
+  // Keyset-пагинация: без cursor — первая страница (с общим количеством),
+  // с cursor — следующая порция дописывается к уже загруженным
+  const fetchTransactions = async (cursor: string | null = null) => {
+    const setBusy = cursor ? setLoadingMore : setTransactionsLoading;
+    setBusy(true);
     try {
       const data = await transactionsApi.getTransactions({
         date_from: dateFrom.format('YYYY-MM-DD'),
         date_to: dateTo.format('YYYY-MM-DD'),
         sum_type: sumType,
         term_id: termIdFilter,
-        page: currentPage,
         page_size: pageSize,
+        pagination: 'cursor',
+        cursor,
+        include_total: !cursor,
       });
-      setTransactions(data.items);
-      setTotal(data.total);
-      setTotalPages(data.total_pages);
-      setPage(data.page);
+      setTransactions(cursor ? (prev) => [...prev, ...data.items] : data.items);
+      if (!cursor) setTotal(data.total ?? 0);
+      setNextCursor(data.next_cursor);
     } catch (error: any) {
       message.error(error.response?.data?.detail || 'Ошибка загрузки транзакций');
     } finally {
-      setTransactionsLoading(false);
+      setBusy(false);
     }
   };
 
@@ -109,7 +113,7 @@ const SalesPage = () => {
   useEffect(() => {
     fetchTerminals();
     fetchVendistaTerminals();
-    fetchTransactions(1);
+    fetchTransactions();
   }, []);
 
   const columns = [
@@ -198,7 +202,7 @@ const SalesPage = () => {
                 const today = dayjs();
                 setDateFrom(today);
                 setDateTo(today);
-                fetchTransactions(1);
+                fetchTransactions();
               }}
             >
               Сегодня
@@ -209,7 +213,7 @@ const SalesPage = () => {
                 const weekStart = today.startOf('week');
                 setDateFrom(weekStart);
                 setDateTo(today);
-                fetchTransactions(1);
+                fetchTransactions();
               }}
             >
               Неделя
@@ -242,7 +246,7 @@ const SalesPage = () => {
             <Button
               type="primary"
               icon={<SyncOutlined />}
-              onClick={() => fetchTransactions(1)}
+              onClick={() => fetchTransactions()}
               loading={transactionsLoading}
             >
               Обновить
@@ -258,7 +262,7 @@ const SalesPage = () => {
           </Space>
           <Text type="secondary">
             Найдено: {total} {total % 10 === 1 && total % 100 !== 11 ? 'транзакция' : 'транзакций'}
-            {totalPages > 1 && ` (стр. ${page}/${totalPages})`}
+            {transactions.length < total && ` (показано ${transactions.length})`}
           </Text>
         </Space>
 
@@ -267,20 +271,22 @@ const SalesPage = () => {
             <Spin size="large" />
           </div>
         ) : transactions.length > 0 ? (
-          <Table
-            dataSource={transactions}
-            columns={transactionColumns}
-            rowKey="id"
-            pagination={{
-              current: page,
-              pageSize: pageSize,
-              total: total,
-              showTotal: (total) => `Всего: ${total}`,
-              onChange: (newPage) => fetchTransactions(newPage),
-
-            }}
-            scroll={{ x: 1000 }}
-          />
+          <>
+            <Table
+              dataSource={transactions}
+              columns={transactionColumns}
+              rowKey="id"
+              pagination={false}
+              scroll={{ x: 1000 }}
+            />
+            {nextCursor && (
+              <div style={{ textAlign: 'center', marginTop: 16 }}>
+                <Button onClick={() => fetchTransactions(nextCursor)} loading={loadingMore}>
+                  Показать ещё
+                </Button>
+              </div>
+            )}
+          </>
         ) : (
           <Empty description="Нет транзакций за выбранный период." />
         )}
@@ -1,7 +1,7 @@
 import { useEffect, useState } from 'react';
 import { Card, Typography, Table, Button, Empty, message, Spin, Tag, DatePicker, Space, Popconfirm, List, Badge } from 'antd';
 import { SyncOutlined, CheckCircleOutlined, CloseCircleOutlined, RedoOutlined, DatabaseOutlined, ReloadOutlined } from '@ant-design/icons';
-import { getSyncRuns, checkSyncHealth, triggerSyncWithPeriod, rerunSync, syncTerminals, getTerminals, SyncRun, VendistaTerminal } from '../api/sync';
+import { getSyncRuns, checkSyncHealth, triggerSyncWithPeriod, rerunSync, waitForSyncRun, syncTerminals, getTerminals, SyncRun, VendistaTerminal } from '../api/sync';
 import dayjs, { Dayjs } from 'dayjs';
 
 const { Title, Text } = Typography;
@@ -57,10 +57,16 @@ const SettingsPage = () => {
         period_start: dateFrom ? dateFrom.format('YYYY-MM-DD') : undefined,
         period_end: dateTo ? dateTo.format('YYYY-MM-DD') : undefined,
       });
-      message.success(`Синхронизация завершена: ${data.inserted} новых записей`);
+      fetchRuns();
+      const run = await waitForSyncRun(data.run_id);
+      if (run.ok) {
+        message.success(`Синхронизация завершена: ${run.inserted} новых записей`);
+      } else {
+        message.error(run.message || 'Ошибка синхронизации');
+      }
       fetchRuns();
     } catch (error: any) {
-      message.error(error.response?.data?.detail || 'Ошибка синхронизации');
+      message.error(error.response?.data?.detail || error.message || 'Ошибка синхронизации');
     } finally {
       setSyncing(false);
     }
@@ -70,10 +76,16 @@ const SettingsPage = () => {
     setRerunningId(runId);
     try {
       const { data } = await rerunSync(runId);
-      message.success(`Переза пуск завершен: ${data.inserted} записей`);
+      fetchRuns();
+      const run = await waitForSyncRun(data.run_id);
+      if (run.ok) {
+        message.success(`Переза пуск завершен: ${run.inserted} записей`);
+      } else {
+        message.error(run.message || 'Ошибка перезапуска');
+      }
       fetchRuns();
     } catch (error: any) {
-      message.error(error.response?.data?.detail || 'Ошибка перезапуска');
+      message.error(error.response?.data?.detail || error.message || 'Ошибка перезапуска');
     } finally {
       setRerunningId(null);
     }
@@ -174,7 +186,10 @@ const SettingsPage = () => {
       title: 'Статус',
       dataIndex: 'ok',
       key: 'ok',
-      render: (value: boolean | null) => {
+      render: (value: boolean | null, record: SyncRun) => {
+        if (record.status === 'running') {
+          return <Tag color="processing" icon={<SyncOutlined spin />}>RUN</Tag>;
+        }
         if (value === null) return '-';
         return value ? (
           <Tag color="success" icon={<CheckCircleOutlined />}>OK</Tag>